@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import db
+
+# Measurement trends for the "Mediciones" page. Rolling averages, deltas and
+# change since the first visit come from SQLite window functions in a single
+# query per client; per-week rates are derived with vectorized pandas.
+
+TREND_METRICS = {
+    "weight_kg": "Peso (kg)",
+    "body_fat_pct": "% Grasa",
+    "muscle_pct": "% Músculo",
+    "waist_cm": "Cintura (cm)",
+}
+ROLLING_DAYS = 28  # "4 semanas"
+MAX_CHART_POINTS = 200
+
+def _trend_sql() -> str:
+    cols = []
+    for m in TREND_METRICS:
+        cols += [
+            m,
+            f"AVG({m}) OVER rolling AS {m}_avg_4w",
+            f"{m} - LAG({m}) OVER history AS {m}_delta",
+            f"{m} - FIRST_VALUE({m}) OVER history AS {m}_since_first",
+        ]
+    return (
+        "SELECT date, "
+        "julianday(date) - julianday(LAG(date) OVER history) AS days_since_prev, "
+        "julianday(date) - julianday(FIRST_VALUE(date) OVER history) AS days_since_first, "
+        + ", ".join(cols) + " "
+        "FROM measurements WHERE client_id = ? "
+        "WINDOW history AS (ORDER BY date, id), "
+        f"rolling AS (ORDER BY julianday(date) RANGE BETWEEN {ROLLING_DAYS - 1} PRECEDING AND CURRENT ROW) "
+        "ORDER BY date, id"
+    )
+
+_SQL_TRENDS = _trend_sql()
+db.register_read_query("measurement_trends", _SQL_TRENDS, (1,), db.SEARCH_SORT)
+
+def measurement_trends(client_id: int) -> pd.DataFrame:
+    # One row per measurement, oldest first, with for every metric m:
+    # m, m_avg_4w, m_delta (vs previous), m_weekly (delta per 7 days),
+    # m_since_first and m_rate_per_week (since the first visit).
+    df = db.read_df_cached("measurement_trends", client_id, [("measurements", client_id)],
+                           _SQL_TRENDS, (client_id,))
+    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    prev_weeks = df["days_since_prev"].where(df["days_since_prev"] > 0) / 7
+    first_weeks = df["days_since_first"].where(df["days_since_first"] > 0) / 7
+    for m in TREND_METRICS:
+        df[f"{m}_weekly"] = df[f"{m}_delta"] / prev_weeks
+        df[f"{m}_rate_per_week"] = df[f"{m}_since_first"] / first_weeks
+    return df
+
+def lttb(x, y, n_out: int):
+    # Largest-Triangle-Three-Buckets downsampling: keeps the points that
+    # preserve the visual shape of the line. Returns indices into x/y.
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_lo, nxt_hi = edges[i + 1], (edges[i + 2] if i + 2 < len(edges) else n)
+        avg_x = x[nxt_lo:nxt_hi].mean()
+        avg_y = y[nxt_lo:nxt_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+def chart_frame(trends: pd.DataFrame, metric: str, max_points: int = MAX_CHART_POINTS) -> pd.DataFrame:
+    # Value and 4-week average for one metric, indexed by date, downsampled
+    # so long histories send at most max_points points to the browser.
+    df = trends[["date", metric, f"{metric}_avg_4w"]].dropna(subset=["date", metric])
+    if len(df) > max_points:
+        x = df["date"].map(pd.Timestamp.toordinal).to_numpy()
+        df = df.iloc[lttb(x, df[metric].to_numpy(), max_points)]
+    df = df.rename(columns={metric: TREND_METRICS[metric], f"{metric}_avg_4w": "Media 4 semanas"})
+    return df.set_index("date")
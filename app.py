@@ -1,28 +1,215 @@
 
+import perf
+_rerun_t0 = perf.rerun_started()
+
+import os
+import tempfile
+from io import BytesIO
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-from db import init_db, list_clients, create_client, update_client, delete_client, \
-               add_measurement, get_measurements, add_meal_plan, list_meal_plans, \
-               add_training_plan, list_training_plans, get_client_by_id
+from db import init_db, create_client, update_client, delete_client, \
+               add_measurement, get_measurements, add_meal_plan, list_meal_plans, list_meal_items, \
+               latest_meal_plan, add_training_plan, list_training_plans, get_client_by_id, \
+               client_directory, count_clients, list_clients_page, CLIENT_COLUMNS, cache_stats, \
+               client_ids, roster_overview, objective_progress, stale_clients, ACTIVE_DAYS, \
+               list_tenants, create_tenant, set_tenant, DEFAULT_TENANT, PROGRESS_MIN_DAYS
 from gs_preset import mifflin_st_jeor, build_gs_meal_plan
-from pdf_utils import build_client_pdf
+from foods import solve_meal_items
+from analytics import TREND_METRICS, measurement_trends, chart_frame
+from similarity import similar_clients, suggested_calories
+import jobs
 
 st.set_page_config(page_title="GS — Registro de clientes", page_icon="💪", layout="wide")
 
-# Initialize DB
-init_db()
+# Tenant (coach/gym): each one has its own database file. The choice is per
+# session and must be set on every rerun, before any db call.
+def _create_tenant():
+    name = st.session_state.get("new_tenant", "").strip().lower()
+    try:
+        create_tenant(name)
+    except ValueError as e:
+        st.session_state["tenant_error"] = str(e)
+        return
+    st.session_state["tenant"] = name
+    st.session_state["new_tenant"] = ""
 
-# Sidebar
 st.sidebar.title("GS — Panel")
-page = st.sidebar.radio("Navegación", ["Clientes", "Mediciones", "Planes", "Exportar PDF", "Ayuda"])
+_tenants = list_tenants()
+if _tenants:
+    _options = _tenants if DEFAULT_TENANT else [""] + _tenants
+    if st.session_state.get("tenant") not in _options:
+        st.session_state["tenant"] = DEFAULT_TENANT if DEFAULT_TENANT in _options else _options[0]
+    st.sidebar.selectbox("Gimnasio", _options, key="tenant", format_func=lambda t: t or "Principal")
+set_tenant(st.session_state.get("tenant") or None)
+with st.sidebar.expander("➕ Nuevo gimnasio"):
+    st.text_input("Nombre (minúsculas, sin espacios)", key="new_tenant")
+    st.button("Crear", on_click=_create_tenant)
+    if "tenant_error" in st.session_state:
+        st.error(st.session_state.pop("tenant_error"))
+
+# Initialize DB (only does work on the first run of the process per database)
+init_db()
+
+page = st.sidebar.radio("Navegación", ["Clientes", "Resumen", "Mediciones", "Planes", "Exportar PDF", "Ayuda"])
 st.sidebar.caption("Hecho para Galaxy Tab • Streamlit")
+perf.mark("arranque")
+
+SELECTOR_PAGE = 100
 
-def _id_selectbox(df, key):
-    if df.empty:
-        st.info("No hay clientes todavía.")
+def _directory_pages(search, pages: int):
+    # The first pages pages of (id, name) for a selector: newest first, or the
+    # ranked matches of search. Returns (pairs, whether there is another page).
+    directory, cursor = [], None
+    for _ in range(pages):
+        if search:
+            df, cursor = list_clients_page(["name"], cursor, SELECTOR_PAGE, search=search)
+            chunk = list(zip(df["id"].tolist(), df["name"].tolist()))
+        else:
+            chunk = client_directory(cursor, SELECTOR_PAGE)
+            cursor = chunk[-1][0] if len(chunk) == SELECTOR_PAGE else None
+        directory += chunk
+        if cursor is None:
+            break
+    return directory, cursor is not None
+
+def _client_picker(key):
+    # Client selector that only sends SELECTOR_PAGE names per page to the
+    # tablet, with a search box and «Cargar más» instead of the whole roster.
+    search = st.text_input("Buscar cliente", key=f"{key}_search").strip() or None
+    pages_key = f"{key}_pages"
+    if pages_key not in st.session_state or st.session_state[pages_key][0] != search:
+        st.session_state[pages_key] = (search, 1)
+    directory, more = _directory_pages(search, st.session_state[pages_key][1])
+    # Keep the current choice (e.g. picked from a search that was then
+    # cleared) when it falls outside the loaded pages.
+    selected = st.session_state.get(key)
+    if search is None and selected is not None and selected not in dict(directory):
+        client = get_client_by_id(int(selected))
+        if client is not None:
+            directory.append((client.id, client.name))
+    if not directory:
+        st.info("Ningún cliente coincide con la búsqueda." if search else "No hay clientes todavía.")
+        return None
+    names = dict(directory)
+    options = list(names)
+    cid = st.selectbox("Selecciona cliente por ID", options, key=key,
+                       index=options.index(selected) if selected in names else 0,
+                       format_func=lambda i: f"{i} — {names[i]}")
+    if more and st.button("Cargar más clientes", key=f"{key}_more"):
+        st.session_state[pages_key] = (search, st.session_state[pages_key][1] + 1)
+        st.rerun()
+    return cid
+
+# ---- Background jobs ----
+# Heavy work runs in jobs.py's worker pool; this session remembers its job
+# ids so the "Tareas" panel can show progress and downloads across reruns.
+
+def _submit_job(label, fn, *args, preload=(), **kwargs):
+    try:
+        job_id = jobs.submit(label, fn, *args, preload=preload, **kwargs)
+    except RuntimeError as e:
+        st.warning(str(e))
         return None
-    return st.selectbox("Selecciona cliente por ID", df["id"].tolist(), key=key)
+    st.session_state.setdefault("job_ids", []).append(job_id)
+    st.info(f"Tarea «{label}» en segundo plano. Sigue su avance en «Tareas» (barra lateral).")
+    return job_id
+
+def _pdf_job(job, client_id, include_meal, include_train):
+    from pdf_utils import render_client_pdf  # reportlab is only loaded when exporting
+    pdf = render_client_pdf(client_id, include_meal=include_meal, include_train=include_train)
+    return jobs.Download(f"FichaCliente_{client_id}.pdf", "application/pdf", data=pdf)
+
+def _report_job(job, client_id):
+    from pdf_utils import render_progress_report
+    pdf = render_progress_report(client_id)
+    return jobs.Download(f"ReporteProgreso_{client_id}.pdf", "application/pdf", data=pdf)
+
+def _zip_job(job, ids, include_meal, include_train):
+    from bulk_export import export_zip
+    # Leave a core for interactive reruns.
+    workers = max((os.cpu_count() or 2) - 1, 1)
+    with tempfile.NamedTemporaryFile(suffix=".zip", delete=False) as tmp:
+        export_zip(tmp, ids, include_meal=include_meal, include_train=include_train, workers=workers,
+                   progress=lambda done, total: job.report(done, total, f"{done}/{total} fichas"))
+    return jobs.Download("fichas_clientes.zip", "application/zip", path=tmp.name)
+
+def _import_job(job, kind, data, filename):
+    from importer import import_clients, import_measurements
+    run = import_clients if kind == "Clientes" else import_measurements
+    report = run(BytesIO(data), filename=filename, progress=lambda n: job.report(n, message=f"{n} filas leídas…"))
+    job.report(report["rows"], report["rows"],
+               f"{report['inserted']} fila(s) importadas, {report['rejected']} rechazadas.")
+    if not report["rejects"]:
+        return None
+    csv = pd.DataFrame(report["rejects"], columns=["fila", "motivo"]).to_csv(index=False)
+    return jobs.Download("rechazos.csv", "text/csv", data=csv.encode("utf-8"))
+
+def _roster_job(job, activity, objective, split):
+    from roster import recompute_roster_meal_plans
+    n = recompute_roster_meal_plans(activity, objective, split=split)
+    job.report(n, n, f"{n} planes guardados.")
+
+_JOB_STATUS = {jobs.QUEUED: "⏳ En cola", jobs.RUNNING: "⚙️ En curso", jobs.DONE: "✅ Lista", jobs.FAILED: "❌ Falló"}
+
+def _jobs_panel():
+    ids = st.session_state.get("job_ids")
+    if not ids:
+        return
+    polling = any(j.active for j in jobs.list_jobs(ids))
+
+    # Refreshes itself every second while something is running, then does one
+    # full rerun so the rest of the page sees the new data.
+    @st.fragment(run_every=1 if polling else None)
+    def panel():
+        recent = jobs.list_jobs(ids)[:10]
+        with st.expander("🗂️ Tareas", expanded=polling):
+            for job in recent:
+                st.write(f"**{job.label}** — {_JOB_STATUS[job.status]}")
+                if job.status == jobs.RUNNING and job.fraction is not None:
+                    st.progress(job.fraction)
+                if job.message:
+                    st.caption(job.message)
+                if job.error:
+                    st.error(job.error)
+                if job.status == jobs.DONE and isinstance(job.result, jobs.Download):
+                    st.download_button(f"Descargar {job.result.file_name}", job.result.read(),
+                                       file_name=job.result.file_name, mime=job.result.mime,
+                                       key=f"job_download_{job.id}")
+        if polling and not any(j.active for j in recent):
+            st.rerun()
+
+    with st.sidebar:
+        panel()
+
+DEFAULT_TABLE_COLUMNS = ["id", "name", "sex", "age", "weight_kg", "body_fat_pct", "occupation", "created_at"]
+SIMILAR_COLUMNS = {
+    "id": "ID", "name": "Nombre", "distance": "Distancia", "age": "Edad", "weight_kg": "Peso inicial (kg)",
+    "body_fat_pct": "% Grasa inicial", "objective": "Objetivo", "calories": "kcal", "kcal_per_kg": "kcal/kg",
+    "protein_g": "Proteína (g)", "fats_g": "Grasas (g)", "carbs_g": "Carbohidratos (g)", "weeks": "Semanas",
+    "fat_loss_pct_month": "% grasa perdido/mes", "weight_change_kg_month": "Cambio de peso (kg/mes)",
+}
+
+def _paged_clients_table(search):
+    # Only the visible page (and only the chosen columns) is sent to the browser.
+    c1, c2 = st.columns([3, 1])
+    columns = c1.multiselect("Columnas", CLIENT_COLUMNS, default=DEFAULT_TABLE_COLUMNS)
+    page_size = c2.selectbox("Por página", [25, 50, 100], index=0)
+    state_key = (search, tuple(columns), page_size)
+    if st.session_state.get("clients_page_key") != state_key:
+        st.session_state.clients_page_key = state_key
+        st.session_state.clients_cursors = [None]
+    cursors = st.session_state.clients_cursors
+    df, next_cursor = list_clients_page(columns, cursors[-1], page_size, search=search)
+    st.dataframe(df, use_container_width=True, hide_index=True)
+    n1, n2, n3 = st.columns([1, 1, 4])
+    if n1.button("◀ Anterior", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if n2.button("Siguiente ▶", disabled=next_cursor is None):
+        cursors.append(next_cursor)
+        st.rerun()
+    n3.caption(f"Página {len(cursors)}")
 
 # ---- Clientes ----
 if page == "Clientes":
@@ -65,62 +252,102 @@ if page == "Clientes":
                     )
                     st.success(f"Cliente creado (ID {new_id}).")
 
+    with st.expander("📥 Importar desde CSV / Excel"):
+        st.caption("Clientes: columna obligatoria `name`; `external_id` opcional para enlazar mediciones. "
+                   "Mediciones: `client_external_id` (o `client_id`) y `date` obligatorias.")
+        import_kind = st.radio("Tipo de archivo", ["Clientes", "Mediciones"], horizontal=True, key="import_kind")
+        upload = st.file_uploader("Archivo", type=["csv", "xlsx"], key="import_file")
+        if upload is not None and st.button("Importar"):
+            _submit_job(f"Importar {import_kind.lower()} ({upload.name})", _import_job,
+                        import_kind, upload.getvalue(), upload.name, preload=("importer", "openpyxl"))
+
+    perf.mark("clientes.alta")
     st.divider()
     st.write("🔎 Buscar")
-    q = st.text_input("Nombre / ocupación / notas")
-    df = list_clients(search=q.strip() or None)
-    st.caption(f"{len(df)} cliente(s)")
-    st.dataframe(df, use_container_width=True, hide_index=True)
+    q = st.text_input("Nombre / ocupación / notas / alimentos / alergias")
+    st.caption(f"{count_clients()} cliente(s) en total")
+    _paged_clients_table(q.strip() or None)
 
+    perf.mark("clientes.lista")
     st.write("✏️ Editar / 🗑️ Eliminar")
-    if len(df):
-        cid = _id_selectbox(df, key="cid_edit")
-        if cid:
-            row = df[df.id == cid].iloc[0]
-            with st.form("edit_client"):
-                ec1, ec2, ec3, ec4 = st.columns([2,1,1,1])
-                name = ec1.text_input("Nombre", row["name"])
-                sex = ec2.selectbox("Sexo", ["F","M","Otro"], index=["F","M","Otro"].index(row["sex"]) if row["sex"] in ["F","M","Otro"] else 1)
-                age = ec3.number_input("Edad", 1, 120, int(row["age"]) if row["age"] else 30)
-                height_cm = ec4.number_input("Estatura (cm)", 80.0, 230.0, float(row["height_cm"]) if row["height_cm"] else 170.0)
-
-                ec5, ec6, ec7 = st.columns(3)
-                weight_kg = ec5.number_input("Peso (kg)", 10.0, 400.0, float(row["weight_kg"]) if row["weight_kg"] else 70.0)
-                body_fat_pct = ec6.number_input("% Grasa", 0.0, 80.0, float(row["body_fat_pct"]) if row["body_fat_pct"] else 20.0)
-                muscle_pct = ec7.number_input("% Músculo", 0.0, 80.0, float(row["muscle_pct"]) if row["muscle_pct"] else 35.0)
-
-                ec8, ec9, ec10 = st.columns(3)
-                visceral_fat = ec8.number_input("Grasa visceral", 0, 30, int(row["visceral_fat"]) if row["visceral_fat"] else 5)
-                meals_per_day = ec9.number_input("Ingestas/día", 1, 8, int(row["meals_per_day"]) if row["meals_per_day"] else 3)
-                economic_level = ec10.selectbox("Nivel económico", ["Bajo","Medio","Alto"], index=["Bajo","Medio","Alto"].index(row["economic_level"]) if row["economic_level"] in ["Bajo","Medio","Alto"] else 1)
-
-                skinfolds = st.text_input("Pliegues cutáneos", value=row["skinfolds"] or "")
-                preferred_foods = st.text_input("Alimentos preferidos", value=row["preferred_foods"] or "")
-                allergies = st.text_input("Alergias", value=row["allergies"] or "")
-                occupation = st.text_input("Ocupación", value=row["occupation"] or "")
-                notes = st.text_area("Notas", value=row["notes"] or "")
-
-                colA, colB = st.columns(2)
-                save = colA.form_submit_button("Guardar cambios")
-                remove = colB.form_submit_button("Eliminar cliente", type="primary")
-                if save:
-                    update_client(int(cid),
-                        name=name, sex=sex, age=int(age), height_cm=float(height_cm),
-                        weight_kg=float(weight_kg), skinfolds=skinfolds, body_fat_pct=float(body_fat_pct),
-                        muscle_pct=float(muscle_pct), visceral_fat=int(visceral_fat), preferred_foods=preferred_foods,
-                        meals_per_day=int(meals_per_day), allergies=allergies, economic_level=economic_level,
-                        occupation=occupation, notes=notes
-                    )
-                    st.success("Guardado.")
-                if remove:
-                    delete_client(int(cid))
-                    st.success("Eliminado. Actualiza la lista con la búsqueda.")
+    cid = _client_picker("cid_edit")
+    if cid:
+        row = get_client_by_id(int(cid))
+        with st.form("edit_client"):
+            ec1, ec2, ec3, ec4 = st.columns([2,1,1,1])
+            name = ec1.text_input("Nombre", row.name)
+            sex = ec2.selectbox("Sexo", ["F","M","Otro"], index=["F","M","Otro"].index(row.sex) if row.sex in ["F","M","Otro"] else 1)
+            age = ec3.number_input("Edad", 1, 120, int(row.age) if row.age else 30)
+            height_cm = ec4.number_input("Estatura (cm)", 80.0, 230.0, float(row.height_cm) if row.height_cm else 170.0)
+
+            ec5, ec6, ec7 = st.columns(3)
+            weight_kg = ec5.number_input("Peso (kg)", 10.0, 400.0, float(row.weight_kg) if row.weight_kg else 70.0)
+            body_fat_pct = ec6.number_input("% Grasa", 0.0, 80.0, float(row.body_fat_pct) if row.body_fat_pct else 20.0)
+            muscle_pct = ec7.number_input("% Músculo", 0.0, 80.0, float(row.muscle_pct) if row.muscle_pct else 35.0)
+
+            ec8, ec9, ec10 = st.columns(3)
+            visceral_fat = ec8.number_input("Grasa visceral", 0, 30, int(row.visceral_fat) if row.visceral_fat else 5)
+            meals_per_day = ec9.number_input("Ingestas/día", 1, 8, int(row.meals_per_day) if row.meals_per_day else 3)
+            economic_level = ec10.selectbox("Nivel económico", ["Bajo","Medio","Alto"], index=["Bajo","Medio","Alto"].index(row.economic_level) if row.economic_level in ["Bajo","Medio","Alto"] else 1)
+
+            skinfolds = st.text_input("Pliegues cutáneos", value=row.skinfolds or "")
+            preferred_foods = st.text_input("Alimentos preferidos", value=row.preferred_foods or "")
+            allergies = st.text_input("Alergias", value=row.allergies or "")
+            occupation = st.text_input("Ocupación", value=row.occupation or "")
+            notes = st.text_area("Notas", value=row.notes or "")
+
+            colA, colB = st.columns(2)
+            save = colA.form_submit_button("Guardar cambios")
+            remove = colB.form_submit_button("Eliminar cliente", type="primary")
+            if save:
+                update_client(int(cid),
+                    name=name, sex=sex, age=int(age), height_cm=float(height_cm),
+                    weight_kg=float(weight_kg), skinfolds=skinfolds, body_fat_pct=float(body_fat_pct),
+                    muscle_pct=float(muscle_pct), visceral_fat=int(visceral_fat), preferred_foods=preferred_foods,
+                    meals_per_day=int(meals_per_day), allergies=allergies, economic_level=economic_level,
+                    occupation=occupation, notes=notes
+                ).result()
+                st.success("Guardado.")
+            if remove:
+                delete_client(int(cid)).result()
+                st.success("Eliminado. Actualiza la lista con la búsqueda.")
+
+# ---- Resumen ----
+elif page == "Resumen":
+    st.header("📊 Resumen del roster")
+    overview = roster_overview()
+    k1, k2, k3, k4 = st.columns(4)
+    k1.metric("Clientes", overview["clients"])
+    k2.metric(f"Activos ({ACTIVE_DAYS} días)", overview["active"])
+    k3.metric(f"Sin medir en {ACTIVE_DAYS} días", overview["stale"])
+    k4.metric("Nunca medidos", overview["never_measured"])
+
+    perf.mark("resumen.totales")
+    st.subheader("Progreso por objetivo")
+    progress = objective_progress()
+    if progress.empty:
+        st.caption("Aún no hay clientes con al menos dos semanas de mediciones.")
+    else:
+        st.dataframe(progress.rename(columns={
+            "objective": "Objetivo", "clients": "Clientes",
+            "fat_loss_pct_month": "% grasa perdido/mes", "weight_change_kg_month": "Cambio de peso (kg/mes)",
+        }).round(2), use_container_width=True, hide_index=True)
+
+    perf.mark("resumen.progreso")
+    st.subheader(f"Sin medir en {ACTIVE_DAYS} días")
+    stale = stale_clients()
+    if stale.empty:
+        st.caption("Todos los clientes medidos están al día.")
+    else:
+        st.dataframe(stale.rename(columns={
+            "client_id": "ID", "name": "Nombre", "last_date": "Última medición",
+            "last_weight_kg": "Último peso (kg)", "plan_objective": "Objetivo",
+        }), use_container_width=True, hide_index=True)
 
 # ---- Mediciones ----
 elif page == "Mediciones":
     st.header("📏 Mediciones")
-    clients = list_clients()
-    cid = _id_selectbox(clients, key="cid_meas")
+    cid = _client_picker("cid_meas")
     if cid:
         st.subheader(f"Cliente ID {cid}")
         with st.form("form_meas"):
@@ -145,29 +372,75 @@ elif page == "Mediciones":
                     body_fat_pct=float(body_fat_pct), muscle_pct=float(muscle_pct), visceral_fat=int(visceral_fat),
                     waist_cm=float(waist_cm), hip_cm=float(hip_cm), chest_cm=float(chest_cm),
                     thigh_cm=float(thigh_cm), arm_cm=float(arm_cm), notes=notes
-                )
+                ).result()
                 st.success("Medición guardada.")
         st.divider()
         dfm = get_measurements(int(cid))
         st.subheader("Histórico")
         st.dataframe(dfm, use_container_width=True, hide_index=True)
 
+        st.subheader("📈 Tendencias")
+        trends = measurement_trends(int(cid))
+        if trends.empty:
+            st.caption("Sin mediciones todavía.")
+        else:
+            metric = st.selectbox("Métrica", list(TREND_METRICS), format_func=TREND_METRICS.get, key="trend_metric")
+            series = trends.dropna(subset=[metric])
+            if series.empty:
+                st.caption("Sin datos para esta métrica.")
+            else:
+                last = series.iloc[-1]
+                k1, k2, k3 = st.columns(3)
+                k1.metric("Última", f"{last[metric]:.1f}",
+                          delta=None if pd.isna(last[f"{metric}_delta"]) else f"{last[f'{metric}_delta']:+.1f}")
+                k2.metric("Media 4 semanas", f"{last[f'{metric}_avg_4w']:.1f}")
+                rate = last[f"{metric}_rate_per_week"]
+                k3.metric("Cambio/semana desde la 1ª visita", "-" if pd.isna(rate) else f"{rate:+.2f}")
+                st.line_chart(chart_frame(trends, metric))
+
 # ---- Planes ----
 elif page == "Planes":
     st.header("🥗🏋️ Planes")
-    clients = list_clients()
-    cid = _id_selectbox(clients, key="cid_plans")
+    with st.expander("🔁 Recalcular planes de todo el roster"):
+        st.caption("Genera un plan nuevo (Mifflin-St Jeor + Preset GS) para cada cliente con peso, estatura y edad.")
+        r1, r2 = st.columns(2)
+        roster_activity = r1.selectbox("Actividad", ["sedentario","ligero","moderado","alto","atleta"], index=2, key="roster_activity")
+        roster_objective = r2.selectbox("Objetivo", ["recomposición","pérdida de grasa","mantenimiento","ganancia de masa"], index=0, key="roster_objective")
+        p1, p2, p3 = st.columns(3)
+        split_p = p1.number_input("% Proteína", 0, 100, 30, key="roster_p")
+        split_f = p2.number_input("% Grasa", 0, 100, 25, key="roster_f")
+        split_c = p3.number_input("% Carbohidratos", 0, 100, 45, key="roster_c")
+        if st.button("Recalcular roster"):
+            if split_p + split_f + split_c != 100:
+                st.warning("Los porcentajes deben sumar 100.")
+            else:
+                _submit_job("Recalcular roster", _roster_job, roster_activity, roster_objective,
+                            (split_p / 100, split_f / 100, split_c / 100), preload=("roster",))
+    perf.mark("planes.roster")
+    cid = _client_picker("cid_plans")
     if cid:
         row = get_client_by_id(int(cid))
-        st.subheader(f"Cliente: {row['name']}")
+        st.subheader(f"Cliente: {row.name}")
         st.caption("Macros con Mifflin-St Jeor + Preset GS (opcional)")
 
+        with st.expander("👥 Clientes similares y sus resultados"):
+            similar = similar_clients(int(cid))
+            if similar.empty:
+                st.caption(f"Aún no hay clientes con plan y al menos {PROGRESS_MIN_DAYS} días de mediciones.")
+            else:
+                st.dataframe(similar[list(SIMILAR_COLUMNS)].rename(columns=SIMILAR_COLUMNS).round(2),
+                             use_container_width=True, hide_index=True)
+                kcal = suggested_calories(similar, row.weight_kg)
+                if kcal:
+                    st.caption(f"Mediana de sus planes: {similar['kcal_per_kg'].median():.1f} kcal/kg "
+                               f"≈ {kcal:.0f} kcal para {row.weight_kg:g} kg.")
+
         with st.form("form_macros"):
             c1, c2, c3, c4 = st.columns(4)
-            weight = c1.number_input("Peso (kg)", 10.0, 400.0, float(row["weight_kg"]) if row["weight_kg"] else 70.0)
-            height = c2.number_input("Estatura (cm)", 80.0, 230.0, float(row["height_cm"]) if row["height_cm"] else 170.0)
-            age = c3.number_input("Edad", 1, 120, int(row["age"]) if row["age"] else 30)
-            sex = c4.selectbox("Sexo", ["M","F"], index=0 if row["sex"]=="M" else 1)
+            weight = c1.number_input("Peso (kg)", 10.0, 400.0, float(row.weight_kg) if row.weight_kg else 70.0)
+            height = c2.number_input("Estatura (cm)", 80.0, 230.0, float(row.height_cm) if row.height_cm else 170.0)
+            age = c3.number_input("Edad", 1, 120, int(row.age) if row.age else 30)
+            sex = c4.selectbox("Sexo", ["M","F"], index=0 if row.sex=="M" else 1)
 
             c5, c6 = st.columns(2)
             activity = c5.selectbox("Actividad", ["sedentario","ligero","moderado","alto","atleta"], index=2)
@@ -176,17 +449,28 @@ elif page == "Planes":
             generate = st.form_submit_button("Calcular macros + Generar menú GS")
             if generate:
                 tmb, tdee = mifflin_st_jeor(weight, height, int(age), sex, activity)
-                plan = build_gs_meal_plan(tdee, objective, meals_per_day=int(row["meals_per_day"] or 3))
-                add_meal_plan(client_id=int(cid), date=datetime.now().date().isoformat(),
+                meals_per_day = int(row.meals_per_day or 3)
+                plan = build_gs_meal_plan(tdee, objective, meals_per_day=meals_per_day)
+                items = solve_meal_items(plan["protein_g"], plan["fats_g"], plan["carbs_g"], meals_per_day,
+                                         economic_level=row.economic_level, allergies=row.allergies)
+                add_meal_plan(items=items, client_id=int(cid), date=datetime.now().date().isoformat(),
                               calories=int(plan["calories"]), protein_g=plan["protein_g"], fats_g=plan["fats_g"],
                               carbs_g=plan["carbs_g"], meals_json=pd.Series(plan["meals"]).to_json(orient="values"),
-                              notes=f"Objetivo: {objective}. Preset GS.")
+                              objective=objective, notes=f"Objetivo: {objective}. Preset GS.").result()
                 st.success(f"Plan guardado. TMB: {int(tmb)} kcal • TDEE: {int(tdee)} kcal")
 
         st.divider()
         st.subheader("Planes de alimentación")
         mp = list_meal_plans(int(cid))
         st.dataframe(mp, use_container_width=True, hide_index=True)
+        if not mp.empty:
+            items = list_meal_items(latest_meal_plan(int(cid)).id)
+            if not items.empty:
+                st.caption("Alimentos del último plan")
+                st.dataframe(items.drop(columns="meal_index").rename(columns={
+                    "meal_name": "Comida", "food": "Alimento", "grams": "Gramos", "protein_g": "Proteína (g)",
+                    "fats_g": "Grasas (g)", "carbs_g": "Carbohidratos (g)", "calories": "kcal",
+                }), use_container_width=True, hide_index=True)
 
         st.subheader("Plan de entrenamiento")
         with st.form("form_train"):
@@ -202,7 +486,7 @@ elif page == "Planes":
                 add_training_plan(client_id=int(cid), date=datetime.now().date().isoformat(),
                                   goal=goal, split=split, days_per_week=int(days_per_week),
                                   session_duration_min=int(session_duration_min), cardio_plan=cardio_plan,
-                                  routine_text=routine_text, notes=notes)
+                                  routine_text=routine_text, notes=notes).result()
                 st.success("Entrenamiento guardado.")
         st.subheader("Histórico de entrenamientos")
         tp = list_training_plans(int(cid))
@@ -211,16 +495,31 @@ elif page == "Planes":
 # ---- Exportar PDF ----
 elif page == "Exportar PDF":
     st.header("🧾 Exportar PDF (formato Carlos Estrada)")
-    clients = list_clients()
-    cid = _id_selectbox(clients, key="cid_pdf")
+    cid = _client_picker("cid_pdf")
     if cid:
-        include_meal = st.checkbox("Incluir plan de alimentación (último)", value=True)
-        include_train = st.checkbox("Incluir plan de entrenamiento (último)", value=True)
+        doc_kind = st.radio("Documento", ["Ficha de cliente", "Reporte de progreso"], horizontal=True)
+        if doc_kind == "Ficha de cliente":
+            include_meal = st.checkbox("Incluir plan de alimentación (último)", value=True)
+            include_train = st.checkbox("Incluir plan de entrenamiento (último)", value=True)
+        else:
+            st.caption("Datos del cliente, gráficas y tabla de mediciones, plan de alimentación y rutina completos.")
         if st.button("Generar PDF"):
-            pdf_path = build_client_pdf(int(cid), include_meal=include_meal, include_train=include_train)
-            with open(pdf_path, "rb") as f:
-                st.download_button("Descargar PDF", f, file_name=f"FichaCliente_{cid}.pdf", mime="application/pdf")
-            st.success("PDF generado.")
+            if doc_kind == "Ficha de cliente":
+                _submit_job(f"PDF cliente {cid}", _pdf_job, int(cid), include_meal, include_train,
+                            preload=("pdf_utils",))
+            else:
+                _submit_job(f"Reporte de progreso cliente {cid}", _report_job, int(cid), preload=("pdf_utils",))
+
+    perf.mark("pdf.ficha")
+    st.divider()
+    st.subheader("📦 Exportación masiva (ZIP)")
+    bulk_q = st.text_input("Filtro de clientes (vacío = todos)", key="bulk_search")
+    bulk_meal = st.checkbox("Incluir plan de alimentación", value=True, key="bulk_meal")
+    bulk_train = st.checkbox("Incluir plan de entrenamiento", value=True, key="bulk_train")
+    if st.button("Generar ZIP"):
+        ids = client_ids(bulk_q.strip() or None)
+        _submit_job(f"ZIP de {len(ids)} fichas", _zip_job, ids, bulk_meal, bulk_train,
+                    preload=("bulk_export",))
 
 # ---- Ayuda ----
 else:
@@ -238,3 +537,45 @@ else:
 - Ve a [share.streamlit.io](https://share.streamlit.io/), conecta el repo y elige **app.py** como entrypoint.  
 - Listo: tendrás una URL pública para usar en tu Galaxy Tab.
     """)
+
+# Rest of the page since its last mark.
+perf.mark(f"página:{page}")
+_jobs_panel()
+perf.mark("tareas")
+
+with st.sidebar.expander("⏱️ Tiempos"):
+    perf.rerun_finished(_rerun_t0, page)
+    st.json(perf.report())
+    st.caption("Caché de consultas")
+    st.json(cache_stats())
+    st.caption("Tareas")
+    st.json(jobs.job_stats())
+
+# Hidden admin panel: open the app with ?perf=<GS_PERF_TOKEN> (off without one).
+if perf.panel_allowed(st.query_params.get("perf")):
+    with st.sidebar.expander("🔧 Perfil", expanded=True):
+        if not perf.ENABLED:
+            st.info("Arranca la app con GS_PERF=1 para medir consultas y secciones.")
+        else:
+            recent = perf.reruns()
+            if recent:
+                last = recent[0]
+                st.caption(f"Última recarga completa: {last['page']} — {last['seconds'] * 1000:.0f} ms")
+                parts = pd.DataFrame(
+                    [("marca", n, s * 1000) for n, s in last["marks"]] +
+                    [("sección", n, s * 1000) for n, s in last["sections"]],
+                    columns=["Tipo", "Nombre", "ms"])
+                st.dataframe(parts.round(1), use_container_width=True, hide_index=True)
+                queries = pd.DataFrame(last["queries"], columns=["sql", "params", "rows", "ms"])
+                st.caption(f"{len(queries)} consulta(s), {queries['ms'].sum():.1f} ms")
+                st.dataframe(queries.sort_values("ms", ascending=False).head(20).round(2),
+                             use_container_width=True, hide_index=True)
+            st.caption(f"Consultas lentas (≥ {perf.SLOW_QUERY_MS:g} ms)")
+            slow = perf.slow_queries()
+            if slow:
+                st.dataframe(pd.DataFrame(slow), use_container_width=True, hide_index=True)
+            else:
+                st.caption("Ninguna todavía.")
+            st.code(perf.prometheus_text(), language="text")
+            if perf.METRICS_FILE and st.button("Escribir métricas"):
+                st.success(f"Métricas escritas en {perf.write_metrics()}")
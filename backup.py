@@ -0,0 +1,298 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+import db
+
+# Online backups and analyst exports of a live database.
+#
+# Snapshots use SQLite's backup API in steps of BACKUP_PAGES pages, so a
+# rollback-journal reader lock is held only for one step at a time. In WAL
+# mode writers are never blocked by readers, but a write from another
+# connection restarts the copy; after MAX_RESTARTS the rest of the copy is
+# done in one step (one read snapshot, writers keep going). Each copy is
+# checked with PRAGMA integrity_check, gzip-compressed and rotated. A copy
+# identical to the newest snapshot is not stored again.
+#
+# The Parquet export streams each table in chunks from one read transaction,
+# so all files describe the same moment and memory stays flat.
+
+BACKUP_DIR = os.environ.get("GS_BACKUP_DIR", "backups")
+BACKUP_KEEP = 7
+BACKUP_PAGES = 256        # pages per backup step (1 MiB with 4 KiB pages)
+BACKUP_SLEEP = 0.005      # seconds between steps, for writers to get in
+MAX_RESTARTS = 3
+MANIFEST = "manifest.json"
+
+EXPORT_TABLES = ("clients", "measurements", "meal_plans", "training_plans")
+EXPORT_CHUNK_ROWS = 50000
+PARQUET_COMPRESSION = "zstd"
+
+class _Restarted(Exception):
+    pass
+
+def _stem(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+def snapshot_dir(path: str = None, backup_dir: str = None) -> str:
+    # One folder per database file, so tenants rotate independently.
+    return os.path.join(backup_dir or BACKUP_DIR, _stem(path or db.current_path()))
+
+def _read_manifest(folder: str) -> list:
+    try:
+        with open(os.path.join(folder, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+def _write_manifest(folder: str, entries: list):
+    tmp = os.path.join(folder, MANIFEST + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=1)
+    os.replace(tmp, os.path.join(folder, MANIFEST))
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _copy_online(src: sqlite3.Connection, dest_path: str, pages: int, progress=None) -> int:
+    # Returns the number of restarts. progress(copied, total) after each step.
+    restarts = 0
+    remaining_before = None
+
+    def step(status, remaining, total):
+        nonlocal restarts, remaining_before
+        if remaining_before is not None and remaining > remaining_before:
+            restarts += 1
+            if restarts > MAX_RESTARTS:
+                raise _Restarted()
+        remaining_before = remaining
+        if progress:
+            progress(total - remaining, total)
+
+    dest = sqlite3.connect(dest_path)
+    try:
+        try:
+            src.backup(dest, pages=pages, progress=step, sleep=BACKUP_SLEEP)
+        except _Restarted:
+            src.backup(dest, pages=-1)
+        # The copy inherits WAL mode; a snapshot should be one self-contained file.
+        dest.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        dest.close()
+    return restarts
+
+def integrity_check(path: str) -> str:
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("PRAGMA integrity_check").fetchall()
+    finally:
+        conn.close()
+    return "; ".join(r[0] for r in rows)
+
+def snapshot(path: str = None, backup_dir: str = None, keep: int = BACKUP_KEEP,
+             pages: int = BACKUP_PAGES, progress=None) -> dict:
+    # Backs up the database (default: the current tenant) and returns its
+    # manifest entry. Raises RuntimeError if the copy fails integrity_check.
+    path = path or db.current_path()
+    db.init_db(path)
+    folder = snapshot_dir(path, backup_dir)
+    os.makedirs(folder, exist_ok=True)
+    # Microseconds: two snapshots in the same second must not share a file.
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    tmp = os.path.join(folder, f".{stamp}.db.partial")
+    start = time.perf_counter()
+    src = db.get_conn(path)
+    try:
+        restarts = _copy_online(src, tmp, pages, progress)
+        check = integrity_check(tmp)
+        if check != "ok":
+            raise RuntimeError(f"La copia de {path} no pasó integrity_check: {check}")
+        digest = _sha256(tmp)
+        entries = _read_manifest(folder)
+        if entries and entries[-1]["sha256"] == digest:
+            entry = dict(entries[-1], unchanged=True)
+        else:
+            name = f"{_stem(path)}-{stamp}.db.gz"
+            with open(tmp, "rb") as f_in, gzip.open(os.path.join(folder, name + ".partial"), "wb",
+                                                    compresslevel=6) as f_out:
+                shutil.copyfileobj(f_in, f_out, 1 << 20)
+            os.replace(os.path.join(folder, name + ".partial"), os.path.join(folder, name))
+            entry = {
+                "file": name,
+                "created": stamp,
+                "sha256": digest,
+                "db_bytes": os.path.getsize(tmp),
+                "gz_bytes": os.path.getsize(os.path.join(folder, name)),
+                "restarts": restarts,
+                "seconds": round(time.perf_counter() - start, 3),
+            }
+            entries.append(entry)
+            entries = _rotate(folder, entries, keep)
+            _write_manifest(folder, entries)
+    finally:
+        src.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return entry
+
+def _rotate(folder: str, entries: list, keep: int) -> list:
+    keep = max(keep, 1)
+    for old in entries[:-keep]:
+        try:
+            os.remove(os.path.join(folder, old["file"]))
+        except FileNotFoundError:
+            pass
+    return entries[-keep:]
+
+def list_snapshots(path: str = None, backup_dir: str = None) -> list:
+    # Manifest entries, oldest first.
+    return _read_manifest(snapshot_dir(path, backup_dir))
+
+def restore(snapshot_file: str, dest_path: str, overwrite: bool = False) -> str:
+    # Decompresses a snapshot to dest_path and checks it. Never writes over
+    # an existing database unless overwrite is given; stop the app first.
+    if os.path.exists(dest_path) and not overwrite:
+        raise FileExistsError(f"{dest_path} ya existe.")
+    tmp = dest_path + ".partial"
+    try:
+        try:
+            with gzip.open(snapshot_file, "rb") as f_in, open(tmp, "wb") as f_out:
+                shutil.copyfileobj(f_in, f_out, 1 << 20)
+            check = integrity_check(tmp)
+        except (OSError, EOFError, sqlite3.DatabaseError) as e:
+            # Not gzip, truncated, or not a SQLite database inside.
+            raise RuntimeError(f"{snapshot_file} no es una copia válida: {e}") from e
+        if check != "ok":
+            raise RuntimeError(f"{snapshot_file} no pasó integrity_check: {check}")
+        os.replace(tmp, dest_path)
+    finally:
+        # SQLite may leave -wal/-shm next to a damaged copy it tried to open.
+        for leftover in (tmp, tmp + "-wal", tmp + "-shm"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return dest_path
+
+def verify(snapshot_file: str) -> str:
+    # integrity_check result of a compressed snapshot ("ok" if sound).
+    tmp = snapshot_file + ".verify"
+    try:
+        restore(snapshot_file, tmp, overwrite=True)
+        return "ok"
+    except RuntimeError as e:
+        return str(e)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+_ARROW_TYPES = {"INTEGER": "int64", "REAL": "float64"}
+
+def _arrow_schema(conn, table: str):
+    import pyarrow as pa
+    columns = conn.execute(f"PRAGMA table_info({table})").fetchall()
+    return pa.schema([(c["name"], getattr(pa, _ARROW_TYPES.get(c["type"].upper(), "string"))())
+                      for c in columns])
+
+def export_parquet(out_dir: str, path: str = None, tables=EXPORT_TABLES,
+                   chunk_rows: int = EXPORT_CHUNK_ROWS, progress=None) -> dict:
+    # Writes <out_dir>/<table>.parquet for each table; returns table -> rows.
+    # progress(table, rows_so_far) after each chunk.
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Para exportar a Parquet instala pyarrow (pip install pyarrow).")
+    path = path or db.current_path()
+    db.init_db(path)
+    os.makedirs(out_dir, exist_ok=True)
+    counts = {}
+    conn = db.get_conn(path)
+    try:
+        conn.execute("BEGIN")  # one snapshot for every table
+        for table in tables:
+            schema = _arrow_schema(conn, table)
+            target = os.path.join(out_dir, f"{table}.parquet")
+            cursor = conn.execute(f"SELECT {', '.join(schema.names)} FROM {table} ORDER BY id")
+            rows = 0
+            with pq.ParquetWriter(target + ".partial", schema, compression=PARQUET_COMPRESSION) as writer:
+                while True:
+                    chunk = cursor.fetchmany(chunk_rows)
+                    if not chunk:
+                        break
+                    columns = list(zip(*chunk))
+                    writer.write_table(pa.Table.from_arrays(
+                        [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+                        schema=schema,
+                    ))
+                    rows += len(chunk)
+                    if progress:
+                        progress(table, rows)
+            os.replace(target + ".partial", target)
+            counts[table] = rows
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    return counts
+
+def _paths(args) -> list:
+    if args.all:
+        return [db.tenant_path(t) for t in db.list_tenants()]
+    return [db.current_path()]
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Copias de seguridad y exportación de la base GS")
+    parser.add_argument("command", choices=["snapshot", "list", "verify", "restore", "parquet"])
+    parser.add_argument("file", nargs="?", help="verify/restore: archivo .db.gz")
+    parser.add_argument("--tenant", default=db.DEFAULT_TENANT, help="gimnasio (por defecto GS_TENANT)")
+    parser.add_argument("--all", action="store_true", help="snapshot/list: todos los gimnasios")
+    parser.add_argument("--dir", default=None, help="carpeta de copias (por defecto GS_BACKUP_DIR)")
+    parser.add_argument("--keep", type=int, default=BACKUP_KEEP)
+    parser.add_argument("--out", help="restore: base destino; parquet: carpeta destino")
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args()
+    db.set_tenant(args.tenant)
+
+    if args.command == "snapshot":
+        for path in _paths(args):
+            entry = snapshot(path, args.dir, keep=args.keep)
+            if entry.get("unchanged"):
+                print(f"{path}: sin cambios desde {entry['file']}")
+            else:
+                print(f"{path}: {entry['file']} ({entry['db_bytes'] / 1e6:.1f} MB -> "
+                      f"{entry['gz_bytes'] / 1e6:.1f} MB, {entry['seconds']:.2f} s)")
+    elif args.command == "list":
+        for path in _paths(args):
+            for entry in list_snapshots(path, args.dir):
+                print(f"{os.path.join(snapshot_dir(path, args.dir), entry['file'])}\t"
+                      f"{entry['gz_bytes'] / 1e6:.1f} MB")
+    elif args.command in ("verify", "restore"):
+        if not args.file:
+            parser.error(f"{args.command} necesita el archivo .db.gz")
+        if args.command == "verify":
+            result = verify(args.file)
+            print(f"{args.file}: {result}")
+            if result != "ok":
+                raise SystemExit(1)
+        else:
+            if not args.out:
+                parser.error("restore necesita --out")
+            try:
+                print(f"Restaurado en {restore(args.file, args.out, args.overwrite)}")
+            except (RuntimeError, FileExistsError) as e:
+                print(e, file=sys.stderr)
+                raise SystemExit(1)
+    elif args.command == "parquet":
+        out = args.out or f"parquet-{datetime.now():%Y%m%d-%H%M%S}"
+        for table, rows in export_parquet(out).items():
+            print(f"{table}: {rows} filas")
+        print(f"Parquet en {os.path.abspath(out)}")
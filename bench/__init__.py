@@ -0,0 +1,3 @@
+# Benchmarks: `python -m bench.generate` builds seeded synthetic databases,
+# `python -m bench.run` times the app's hot paths against one of them and
+# `python -m bench.loadtest` drives concurrent app sessions against it.
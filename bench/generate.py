@@ -0,0 +1,189 @@
+import os
+from datetime import date
+import numpy as np
+import pandas as pd
+import db
+from gs_preset import OBJECTIVE_DELTAS, ACTIVITY_MULTIPLIERS
+from roster import compute_roster_meal_plans
+
+# Seeded synthetic rosters shaped like client_app.db. The same seed, size
+# and end date always give the same database, so benchmark runs on
+# different machines or commits compare like with like.
+#
+# Clients join over the YEARS before END_DATE; each gets a measurement every
+# one to three weeks from then on (weight and body fat drift with the
+# objective), a few GS meal plans and zero to two training plans. Rows go
+# through the db writer, so triggers, FTS and summaries are built as in
+# production.
+
+SIZES = {"1k": 1000, "10k": 10000, "100k": 100000}
+END_DATE = date(2025, 6, 30)
+YEARS = 3
+CHUNK_CLIENTS = 5000
+MEAN_MEASUREMENTS = 12
+MAX_MEASUREMENTS = 60
+
+FIRST_NAMES = ["Ana", "Luis", "María", "José", "Carmen", "Juan", "Lucía", "Carlos", "Sofía", "Miguel",
+               "Valeria", "Jorge", "Fernanda", "Diego", "Daniela", "Alejandro", "Paola", "Ricardo",
+               "Gabriela", "Andrés", "Mariana", "Roberto", "Camila", "Fernando", "Ximena", "Raúl"]
+LAST_NAMES = ["García", "Hernández", "López", "Martínez", "González", "Pérez", "Rodríguez", "Sánchez",
+              "Ramírez", "Cruz", "Flores", "Gómez", "Morales", "Vázquez", "Reyes", "Jiménez", "Torres",
+              "Díaz", "Gutiérrez", "Ruiz", "Mendoza", "Aguilar", "Ortiz", "Castillo", "Romero", "Serrano"]
+OCCUPATIONS = ["Oficina", "Estudiante", "Docente", "Enfermería", "Comercio", "Ingeniería", "Chef",
+               "Chofer", "Hogar", "Deportista", None]
+ALLERGIES = ["lactosa", "gluten", "nuez", "mariscos", "huevo"]
+OBJECTIVES = list(OBJECTIVE_DELTAS) + ["recomposición"]
+# kg and body-fat points per week, by objective
+OBJECTIVE_TRENDS = {
+    "pérdida de grasa": (-0.25, -0.15),
+    "ganancia de masa": (0.15, -0.02),
+    "mantenimiento": (0.0, 0.0),
+    "recomposición": (-0.05, -0.1),
+}
+SPLITS = ["Full body", "Torso/Pierna", "Empuje/Tirón/Pierna", "Weider"]
+TRAINING_GOALS = ["Hipertrofia", "Fuerza", "Resistencia", "Salud general"]
+
+def _iso(days: np.ndarray) -> list:
+    # Days since END_DATE (<= 0) as ISO dates.
+    origin = np.datetime64(END_DATE.isoformat())
+    return np.datetime_as_string(origin + days.astype("timedelta64[D]"), unit="D").tolist()
+
+def _native(df: pd.DataFrame, fields) -> list:
+    columns = [[None if pd.isna(v) else v for v in df[f].tolist()] if f in df else [None] * len(df)
+               for f in fields]
+    return list(zip(*columns))
+
+def _clients(rng, n: int, first_id: int) -> pd.DataFrame:
+    sex = rng.choice(["F", "M"], n)
+    male = sex == "M"
+    height = np.where(male, rng.normal(174, 7, n), rng.normal(161, 6.5, n)).clip(140, 205)
+    bmi = rng.lognormal(np.log(26), 0.15, n).clip(17, 45)
+    body_fat = (1.2 * bmi + 0.23 * 35 - np.where(male, 16.2, 5.4) + rng.normal(0, 3, n)).clip(5, 55)
+    joined = -rng.integers(0, 365 * YEARS, n)
+    ids = np.arange(first_id, first_id + n)
+    return pd.DataFrame({
+        "id": ids,
+        "name": [f"{FIRST_NAMES[a]} {LAST_NAMES[b]} {LAST_NAMES[c]}" for a, b, c in
+                 rng.integers(0, [len(FIRST_NAMES), len(LAST_NAMES), len(LAST_NAMES)], (n, 3))],
+        "sex": sex,
+        "age": rng.integers(18, 71, n),
+        "height_cm": height.round(1),
+        "weight_kg": (bmi * (height / 100) ** 2).round(1),
+        "body_fat_pct": body_fat.round(1),
+        "muscle_pct": (100 - body_fat - rng.uniform(20, 30, n)).round(1),
+        "visceral_fat": (bmi / 3 + rng.normal(0, 2, n)).clip(1, 30).round().astype("int64"),
+        "meals_per_day": rng.choice([3, 3, 4, 4, 5], n),
+        "allergies": np.where(rng.random(n) < 0.1, rng.choice(ALLERGIES, n), None),
+        "economic_level": rng.choice(["Bajo", "Medio", "Medio", "Alto"], n),
+        "occupation": rng.choice(np.array(OCCUPATIONS, dtype=object), n),
+        "created_at": _iso(joined),
+        "joined": joined,
+        "objective": rng.choice(OBJECTIVES, n),
+        "activity": rng.choice(list(ACTIVITY_MULTIPLIERS), n),
+    })
+
+def _measurements(rng, clients: pd.DataFrame) -> pd.DataFrame:
+    n = rng.poisson(MEAN_MEASUREMENTS, len(clients)).clip(0, MAX_MEASUREMENTS)
+    n = np.minimum(n, (-clients["joined"].to_numpy()) // 7 + 1)
+    owner = np.repeat(np.arange(len(clients)), n)
+    gaps = rng.integers(7, 22, len(owner))
+    # Days since joining: running sum of gaps, restarted at each client's first row.
+    first = np.repeat(np.cumsum(n) - n, n)
+    total = np.cumsum(gaps)
+    elapsed = total - total[first]
+    days = np.minimum(clients["joined"].to_numpy()[owner] + elapsed, 0)
+    weeks = elapsed / 7
+    trend = np.array([OBJECTIVE_TRENDS[o] for o in clients["objective"]])[owner]
+    weight = clients["weight_kg"].to_numpy()[owner] + trend[:, 0] * weeks + rng.normal(0, 0.6, len(owner))
+    fat = clients["body_fat_pct"].to_numpy()[owner] + trend[:, 1] * weeks + rng.normal(0, 0.5, len(owner))
+    waist = 0.45 * clients["height_cm"].to_numpy()[owner] + 0.8 * (weight - clients["weight_kg"].to_numpy()[owner])
+    return pd.DataFrame({
+        "client_id": clients["id"].to_numpy()[owner],
+        "date": _iso(days),
+        "weight_kg": weight.clip(35, 250).round(1),
+        "body_fat_pct": fat.clip(4, 60).round(1),
+        "muscle_pct": (clients["muscle_pct"].to_numpy()[owner] + rng.normal(0, 0.4, len(owner))).round(1),
+        "visceral_fat": clients["visceral_fat"].to_numpy()[owner],
+        "waist_cm": (waist + rng.normal(0, 1, len(owner))).round(1),
+        "hip_cm": (waist * 1.15 + rng.normal(0, 1, len(owner))).round(1),
+    })
+
+def _meal_plans(rng, clients: pd.DataFrame) -> pd.DataFrame:
+    n = 1 + rng.poisson(1.5, len(clients)).clip(0, 6)
+    rows = clients.loc[clients.index.repeat(n)].reset_index(drop=True)
+    plans = compute_roster_meal_plans(rows, rows["activity"], rows["objective"])
+    joined = rows["joined"].to_numpy()
+    plans["date"] = _iso(joined + (rng.random(len(rows)) * -joined).astype("int64"))
+    plans["notes"] = [f"Objetivo: {o}. Preset GS." for o in plans["objective"]]
+    return plans.sort_values(["client_id", "date"], kind="stable")
+
+def _training_plans(rng, clients: pd.DataFrame) -> pd.DataFrame:
+    n = rng.choice([0, 1, 1, 2], len(clients))
+    rows = clients.loc[clients.index.repeat(n)].reset_index(drop=True)
+    k = len(rows)
+    joined = rows["joined"].to_numpy()
+    split = rng.choice(SPLITS, k)
+    days = rng.integers(3, 7, k)
+    return pd.DataFrame({
+        "client_id": rows["id"].to_numpy(),
+        "date": _iso(joined + (rng.random(k) * -joined).astype("int64")),
+        "goal": rng.choice(TRAINING_GOALS, k),
+        "split": split,
+        "days_per_week": days,
+        "session_duration_min": rng.choice([45, 60, 75, 90], k),
+        "cardio_plan": rng.choice(["20 min zona 2", "HIIT 2x semana", "10k pasos diarios"], k),
+        "routine_text": [f"{s}, {d} días: básicos 4x8-12, accesorios 3x12-15." for s, d in zip(split, days)],
+    })
+
+_TRAINING_FIELDS = ["client_id", "date", "goal", "split", "days_per_week", "session_duration_min",
+                    "cardio_plan", "routine_text"]
+
+def _insert_many(table: str, fields, rows):
+    sql = f"INSERT INTO {table} ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))})"
+    return db.submit_write(lambda conn: conn.executemany(sql, rows).rowcount).result()
+
+def generate(path: str, clients: int, seed: int = 0, progress=None) -> dict:
+    # Creates a new database at path; returns row counts per table.
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} ya existe.")
+    rng = np.random.default_rng(seed)
+    counts = {"clients": 0, "measurements": 0, "meal_plans": 0, "training_plans": 0}
+    with db.use_database(path):
+        db.init_db(path)
+        for first in range(1, clients + 1, CHUNK_CLIENTS):
+            chunk = _clients(rng, min(CHUNK_CLIENTS, clients - first + 1), first)
+            counts["clients"] += _insert_many("clients", ["id"] + db.CLIENT_FIELDS,
+                                              _native(chunk, ["id"] + db.CLIENT_FIELDS))
+            counts["measurements"] += _insert_many("measurements", db.MEASUREMENT_FIELDS,
+                                                   _native(_measurements(rng, chunk), db.MEASUREMENT_FIELDS))
+            plans = _meal_plans(rng, chunk)
+            counts["meal_plans"] += _insert_many("meal_plans", db.MEAL_PLAN_FIELDS,
+                                                 _native(plans, db.MEAL_PLAN_FIELDS))
+            counts["training_plans"] += _insert_many("training_plans", _TRAINING_FIELDS,
+                                                     _native(_training_plans(rng, chunk), _TRAINING_FIELDS))
+            if progress:
+                progress(counts["clients"], clients)
+        db.submit_write(lambda conn: conn.execute("ANALYZE")).result()
+    db.clear_cache()
+    return counts
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Genera una base sintética con la forma de client_app.db")
+    parser.add_argument("--size", default="10k", help=f"{', '.join(SIZES)} o un número de clientes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="por defecto bench/data/<size>-s<seed>.db")
+    args = parser.parse_args()
+
+    n = SIZES.get(args.size) or int(args.size)
+    out = args.out or os.path.join("bench", "data", f"{args.size}-s{args.seed}.db")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    start = time.perf_counter()
+
+    def report(done, total):
+        print(f"\r{done}/{total} clientes", end="", flush=True)
+
+    counts = generate(out, n, args.seed, progress=report)
+    print(f"\n{counts} en {time.perf_counter() - start:.1f} s -> {out}")
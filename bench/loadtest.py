@@ -0,0 +1,276 @@
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from bench.run import _copy_db
+from perf import percentile
+
+# Concurrent tablet sessions against app.py, driven with Streamlit's headless
+# AppTest on a copy of a synthetic database. Every session repeats the usual
+# coach flow -- register a client, search, add a measurement, generate a plan
+# on «Planes» and export the PDF -- and each interaction (one script rerun, or
+# rerun plus background job for the PDF) is timed.
+#
+# AppTest swaps Streamlit's global runtime on every run, so two of them can't
+# run in the same process. Each session gets its own process instead; they
+# share the database file, so writers from different sessions really contend
+# for SQLite's lock (a bit more than sessions of one Streamlit process, which
+# share a writer thread). Lock waits come from perf's writer instrumentation.
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+SESSIONS = 8
+ITERATIONS = 3
+THINK_S = 0.5          # max pause before each interaction, like a coach typing
+RUN_TIMEOUT_S = 60     # one script rerun
+JOB_TIMEOUT_S = 120    # one PDF job
+JOB_POLL_S = 0.05
+START_TIMEOUT_S = 120  # all sessions must be ready (imports, warm-up) by then
+
+def _find(elements, label: str):
+    for element in elements:
+        if element.label == label:
+            return element
+    raise LookupError(f"No hay «{label}» en la página.")
+
+def _kind(error: str) -> str:
+    if "database is locked" in error or "database is busy" in error:
+        return "locked"
+    if "timed out" in error or error.startswith("TimeoutError"):
+        return "timeout"
+    return "other"
+
+class Session:
+    def __init__(self, number: int, seed: int, think: float):
+        from streamlit.testing.v1 import AppTest
+
+        self.number = number
+        self.rng = random.Random(seed * 1000 + number)
+        self.think = think
+        self.at = AppTest.from_file(APP_PATH, default_timeout=RUN_TIMEOUT_S)
+        self.records = []  # (interaction, seconds, error or None)
+        self.client_id = None
+
+    def step(self, name: str, action) -> bool:
+        if self.think:
+            time.sleep(self.rng.uniform(0, self.think))
+        start = time.perf_counter()
+        error = None
+        try:
+            action()
+            if self.at.exception:
+                error = self.at.exception[0].message
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        self.records.append((name, time.perf_counter() - start, error))
+        return error is None
+
+    def go(self, page: str):
+        self.at.sidebar.radio[0].set_value(page).run()
+
+    def pick(self, key: str):
+        self.at.selectbox(key=key).set_value(self.client_id).run()
+
+    def create_client(self):
+        _find(self.at.text_input, "Nombre completo *").input(f"Carga {self.number}-{len(self.records)}")
+        _find(self.at.number_input, "Peso (kg)").set_value(round(self.rng.uniform(50, 110), 1))
+        _find(self.at.number_input, "% Grasa").set_value(round(self.rng.uniform(10, 40), 1))
+        _find(self.at.button, "Guardar cliente").click().run()
+        for message in self.at.success:
+            found = re.search(r"ID (\d+)", message.value)
+            if found:
+                self.client_id = int(found.group(1))
+                return
+        raise RuntimeError("El cliente no se creó.")
+
+    def search(self):
+        _find(self.at.text_input, "Nombre / ocupación / notas / alimentos / alergias").input("Carga").run()
+
+    def add_measurement(self):
+        _find(self.at.number_input, "Peso (kg)").set_value(round(self.rng.uniform(50, 110), 1))
+        _find(self.at.button, "Guardar medición").click().run()
+
+    def generate_plan(self):
+        _find(self.at.button, "Calcular macros + Generar menú GS").click().run()
+
+    def export_pdf(self):
+        import jobs
+
+        before = len(self.at.session_state["job_ids"]) if "job_ids" in self.at.session_state else 0
+        _find(self.at.button, "Generar PDF").click().run()
+        ids = self.at.session_state["job_ids"] if "job_ids" in self.at.session_state else []
+        if len(ids) == before:
+            warnings = [w.value for w in self.at.warning]
+            raise RuntimeError(warnings[0] if warnings else "La tarea no se encoló.")
+        deadline = time.monotonic() + JOB_TIMEOUT_S
+        job = jobs.get_job(ids[-1])
+        while job.active:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"PDF sin terminar tras {JOB_TIMEOUT_S} s")
+            time.sleep(JOB_POLL_S)
+        if job.error:
+            raise RuntimeError(job.error)
+
+    def iteration(self):
+        # Stops at the first failure: the later steps need the new client.
+        steps = [
+            ("navegar", lambda: self.go("Clientes")),
+            ("crear_cliente", self.create_client),
+            ("buscar", self.search),
+            ("navegar", lambda: self.go("Mediciones")),
+            ("elegir_cliente", lambda: self.pick("cid_meas")),
+            ("medición", self.add_measurement),
+            ("navegar", lambda: self.go("Planes")),
+            ("elegir_cliente", lambda: self.pick("cid_plans")),
+            ("generar_plan", self.generate_plan),
+            ("navegar", lambda: self.go("Exportar PDF")),
+            ("elegir_cliente", lambda: self.pick("cid_pdf")),
+            ("exportar_pdf", self.export_pdf),
+        ]
+        for name, action in steps:
+            if not self.step(name, action):
+                return
+
+_barrier = None
+
+def _init_worker(path: str, workdir: str, barrier):
+    # Runs in each session process before its session starts.
+    global _barrier
+    import db
+    import perf
+
+    _barrier = barrier
+    # Every session must use the copy: no GS_TENANT default and an empty
+    # tenants folder (so app.py's tenant selector resolves to DB_PATH), even
+    # when GS_TENANTS_DIR points at the live shards with an absolute path.
+    os.chdir(workdir)
+    db.DEFAULT_TENANT = None
+    db.TENANTS_DIR = os.path.join(workdir, "tenants")
+    db.DB_PATH = path
+    if db.current_path() != path:
+        raise RuntimeError(f"La prueba de carga usaría {db.current_path()} en lugar de la copia {path}.")
+    perf.ENABLED = True
+    perf.SLOW_LOG = None
+    # Module imports and first reads are paid by the deployment once, not by
+    # every new session: warm up with a throwaway one.
+    Session(-1, 0, 0).at.run()
+
+def _run_session(number: int, iterations: int, seed: int, think: float) -> dict:
+    import perf
+
+    session = Session(number, seed, think)
+    _barrier.wait(START_TIMEOUT_S)
+    session.step("abrir", session.at.run)
+    for _ in range(iterations):
+        session.iteration()
+    return {"records": session.records, "write_waits": perf.write_waits()}
+
+def _stats(seconds) -> dict:
+    return {
+        "p50_ms": round(percentile(seconds, 50) * 1000, 1),
+        "p95_ms": round(percentile(seconds, 95) * 1000, 1),
+        "p99_ms": round(percentile(seconds, 99) * 1000, 1),
+        "max_ms": round(max(seconds) * 1000, 1),
+    }
+
+def summarize(results: list) -> dict:
+    by_step = {}
+    errors = {"locked": 0, "timeout": 0, "other": 0}
+    samples = []
+    for result in results:
+        for name, seconds, error in result["records"]:
+            step = by_step.setdefault(name, {"times": [], "errors": 0})
+            step["times"].append(seconds)
+            if error:
+                step["errors"] += 1
+                errors[_kind(error)] += 1
+                if len(samples) < 5:
+                    samples.append(f"{name}: {error[:300]}")
+    interactions = {}
+    for name, step in by_step.items():
+        interactions[name] = dict(n=len(step["times"]), errors=step["errors"],
+                                  error_rate=round(step["errors"] / len(step["times"]), 4),
+                                  **_stats(step["times"]))
+    total = sum(s["n"] for s in interactions.values())
+    waits = {}
+    for kind in ("queue", "lock"):
+        seconds = [s for r in results for k, s in r["write_waits"] if k == kind]
+        if seconds:
+            waits[kind] = dict(n=len(seconds), over_1s=sum(s > 1 for s in seconds), **_stats(seconds))
+    return {
+        "interactions": interactions,
+        "errors": dict(errors, total=sum(errors.values()),
+                       rate=round(sum(errors.values()) / total, 4) if total else 0, samples=samples),
+        "write_waits": waits,
+    }
+
+def run(source: str, sessions: int = SESSIONS, iterations: int = ITERATIONS, seed: int = 0,
+        think: float = THINK_S) -> dict:
+    source = os.path.abspath(source)
+    workdir = tempfile.mkdtemp(prefix="gs-load-")
+    try:
+        path = os.path.join(workdir, "load.db")
+        _copy_db(source, path)
+        ctx = multiprocessing.get_context("spawn")
+        barrier = ctx.Barrier(sessions + 1)
+        with ctx.Pool(sessions, initializer=_init_worker, initargs=(path, workdir, barrier)) as pool:
+            pending = pool.starmap_async(_run_session,
+                                         [(i, iterations, seed, think) for i in range(sessions)], chunksize=1)
+            barrier.wait(START_TIMEOUT_S)
+            start = time.perf_counter()
+            results = pending.get()
+            wall = time.perf_counter() - start
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    report = summarize(results)
+    total = sum(s["n"] for s in report["interactions"].values())
+    report["meta"] = {
+        "source": os.path.basename(source),
+        "sessions": sessions,
+        "iterations": iterations,
+        "seed": seed,
+        "think_s": think,
+        "wall_s": round(wall, 1),
+        "interactions_per_s": round(total / wall, 2) if wall else None,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "cpus": os.cpu_count(),
+    }
+    return report
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Prueba de carga: sesiones concurrentes de app.py")
+    parser.add_argument("--db", required=True, help="base generada con python -m bench.generate")
+    parser.add_argument("--sessions", type=int, default=SESSIONS, help="tabletas simultáneas")
+    parser.add_argument("--iterations", type=int, default=ITERATIONS, help="flujos completos por tableta")
+    parser.add_argument("--think", type=float, default=THINK_S, help="pausa máxima entre acciones (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="escribe el reporte JSON aquí (si no, a stdout)")
+    args = parser.parse_args()
+
+    # Through the package module, not __main__: AppTest replaces __main__ in
+    # the workers, so the pool's functions must be importable by name.
+    from bench import loadtest
+
+    report = loadtest.run(args.db, args.sessions, args.iterations, args.seed, args.think)
+    for name, res in report["interactions"].items():
+        print(f"{name:16} n {res['n']:5}  p50 {res['p50_ms']:8.1f} ms  p95 {res['p95_ms']:8.1f} ms  "
+              f"p99 {res['p99_ms']:8.1f} ms  errores {res['errors']}", file=sys.stderr)
+    for kind, res in report["write_waits"].items():
+        print(f"espera {kind:9} n {res['n']:5}  p50 {res['p50_ms']:8.1f} ms  p95 {res['p95_ms']:8.1f} ms  "
+              f"máx {res['max_ms']:8.1f} ms", file=sys.stderr)
+    errors = report["errors"]
+    print(f"errores {errors['total']} ({errors['rate']:.1%}), bloqueos {errors['locked']}, "
+          f"timeouts {errors['timeout']}", file=sys.stderr)
+    text = json.dumps(report, indent=1, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
@@ -0,0 +1,383 @@
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import db
+from perf import percentile
+
+# Times the app's hot paths against a copy of a generated database and
+# reports p50/p95 latency, throughput and peak Python memory per benchmark,
+# as JSON. --baseline compares against a saved run and exits 1 on
+# regressions, so it can gate a change; --save writes a new baseline.
+#
+# Reads run cold: the query cache is cleared before every call (outside the
+# timed region), so they measure SQLite and pandas rather than a dict
+# lookup. Writes go to the copy, never to the source database. Peak memory
+# is measured in a separate, shorter pass because tracemalloc slows calls
+# down; it only sees Python allocations, not SQLite's page cache.
+
+DEFAULT_REPEAT = 200
+MEMORY_CALLS = 20
+TOLERANCE = 0.25      # allowed p50/p95 slowdown vs the baseline
+NOISE_FLOOR_MS = 0.1  # differences below this are never regressions
+
+_BENCHMARKS = {}
+
+def benchmark(name: str, group: str = "db", repeat: int = DEFAULT_REPEAT, cold: bool = True):
+    # Registers make(ctx) -> call(i). make runs once, untimed; call gets
+    # distinct i in -1..ctx.calls - 2.
+    def register(make):
+        _BENCHMARKS[name] = {"group": group, "make": make, "repeat": repeat, "cold": cold}
+        return make
+    return register
+
+class Context:
+    def __init__(self, seed: int):
+        self.rng = random.Random(seed)
+        self.ids = db.client_ids()
+        self.surnames = sorted({n.split()[-1] for n in db.list_clients()["name"].head(500)})
+        self.calls = DEFAULT_REPEAT + MEMORY_CALLS + 1  # set per benchmark by run()
+
+    def client_id(self) -> int:
+        return self.rng.choice(self.ids)
+
+    def sample(self, k: int) -> list:
+        return self.rng.sample(self.ids, min(k, len(self.ids)))
+
+# ---- db reads ----
+
+@benchmark("list_clients", repeat=10)
+def _list_clients(ctx):
+    return lambda i: db.list_clients()
+
+@benchmark("list_clients(search)")
+def _search(ctx):
+    return lambda i: db.list_clients(ctx.rng.choice(ctx.surnames))
+
+@benchmark("list_clients(search, prefix)")
+def _search_prefix(ctx):
+    return lambda i: db.list_clients(ctx.rng.choice(ctx.surnames)[:3])
+
+@benchmark("list_clients(search, fuzzy)")
+def _search_fuzzy(ctx):
+    # A dropped letter finds nothing in FTS and falls back to trigrams.
+    def call(i):
+        name = ctx.rng.choice(ctx.surnames)
+        cut = ctx.rng.randrange(1, len(name) - 1)
+        return db.list_clients(name[:cut] + name[cut + 1:])
+    return call
+
+@benchmark("list_clients_page")
+def _page(ctx):
+    return lambda i: db.list_clients_page(["name", "age", "weight_kg"], limit=50)
+
+@benchmark("list_clients_page(next)")
+def _page_next(ctx):
+    _, cursor = db.list_clients_page(["name"], limit=500)
+    return lambda i: db.list_clients_page(["name", "age", "weight_kg"], cursor=cursor, limit=50)
+
+@benchmark("client_directory")
+def _directory(ctx):
+    return lambda i: db.client_directory(limit=50)
+
+@benchmark("count_clients")
+def _count(ctx):
+    return lambda i: db.count_clients()
+
+@benchmark("get_client_by_id")
+def _client(ctx):
+    return lambda i: db.get_client_by_id(ctx.client_id())
+
+@benchmark("get_measurements")
+def _measurements(ctx):
+    return lambda i: db.get_measurements(ctx.client_id())
+
+@benchmark("list_meal_plans")
+def _meal_plans(ctx):
+    return lambda i: db.list_meal_plans(ctx.client_id())
+
+@benchmark("list_training_plans")
+def _training_plans(ctx):
+    return lambda i: db.list_training_plans(ctx.client_id())
+
+@benchmark("list_meal_items")
+def _meal_items(ctx):
+    plan_ids = [int(p) for c in ctx.sample(50) for p in db.list_meal_plans(c)["id"]]
+    return lambda i: db.list_meal_items(ctx.rng.choice(plan_ids))
+
+@benchmark("meal_plan_items")
+def _meal_plan_items(ctx):
+    plan_ids = [int(p) for c in ctx.sample(50) for p in db.list_meal_plans(c)["id"]]
+    return lambda i: db.meal_plan_items(ctx.rng.choice(plan_ids))
+
+@benchmark("get_meal_plan")
+def _meal_plan(ctx):
+    plan_ids = [int(p) for c in ctx.sample(50) for p in db.list_meal_plans(c)["id"]]
+    return lambda i: db.get_meal_plan(ctx.rng.choice(plan_ids))
+
+@benchmark("get_training_plan")
+def _training_plan(ctx):
+    plan_ids = [int(p) for c in ctx.sample(100) for p in db.list_training_plans(c)["id"]]
+    return lambda i: db.get_training_plan(ctx.rng.choice(plan_ids))
+
+@benchmark("latest_measurement")
+def _latest_measurement(ctx):
+    return lambda i: db.latest_measurement(ctx.client_id())
+
+@benchmark("latest_meal_plan")
+def _latest_meal_plan(ctx):
+    return lambda i: db.latest_meal_plan(ctx.client_id())
+
+@benchmark("latest_training_plan")
+def _latest_training_plan(ctx):
+    return lambda i: db.latest_training_plan(ctx.client_id())
+
+@benchmark("fetch_client_sheets(50)")
+def _sheets(ctx):
+    return lambda i: db.fetch_client_sheets(ctx.sample(50))
+
+@benchmark("client_ids", repeat=20)
+def _client_ids(ctx):
+    return lambda i: db.client_ids()
+
+@benchmark("roster_frame", repeat=10)
+def _roster_frame(ctx):
+    return lambda i: db.roster_frame()
+
+@benchmark("roster_overview", repeat=50)
+def _overview(ctx):
+    return lambda i: db.roster_overview()
+
+@benchmark("objective_progress", repeat=20)
+def _progress(ctx):
+    return lambda i: db.objective_progress()
+
+@benchmark("stale_clients")
+def _stale(ctx):
+    return lambda i: db.stale_clients()
+
+@benchmark("changes_since(500)")
+def _changes(ctx):
+    start = max(db.current_seq() - 5000, 0)
+    return lambda i: db.changes_since(start + ctx.rng.randrange(4500))
+
+# ---- db writes (each waits for its commit) ----
+
+def _new_client(i):
+    return db.create_client(name=f"Bench {i}", sex="F", age=30, height_cm=165, weight_kg=62,
+                            meals_per_day=3, created_at="2025-06-30")
+
+@benchmark("create_client", cold=False)
+def _create(ctx):
+    return _new_client
+
+@benchmark("update_client", cold=False)
+def _update(ctx):
+    return lambda i: db.update_client(ctx.client_id(), weight_kg=60 + i % 40, notes=f"bench {i}").result()
+
+@benchmark("delete_client", cold=False)
+def _delete(ctx):
+    fresh = [_new_client(-i) for i in range(1, ctx.calls + 1)]
+    return lambda i: db.delete_client(fresh.pop()).result()
+
+@benchmark("add_measurement", cold=False)
+def _add_measurement(ctx):
+    return lambda i: db.add_measurement(client_id=ctx.client_id(), date="2025-07-01",
+                                        weight_kg=70 + i % 20, body_fat_pct=22).result()
+
+@benchmark("add_meal_plan", cold=False)
+def _add_meal_plan(ctx):
+    from foods import solve_meal_items
+    items = solve_meal_items(150, 60, 250, 3)
+    return lambda i: db.add_meal_plan(client_id=ctx.client_id(), date="2025-07-01", calories=2200,
+                                      protein_g=150, fats_g=60, carbs_g=250, meals_json="[]",
+                                      objective="mantenimiento", items=items).result()
+
+@benchmark("add_training_plan", cold=False)
+def _add_training_plan(ctx):
+    return lambda i: db.add_training_plan(client_id=ctx.client_id(), date="2025-07-01", goal="Fuerza",
+                                          split="Full body", days_per_week=3, session_duration_min=60,
+                                          routine_text="bench").result()
+
+@benchmark("add_meal_plans_bulk(1000)", repeat=10, cold=False)
+def _bulk(ctx):
+    from roster import compute_roster_meal_plans
+    plans = compute_roster_meal_plans(db.roster_frame().head(1000), date="2025-07-01")
+    return lambda i: db.add_meal_plans_bulk(plans).result()
+
+# ---- PDF ----
+
+@benchmark("build_client_pdf", group="pdf", repeat=50)
+def _pdf(ctx):
+    from pdf_utils import build_client_pdf
+    # Distinct clients, so every call misses the PDF cache.
+    ids = ctx.sample(ctx.calls)
+    return lambda i: build_client_pdf(ids[i % len(ids)])
+
+@benchmark("render_progress_report", group="pdf", repeat=20)
+def _report(ctx):
+    from pdf_utils import render_progress_report
+    ids = ctx.sample(ctx.calls)
+    return lambda i: render_progress_report(ids[i % len(ids)])
+
+# ---- GS preset ----
+
+@benchmark("mifflin_st_jeor", group="gs_preset", repeat=20000, cold=False)
+def _mifflin(ctx):
+    from gs_preset import mifflin_st_jeor
+    return lambda i: mifflin_st_jeor(60 + i % 50, 150 + i % 40, 20 + i % 50, "MF"[i % 2], "moderado")
+
+@benchmark("build_gs_meal_plan", group="gs_preset", repeat=20000, cold=False)
+def _gs_plan(ctx):
+    from gs_preset import build_gs_meal_plan
+    return lambda i: build_gs_meal_plan(1800 + i % 1500, "pérdida de grasa", 3 + i % 3)
+
+@benchmark("solve_meal_items", group="gs_preset", repeat=500, cold=False)
+def _solve(ctx):
+    from foods import solve_meal_items
+    return lambda i: solve_meal_items(100 + i % 100, 50 + i % 40, 150 + i % 200, 3 + i % 3, "Medio")
+
+@benchmark("compute_roster_meal_plans", group="gs_preset", repeat=10, cold=False)
+def _roster(ctx):
+    from roster import compute_roster_meal_plans
+    frame = db.roster_frame()
+    return lambda i: compute_roster_meal_plans(frame)
+
+# ---- Runner ----
+
+def _measure(spec, call, repeat: int) -> dict:
+    call(-1)  # warm-up: imports, statement cache, first page reads
+    times = []
+    for i in range(repeat):
+        if spec["cold"]:
+            db.clear_cache()
+        start = time.perf_counter()
+        call(i)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        for i in range(min(repeat, MEMORY_CALLS)):
+            if spec["cold"]:
+                db.clear_cache()
+            call(repeat + i)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    total = sum(times)
+    return {
+        "group": spec["group"],
+        "n": repeat,
+        "p50_ms": round(percentile(times, 50) * 1000, 4),
+        "p95_ms": round(percentile(times, 95) * 1000, 4),
+        "mean_ms": round(total / repeat * 1000, 4),
+        "ops_per_s": round(repeat / total, 1) if total else None,
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+def _copy_db(source: str, dest: str):
+    src = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+    dst = sqlite3.connect(dest)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+
+def run(source: str, seed: int = 0, pattern: str = None, scale: float = 1.0, progress=None) -> dict:
+    source = os.path.abspath(source)
+    names = [n for n in _BENCHMARKS if not pattern or re.search(pattern, n)]
+    workdir = tempfile.mkdtemp(prefix="gs-bench-")
+    cwd = os.getcwd()
+    try:
+        path = os.path.join(workdir, "bench.db")
+        _copy_db(source, path)
+        os.chdir(workdir)  # build_client_pdf writes into the current directory
+        results = {}
+        with db.use_database(path):
+            db.init_db(path)
+            ctx = Context(seed)
+            meta = {
+                "source": os.path.basename(source),
+                "clients": len(ctx.ids),
+                "seed": seed,
+                "scale": scale,
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+            }
+            for name in names:
+                spec = _BENCHMARKS[name]
+                repeat = max(int(spec["repeat"] * scale), 1)
+                ctx.calls = repeat + MEMORY_CALLS + 1
+                results[name] = _measure(spec, spec["make"](ctx), repeat)
+                if progress:
+                    progress(name, results[name])
+        db.close_writers()
+        db.close_pools()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {"meta": meta, "results": results}
+
+def compare(report: dict, baseline: dict, tolerance: float = TOLERANCE) -> list:
+    # (name, metric, baseline ms, current ms) for every regression.
+    regressions = []
+    for name, cur in report["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            if cur[metric] > base[metric] * (1 + tolerance) and cur[metric] - base[metric] > NOISE_FLOOR_MS:
+                regressions.append((name, metric, base[metric], cur[metric]))
+    return regressions
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmarks de GS sobre una base sintética")
+    parser.add_argument("--db", required=True, help="base generada con python -m bench.generate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--filter", help="regex sobre los nombres de benchmark")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplica las repeticiones")
+    parser.add_argument("--out", help="escribe el reporte JSON aquí (si no, a stdout)")
+    parser.add_argument("--baseline", help="reporte JSON contra el que comparar")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--save", help="guarda este reporte como nueva línea base")
+    args = parser.parse_args()
+
+    def show(name, res):
+        print(f"{name:32} p50 {res['p50_ms']:9.3f} ms  p95 {res['p95_ms']:9.3f} ms  "
+              f"{res['ops_per_s'] or 0:10.1f}/s  {res['peak_kib']:9.1f} KiB", file=sys.stderr)
+
+    report = run(args.db, args.seed, args.filter, args.scale, progress=show)
+    text = json.dumps(report, indent=1, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            f.write(text)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("clients") != report["meta"]["clients"]:
+            print(f"Aviso: la línea base es de {baseline['meta'].get('clients')} clientes, "
+                  f"esta corrida de {report['meta']['clients']}.", file=sys.stderr)
+        regressions = compare(report, baseline, args.tolerance)
+        for name, metric, before, now in regressions:
+            print(f"REGRESIÓN {name} {metric}: {before:.3f} -> {now:.3f} ms", file=sys.stderr)
+        if regressions:
+            raise SystemExit(1)
+        print("Sin regresiones frente a la línea base.", file=sys.stderr)
@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+import db
+
+# Bulk "Ficha de cliente" export: client ids are split into small chunks,
+# each chunk is fetched with one query and rendered in a worker process, and
+# finished PDFs are written into the ZIP as soon as their chunk completes.
+# Only a few chunks are in flight at a time, so memory stays flat no matter
+# how many clients are exported.
+
+CHUNK_SIZE = 8
+
+def pdf_filename(client_id: int) -> str:
+    return f"FichaCliente_{client_id}.pdf"
+
+def _render_chunk(db_path: str, client_ids, include_meal: bool, include_train: bool, today: str):
+    # Runs in a worker process.
+    db.set_database(db_path)
+    from pdf_utils import render_client_sheet
+    out = []
+    for sheet in db.fetch_client_sheets(client_ids):
+        meal = sheet["meal"] if include_meal else None
+        items = sheet["items"] if include_meal else []
+        train = sheet["train"] if include_train else None
+        out.append((sheet["client"].id, render_client_sheet(sheet["client"], meal, items, train, today)))
+    return out
+
+def export_zip(out, client_ids, include_meal=True, include_train=True,
+               workers: int = None, chunk_size: int = CHUNK_SIZE, progress=None) -> int:
+    # out: path or binary file object. progress(done, total) is called from
+    # this thread after each chunk. Returns the number of PDFs written.
+    client_ids = list(client_ids)
+    total = len(client_ids)
+    workers = workers or os.cpu_count() or 1
+    chunks = [client_ids[i:i + chunk_size] for i in range(0, total, chunk_size)]
+    today = datetime.now().strftime("%Y-%m-%d")
+    db_path = db.current_path()  # the caller's tenant; workers start with no context
+    done = 0
+    if progress:
+        progress(done, total)
+    # spawn: forking a process that runs the db writer thread is not safe.
+    ctx = multiprocessing.get_context("spawn")
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        pending = set()
+        next_chunk = 0
+        while next_chunk < len(chunks) or pending:
+            while next_chunk < len(chunks) and len(pending) < 2 * workers:
+                pending.add(pool.submit(_render_chunk, db_path, chunks[next_chunk],
+                                        include_meal, include_train, today))
+                next_chunk += 1
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                for client_id, pdf in fut.result():
+                    zf.writestr(pdf_filename(client_id), pdf)
+                    done += 1
+                if progress:
+                    progress(done, total)
+    return done
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Exporta fichas PDF de muchos clientes a un ZIP")
+    parser.add_argument("--out", default="fichas_clientes.zip")
+    parser.add_argument("--search", help="filtro de búsqueda (como el cuadro «Buscar»)")
+    parser.add_argument("--ids", help="ids separados por coma")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--no-meal", action="store_true")
+    parser.add_argument("--no-train", action="store_true")
+    parser.add_argument("--tenant", default=db.DEFAULT_TENANT, help="gimnasio (por defecto GS_TENANT)")
+    args = parser.parse_args()
+
+    db.set_tenant(args.tenant)
+    db.init_db()
+    if args.ids:
+        ids = [int(i) for i in args.ids.split(",") if i.strip()]
+    else:
+        ids = db.client_ids(args.search)
+
+    def report(done, total):
+        print(f"\r{done}/{total} fichas", end="", flush=True)
+
+    n = export_zip(args.out, ids, include_meal=not args.no_meal, include_train=not args.no_train,
+                   workers=args.workers, progress=report)
+    print(f"\n{n} fichas en {os.path.abspath(args.out)}")
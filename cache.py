@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+
+# Process-wide read-through cache for db.py queries. Entries carry tags
+# (e.g. ("measurements", 12)) and writes invalidate exactly the tags they
+# touch once their transaction has committed.
+#
+# Loads race with invalidations: a reader may fetch rows just before a write
+# commits and try to store them just after. Every tag has a generation
+# number; a load is only stored if none of its tags was invalidated while it
+# was running, so stale rows never land in the cache.
+
+class QueryCache:
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (tags, value)
+        self._tag_keys = {}            # tag -> set of keys
+        self._generations = {}         # tag -> int
+        self._epoch = 0                # bumped by clear()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_or_load(self, key, tags, loader):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            snapshot = self._snapshot(tags)
+        value = loader()
+        with self._lock:
+            if snapshot == self._snapshot(tags):
+                self._store(key, tags, value)
+        return value
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+                for key in self._tag_keys.pop(tag, ()):
+                    if self._drop(key):
+                        self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._tag_keys.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _snapshot(self, tags):
+        return (self._epoch,) + tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def _store(self, key, tags, value):
+        self._drop(key)
+        self._entries[key] = (tags, value)
+        for tag in tags:
+            self._tag_keys.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        for tag in entry[0]:
+            keys = self._tag_keys.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_keys[tag]
+        return True
@@ -1,18 +1,368 @@
 
+import atexit
+import contextvars
+import importlib
+import os
+import queue
+import re
 import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from sqlite3 import Connection
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
+from cache import QueryCache
+from models import Client, Measurement, MealPlan, MealItem, TrainingPlan, names, columns, record
+import perf
 
-DB_PATH = "client_app.db"
+DB_PATH = os.environ.get("GS_DB_PATH", "client_app.db")
 
-def get_conn() -> Connection:
-    conn = sqlite3.connect(DB_PATH)
+# Tenants (coaches/gyms) each get their own SQLite file under TENANTS_DIR,
+# with their own pool, writer thread and lazy migration. The active database
+# is per context (each Streamlit session runs in its own thread), so one
+# tenant's bulk work never holds another tenant's write lock. Without a
+# tenant, DB_PATH is used as before.
+TENANTS_DIR = os.environ.get("GS_TENANTS_DIR", "tenants")
+DEFAULT_TENANT = os.environ.get("GS_TENANT") or None
+_TENANT_NAME = re.compile(r"^[a-z0-9][a-z0-9_-]{0,62}$")
+_current_db = contextvars.ContextVar("gs_db_path", default=None)
+
+def tenant_path(tenant: str) -> str:
+    if not _TENANT_NAME.match(tenant or ""):
+        raise ValueError(f"Nombre de gimnasio inválido: {tenant!r} (minúsculas, dígitos, - y _).")
+    return os.path.join(TENANTS_DIR, f"{tenant}.db")
+
+def current_path() -> str:
+    path = _current_db.get()
+    if path is None:
+        path = tenant_path(DEFAULT_TENANT) if DEFAULT_TENANT else DB_PATH
+    return path
+
+def set_tenant(tenant: str = None):
+    # Routes this context's db calls to tenant's file (None: GS_TENANT or DB_PATH).
+    _current_db.set(tenant_path(tenant) if tenant else None)
+
+def set_database(path: str = None):
+    # Routes this context's db calls to an explicit file (worker processes).
+    _current_db.set(path)
+
+@contextmanager
+def use_database(path: str):
+    token = _current_db.set(path)
+    try:
+        yield
+    finally:
+        _current_db.reset(token)
+
+def use_tenant(tenant: str):
+    return use_database(tenant_path(tenant))
+
+def list_tenants() -> list:
+    if not os.path.isdir(TENANTS_DIR):
+        return []
+    names = [f[:-3] for f in os.listdir(TENANTS_DIR) if f.endswith(".db")]
+    return sorted(n for n in names if _TENANT_NAME.match(n))
+
+def create_tenant(tenant: str) -> int:
+    return init_db(tenant_path(tenant))
+
+# Connection tuning. Connections are long-lived, so the statement cache
+# actually pays off across reruns.
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+POOL_SIZE = 8
+QUERY_CACHE_SIZE = 512
+# Group commit: writes arriving within this window share one transaction.
+WRITE_BATCH_WINDOW_S = 0.002
+WRITE_BATCH_MAX = 256
+
+def get_conn(path: str = None) -> Connection:
+    conn = sqlite3.connect(
+        path or current_path(),
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=False,  # pooled connections move between Streamlit script threads
+        factory=perf.connection_factory(),  # timed statements with GS_PERF=1
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA foreign_keys=ON")
     return conn
 
-def init_db():
-    conn = get_conn()
+class ConnectionPool:
+    # Process-wide pool of long-lived connections to one database file.
+    # A connection is only ever used by one thread at a time: it is checked
+    # out for the duration of a call and handed back afterwards.
+
+    def __init__(self, path: str, size: int = POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = get_conn(self.path)
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def _release(self, conn: Connection):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            return
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(path: str = None) -> ConnectionPool:
+    path = path or current_path()
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(path, ConnectionPool(path))
+    return pool
+
+@contextmanager
+def pooled_conn():
+    path = current_path()
+    if path not in _initialized:
+        init_db(path)
+    with get_pool(path).connection() as conn:
+        yield conn
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+atexit.register(close_pools)
+
+class WriteQueue:
+    # Single writer per database file. A background thread owns the only
+    # write connection; any session can submit a job (a callable taking the
+    # connection) and gets a Future back with the job's return value -- the
+    # lastrowid for inserts, the rowcount for updates/deletes -- or its error.
+    # Jobs must not commit themselves. Jobs arriving within
+    # WRITE_BATCH_WINDOW_S are committed together, each inside its own
+    # savepoint so one failing job does not take the batch down with it.
+    # on_commit receives the cache tags of the jobs that committed.
+
+    def __init__(self, path: str, on_commit=None):
+        self.path = path
+        self.on_commit = on_commit
+        self._jobs = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, tags=()) -> Future:
+        fut = Future()
+        self._ensure_started()
+        self._jobs.put((fn, fut, tags, time.perf_counter()))
+        return fut
+
+    def close(self, timeout: float = 5.0):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._jobs.put(None)
+            thread.join(timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name=f"db-writer:{self.path}", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        conn = get_conn(self.path)
+        conn.isolation_level = None  # transactions are managed explicitly below
+        try:
+            stop = False
+            while not stop:
+                job = self._jobs.get()
+                if job is None:
+                    break
+                batch = [job]
+                deadline = time.monotonic() + WRITE_BATCH_WINDOW_S
+                while len(batch) < WRITE_BATCH_MAX:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        job = self._jobs.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if job is None:
+                        stop = True
+                        break
+                    batch.append(job)
+                self._commit_batch(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit_batch(self, conn: Connection, batch):
+        outcomes = []
+        try:
+            start = time.perf_counter()
+            conn.execute("BEGIN IMMEDIATE")
+            if perf.ENABLED:
+                perf.record_write_waits([start - job[3] for job in batch], time.perf_counter() - start)
+            for fn, fut, tags, _ in batch:
+                if not fut.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT job")
+                try:
+                    result = fn(conn)
+                except Exception as exc:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    outcomes.append((fut, None, exc, ()))
+                else:
+                    conn.execute("RELEASE job")
+                    outcomes.append((fut, result, None, tags))
+            conn.execute("COMMIT")
+        except sqlite3.Error as exc:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, fut, _, _ in batch:
+                if not fut.done():
+                    fut.set_exception(exc)
+            return
+        if self.on_commit is not None:
+            self.on_commit(*[tag for _, _, _, tags in outcomes for tag in tags])
+        for fut, result, exc, _ in outcomes:
+            if exc is not None:
+                fut.set_exception(exc)
+            else:
+                fut.set_result(result)
+
+_writers = {}
+_cache = QueryCache(QUERY_CACHE_SIZE)
+
+def _cached(kind: str, arg, tags, loader):
+    # Read-through lookup shared by all sessions of the process. Callers get
+    # their own copy of DataFrames so the cached one can't be mutated.
+    # Keys and tags include the database path, so tenants never share entries.
+    path = current_path()
+    value = _cache.get_or_load((path, kind, arg), [(path,) + tag for tag in tags], loader)
+    return _copy(value)
+
+def _copy(value):
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(_copy(v) for v in value)
+    if isinstance(value, list):
+        return list(value)
+    return value
+
+def cache_stats() -> dict:
+    return _cache.stats()
+
+def clear_cache():
+    _cache.clear()
+
+def read_df_cached(kind: str, arg, tags, query: str, params=()) -> pd.DataFrame:
+    # Cached read for modules that build their own queries (e.g. analytics).
+    return _cached(kind, arg, tags, lambda: _read_df(query, params))
+
+def invalidate_cache(*tags):
+    # For writers that only learn what they touched inside their job; call
+    # after the job's Future has resolved.
+    path = current_path()
+    _cache.invalidate(*[(path,) + tag for tag in tags])
+
+def get_writer(path: str = None) -> WriteQueue:
+    path = path or current_path()
+    writer = _writers.get(path)
+    if writer is None:
+        with _pools_lock:
+            writer = _writers.setdefault(path, WriteQueue(path, on_commit=_cache.invalidate))
+    return writer
+
+def submit_write(fn, invalidates=()) -> Future:
+    # invalidates: cache tags such as ("measurements", client_id) that the job
+    # changes; they are dropped from the query cache right after the commit.
+    path = current_path()
+    if path not in _initialized:
+        init_db(path)
+    return get_writer(path).submit(fn, [(path,) + tag for tag in invalidates])
+
+def close_writers():
+    with _pools_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
+atexit.register(close_writers)
+
+def _fetchone(query: str, params=()):
+    with pooled_conn() as conn:
+        return conn.execute(query, params).fetchone()
+
+def _fetch_record(model, query: str, params=()):
+    # One typed row (models.py) or None. Plain tuples instead of sqlite3.Row.
+    with pooled_conn() as conn:
+        cur = conn.cursor()
+        cur.row_factory = None
+        return record(model, cur.execute(query, params).fetchone())
+
+def _read_df(query: str, params=()) -> pd.DataFrame:
+    with pooled_conn() as conn:
+        return pd.read_sql_query(query, conn, params=params)
+
+_initialized = set()
+
+def init_db(path: str = None):
+    # Cheap after the first call: Streamlit reruns app.py on every click, but
+    # the schema only needs checking once per process and database file.
+    # pooled_conn()/submit_write() call it on first use of each file, so
+    # tenants are created and migrated lazily.
+    path = path or current_path()
+    if path in _initialized:
+        return SCHEMA_VERSION
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with get_pool(path).connection() as conn:
+        version = schema_version(conn)
+    if version != SCHEMA_VERSION:
+        version = get_writer(path).submit(migrate).result()
+        _cache.clear()
+    _initialized.add(path)
+    return version
+
+def _migration_1_base_schema(conn: Connection):
     cur = conn.cursor()
     cur.execute("""
         CREATE TABLE IF NOT EXISTS clients (
@@ -82,30 +432,305 @@ def init_db():
             FOREIGN KEY(client_id) REFERENCES clients(id) ON DELETE CASCADE
         )
     """)
-    conn.commit()
-    conn.close()
 
-def create_client(**kwargs) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
-    fields = [
-        "name","sex","age","height_cm","weight_kg","skinfolds","body_fat_pct",
-        "muscle_pct","visceral_fat","preferred_foods","meals_per_day","allergies",
-        "economic_level","occupation","notes","created_at"
-    ]
+def _migration_2_indexes(conn: Connection):
+    # Per-client history views filter on client_id and sort by date DESC.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_measurements_client_date ON measurements(client_id, date DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_meal_plans_client_date ON meal_plans(client_id, date DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_training_plans_client_date ON training_plans(client_id, date DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_clients_created_at ON clients(created_at)")
+
+# Accent folding for the trigram name index. It is done with plain SQL
+# replace() so the triggers work from any connection, and _fold() applies the
+# exact same mapping to search terms.
+# Limited to Spanish letters: SQLite's parser stack can't take many more
+# nested replace() calls.
+_ACCENTED = "áéíóúüñÁÉÍÓÚÜÑ"
+_UNACCENTED = "aeiouunaeiouun"
+_FOLD_TABLE = str.maketrans(_ACCENTED, _UNACCENTED)
+
+def _fold(text: str) -> str:
+    return (text or "").translate(_FOLD_TABLE).lower()
+
+def _fold_sql(expr: str) -> str:
+    for accented, plain in zip(_ACCENTED, _UNACCENTED):
+        expr = f"replace({expr}, '{accented}', '{plain}')"
+    return f"lower({expr})"
+
+_FTS_COLUMNS = ["name", "occupation", "notes", "preferred_foods", "allergies"]
+
+def _migration_3_client_search(conn: Connection):
+    # Ranked, accent-insensitive search over the free-text client columns,
+    # plus a trigram index over folded names for typo-tolerant fallback.
+    cols = ", ".join(_FTS_COLUMNS)
+    new_cols = ", ".join(f"new.{c}" for c in _FTS_COLUMNS)
+    old_cols = ", ".join(f"old.{c}" for c in _FTS_COLUMNS)
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS clients_fts USING fts5(
+            {cols},
+            content='clients', content_rowid='id',
+            tokenize="unicode61 remove_diacritics 2", prefix='2 3'
+        )
+    """)
+    # Name matches weigh most; ORDER BY rank then uses these weights.
+    conn.execute("INSERT INTO clients_fts(clients_fts, rank) VALUES('rank', 'bm25(10.0, 2.0, 1.0, 1.0, 1.0)')")
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS clients_name_trgm USING fts5(name, tokenize='trigram')")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS clients_search_ai AFTER INSERT ON clients BEGIN
+            INSERT INTO clients_fts(rowid, {cols}) VALUES (new.id, {new_cols});
+            INSERT INTO clients_name_trgm(rowid, name) VALUES (new.id, {_fold_sql("new.name")});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS clients_search_ad AFTER DELETE ON clients BEGIN
+            INSERT INTO clients_fts(clients_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+            DELETE FROM clients_name_trgm WHERE rowid = old.id;
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS clients_search_au AFTER UPDATE ON clients BEGIN
+            INSERT INTO clients_fts(clients_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+            INSERT INTO clients_fts(rowid, {cols}) VALUES (new.id, {new_cols});
+            DELETE FROM clients_name_trgm WHERE rowid = old.id;
+            INSERT INTO clients_name_trgm(rowid, name) VALUES (new.id, {_fold_sql("new.name")});
+        END
+    """)
+    conn.execute("INSERT INTO clients_fts(clients_fts) VALUES('rebuild')")
+    conn.execute("DELETE FROM clients_name_trgm")
+    conn.execute(f"INSERT INTO clients_name_trgm(rowid, name) SELECT id, {_fold_sql('name')} FROM clients")
+
+def _migration_4_external_ids(conn: Connection):
+    # Ids from other systems (gym software, spreadsheets) used by bulk imports.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS client_external_ids (
+            external_id TEXT PRIMARY KEY,
+            client_id INTEGER NOT NULL,
+            FOREIGN KEY(client_id) REFERENCES clients(id) ON DELETE CASCADE
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_client_external_ids_client ON client_external_ids(client_id)")
+
+# Per-client roster summary for the "Resumen" page. Triggers keep it current
+# on every insert, so the dashboard reads one small row per client instead of
+# aggregating the whole history. Edits or deletes of past measurements and
+# plans are not tracked; rebuild_client_summary() recomputes it from scratch.
+_SQL_REBUILD_CLIENT_SUMMARY = """
+    INSERT INTO client_summary (
+        client_id, name, measurement_count,
+        first_date, first_weight_kg, first_body_fat_pct,
+        last_date, last_weight_kg, last_body_fat_pct,
+        plan_date, plan_calories, plan_objective
+    )
+    SELECT c.id, c.name, COALESCE(n.count, 0),
+           f.date, f.weight_kg, f.body_fat_pct,
+           l.date, l.weight_kg, l.body_fat_pct,
+           p.date, p.calories, p.objective
+    FROM clients c
+    LEFT JOIN (SELECT client_id, COUNT(*) AS count FROM measurements GROUP BY client_id) n
+        ON n.client_id = c.id
+    LEFT JOIN (SELECT client_id, date, weight_kg, body_fat_pct,
+                      ROW_NUMBER() OVER (PARTITION BY client_id ORDER BY date, id) AS rn
+               FROM measurements) f
+        ON f.client_id = c.id AND f.rn = 1
+    LEFT JOIN (SELECT client_id, date, weight_kg, body_fat_pct,
+                      ROW_NUMBER() OVER (PARTITION BY client_id ORDER BY date DESC, id DESC) AS rn
+               FROM measurements) l
+        ON l.client_id = c.id AND l.rn = 1
+    LEFT JOIN (SELECT client_id, date, calories, objective,
+                      ROW_NUMBER() OVER (PARTITION BY client_id ORDER BY date DESC, id DESC) AS rn
+               FROM meal_plans) p
+        ON p.client_id = c.id AND p.rn = 1
+"""
+
+def _rebuild_client_summary(conn: Connection) -> int:
+    conn.execute("DELETE FROM client_summary")
+    return conn.execute(_SQL_REBUILD_CLIENT_SUMMARY).rowcount
+
+def _migration_5_client_summary(conn: Connection):
+    # The objective used to live only inside meal_plans.notes
+    # ("Objetivo: X. ..."); give it a column so it can be aggregated.
+    conn.execute("ALTER TABLE meal_plans ADD COLUMN objective TEXT")
+    conn.execute("""
+        UPDATE meal_plans SET objective = substr(notes, 11, instr(notes, '.') - 11)
+        WHERE notes LIKE 'Objetivo: %.%'
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS client_summary (
+            client_id INTEGER PRIMARY KEY,
+            name TEXT,
+            measurement_count INTEGER NOT NULL DEFAULT 0,
+            first_date TEXT,
+            first_weight_kg REAL,
+            first_body_fat_pct REAL,
+            last_date TEXT,
+            last_weight_kg REAL,
+            last_body_fat_pct REAL,
+            plan_date TEXT,
+            plan_calories INTEGER,
+            plan_objective TEXT,
+            FOREIGN KEY(client_id) REFERENCES clients(id) ON DELETE CASCADE
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_client_summary_last_date ON client_summary(last_date)")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS client_summary_clients_ai AFTER INSERT ON clients BEGIN
+            INSERT OR IGNORE INTO client_summary (client_id, name) VALUES (new.id, new.name);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS client_summary_clients_au AFTER UPDATE OF name ON clients BEGIN
+            UPDATE client_summary SET name = new.name WHERE client_id = new.id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS client_summary_clients_ad AFTER DELETE ON clients BEGIN
+            DELETE FROM client_summary WHERE client_id = old.id;
+        END
+    """)
+    # SET expressions all see the row as it was before the update, so the
+    # "first" columns compare against the old first_date. Ties on date go to
+    # the earliest insert for "first" and the latest for "last", as in the
+    # rebuild query.
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS client_summary_measurements_ai AFTER INSERT ON measurements BEGIN
+            UPDATE client_summary SET
+                measurement_count = measurement_count + 1,
+                first_date = CASE WHEN first_date IS NULL OR new.date < first_date THEN new.date ELSE first_date END,
+                first_weight_kg = CASE WHEN first_date IS NULL OR new.date < first_date THEN new.weight_kg ELSE first_weight_kg END,
+                first_body_fat_pct = CASE WHEN first_date IS NULL OR new.date < first_date THEN new.body_fat_pct ELSE first_body_fat_pct END,
+                last_date = CASE WHEN last_date IS NULL OR new.date >= last_date THEN new.date ELSE last_date END,
+                last_weight_kg = CASE WHEN last_date IS NULL OR new.date >= last_date THEN new.weight_kg ELSE last_weight_kg END,
+                last_body_fat_pct = CASE WHEN last_date IS NULL OR new.date >= last_date THEN new.body_fat_pct ELSE last_body_fat_pct END
+            WHERE client_id = new.client_id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS client_summary_meal_plans_ai AFTER INSERT ON meal_plans BEGIN
+            UPDATE client_summary SET
+                plan_date = new.date, plan_calories = new.calories, plan_objective = new.objective
+            WHERE client_id = new.client_id AND (plan_date IS NULL OR new.date >= plan_date);
+        END
+    """)
+    _rebuild_client_summary(conn)
+
+def _migration_6_meal_items(conn: Connection):
+    # Foods and grams per meal of a plan (see foods.solve_meal_items).
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS meal_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            meal_plan_id INTEGER NOT NULL,
+            meal_index INTEGER NOT NULL,
+            meal_name TEXT,
+            food TEXT NOT NULL,
+            grams REAL,
+            protein_g REAL,
+            fats_g REAL,
+            carbs_g REAL,
+            calories INTEGER,
+            FOREIGN KEY(meal_plan_id) REFERENCES meal_plans(id) ON DELETE CASCADE
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_meal_items_plan ON meal_items(meal_plan_id, meal_index)")
+
+SYNC_TABLES = ("clients", "measurements", "meal_plans", "training_plans")
+
+def _migration_7_change_log(conn: Connection):
+    # One row per changed row of the synced tables. INSERT OR REPLACE moves a
+    # row's entry to a new seq on every change, so the log stays as large as
+    # the tables (plus tombstones) and a pull since a cursor returns each
+    # changed row once. SQLite allows a single writer at a time, so entries
+    # commit in seq order and a cursor never skips a late commit.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tbl TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (tbl, row_id)
+        )
+    """)
+    for table in SYNC_TABLES:
+        conn.execute(f"INSERT OR IGNORE INTO change_log (tbl, row_id) SELECT '{table}', id FROM {table} ORDER BY id")
+        for event, ref, deleted in (("INSERT", "new", 0), ("UPDATE", "new", 0), ("DELETE", "old", 1)):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS change_log_{table}_{event.lower()} AFTER {event} ON {table} BEGIN
+                    INSERT OR REPLACE INTO change_log (tbl, row_id, deleted) VALUES ('{table}', {ref}.id, {deleted});
+                END
+            """)
+    # Idempotency keys of measurements pushed by tablets (see sync.py).
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sync_receipts (
+            key TEXT PRIMARY KEY,
+            device_id TEXT,
+            status TEXT NOT NULL,
+            measurement_id INTEGER,
+            detail TEXT,
+            received_at TEXT NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+def _migration_8_history_tiebreak(conn: Connection):
+    # Several rows can share a date (a plan regenerated the same day); the
+    # newest is the one with the highest id, as in client_summary. Index
+    # entries with equal keys come back in ascending rowid order, so "latest"
+    # lookups need id in the key: these replace the migration 2 indexes.
+    for table in ("measurements", "meal_plans", "training_plans"):
+        conn.execute(f"DROP INDEX IF EXISTS idx_{table}_client_date")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_client_date_id "
+                     f"ON {table}(client_id, date DESC, id DESC)")
+
+# Ordered schema migrations. The applied version lives in PRAGMA user_version;
+# append new steps at the end and never edit one that has shipped.
+MIGRATIONS = [
+    (1, _migration_1_base_schema),
+    (2, _migration_2_indexes),
+    (3, _migration_3_client_search),
+    (4, _migration_4_external_ids),
+    (5, _migration_5_client_summary),
+    (6, _migration_6_meal_items),
+    (7, _migration_7_change_log),
+    (8, _migration_8_history_tiebreak),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(conn: Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn: Connection) -> int:
+    # Runs inside a single writer job, so a failing step rolls back every
+    # step applied in this call together with its version bump.
+    current = schema_version(conn)
+    if current > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"La base está en la versión {current}, más nueva que esta app ({SCHEMA_VERSION})."
+        )
+    for version, step in MIGRATIONS:
+        if version > current:
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            current = version
+    return current
+
+def _insert(conn: Connection, table: str, fields, kwargs) -> int:
     values = [kwargs.get(f) for f in fields]
-    cur.execute(
-        f"INSERT INTO clients ({', '.join(fields)}) VALUES ({', '.join(['?']*len(fields))})",
+    cur = conn.execute(
+        f"INSERT INTO {table} ({', '.join(fields)}) VALUES ({', '.join(['?']*len(fields))})",
         values,
     )
-    conn.commit()
-    new_id = cur.lastrowid
-    conn.close()
-    return new_id
+    return cur.lastrowid
 
-def update_client(client_id: int, **kwargs):
-    conn = get_conn()
-    cur = conn.cursor()
+CLIENT_FIELDS = [
+    "name","sex","age","height_cm","weight_kg","skinfolds","body_fat_pct",
+    "muscle_pct","visceral_fat","preferred_foods","meals_per_day","allergies",
+    "economic_level","occupation","notes","created_at"
+]
+
+def create_client(**kwargs) -> int:
+    return submit_write(
+        lambda conn: _insert(conn, "clients", CLIENT_FIELDS, kwargs), invalidates=[("clients",)]
+    ).result()
+
+def update_client(client_id: int, **kwargs) -> Future:
     allowed = [
         "name","sex","age","height_cm","weight_kg","skinfolds","body_fat_pct",
         "muscle_pct","visceral_fat","preferred_foods","meals_per_day","allergies",
@@ -117,108 +742,662 @@ def update_client(client_id: int, **kwargs):
             sets.append(f"{k} = ?")
             vals.append(kwargs[k])
     vals.append(client_id)
-    if sets:
-        cur.execute(f"UPDATE clients SET {', '.join(sets)} WHERE id = ?", vals)
-        conn.commit()
-    conn.close()
+    if not sets:
+        fut = Future()
+        fut.set_result(None)
+        return fut
+    query = f"UPDATE clients SET {', '.join(sets)} WHERE id = ?"
+    return submit_write(
+        lambda conn: conn.execute(query, vals).rowcount,
+        invalidates=[("clients",), ("client", client_id)],
+    )
 
-def delete_client(client_id: int):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM clients WHERE id = ?", (client_id,))
-    conn.commit()
-    conn.close()
+# Everything cached per client; deleting a client cascades to all of it.
+_CLIENT_TAG_KINDS = ["client", "measurements", "meal_plans", "training_plans"]
+
+def delete_client(client_id: int) -> Future:
+    return submit_write(
+        lambda conn: conn.execute("DELETE FROM clients WHERE id = ?", (client_id,)).rowcount,
+        invalidates=[("clients",)] + [(kind, client_id) for kind in _CLIENT_TAG_KINDS],
+    )
+
+_SQL_LIST_CLIENTS = "SELECT * FROM clients ORDER BY created_at DESC"
+_SQL_SEARCH_CLIENTS = (
+    "SELECT c.* FROM clients_fts JOIN clients c ON c.id = clients_fts.rowid "
+    "WHERE clients_fts MATCH ? ORDER BY clients_fts.rank"
+)
+_SQL_SEARCH_NAMES_TRGM = (
+    "SELECT rowid, name FROM clients_name_trgm WHERE clients_name_trgm MATCH ? "
+    "ORDER BY rank LIMIT ?"
+)
+_SQL_GET_CLIENT = f"SELECT {columns(Client)} FROM clients WHERE id = ?"
+_SQL_COUNT_CLIENTS = "SELECT COUNT(*) FROM clients"
+_SQL_CLIENTS_BY_IDS = "SELECT {cols} FROM clients WHERE id IN ({marks})"
+_SQL_SEARCH_CLIENTS_PAGE = (
+    "SELECT {cols} FROM clients_fts JOIN clients c ON c.id = clients_fts.rowid "
+    "WHERE clients_fts MATCH ? ORDER BY clients_fts.rank LIMIT ? OFFSET ?"
+)
+_SQL_HAS_FTS_MATCH = "SELECT 1 FROM clients_fts WHERE clients_fts MATCH ? LIMIT 1"
+_SQL_CLIENT_DIRECTORY = "SELECT id, name FROM clients WHERE id < ? ORDER BY id DESC LIMIT ?"
+_SQL_CLIENTS_FIRST_PAGE = (
+    "SELECT {cols}, created_at AS _k1 FROM clients ORDER BY created_at DESC, id DESC LIMIT ?"
+)
+_SQL_CLIENTS_NEXT_PAGE = (
+    "SELECT {cols}, created_at AS _k1 FROM clients WHERE (created_at, id) < (?, ?) "
+    "ORDER BY created_at DESC, id DESC LIMIT ?"
+)
+_SQL_GET_MEASUREMENTS = "SELECT * FROM measurements WHERE client_id = ? ORDER BY date DESC, id DESC"
+_SQL_LIST_MEAL_PLANS = (
+    "SELECT id, date, calories, protein_g, fats_g, carbs_g, objective, notes FROM meal_plans "
+    "WHERE client_id = ? ORDER BY date DESC, id DESC"
+)
+_SQL_LIST_TRAINING_PLANS = (
+    "SELECT id, date, goal, split, days_per_week, session_duration_min FROM training_plans "
+    "WHERE client_id = ? ORDER BY date DESC, id DESC"
+)
+# Newest by date, then by id: on a same-day tie the last row written wins,
+# as in client_summary (see _migration_8_history_tiebreak).
+_SQL_LATEST_MEASUREMENT = (
+    f"SELECT {columns(Measurement)} FROM measurements WHERE client_id = ? "
+    "ORDER BY date DESC, id DESC LIMIT 1"
+)
+_SQL_LATEST_MEAL_PLAN = (
+    f"SELECT {columns(MealPlan)} FROM meal_plans WHERE client_id = ? ORDER BY date DESC, id DESC LIMIT 1"
+)
+_SQL_LATEST_TRAINING_PLAN = (
+    f"SELECT {columns(TrainingPlan)} FROM training_plans WHERE client_id = ? "
+    "ORDER BY date DESC, id DESC LIMIT 1"
+)
+
+# Typo-tolerant name fallback: candidates sharing trigrams with the query are
+# kept when they cover at least this share of the query's trigrams.
+FUZZY_MIN_SIMILARITY = 0.5
+FUZZY_CANDIDATES = 200
+
+def _fts_query(search: str):
+    # Every word must match, as a prefix ("jos" finds "José").
+    words = re.findall(r"\w+", search)
+    return " ".join(f'"{w}"*' for w in words) or None
+
+def _trigrams(text: str) -> set:
+    grams = set()
+    for word in re.findall(r"\w+", _fold(text)):
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+def _fuzzy_client_ids(search: str):
+    grams = _trigrams(search)
+    if not grams:
+        return []
+    match = " OR ".join(f'"{g}"' for g in sorted(grams))
+    with pooled_conn() as conn:
+        rows = conn.execute(_SQL_SEARCH_NAMES_TRGM, (match, FUZZY_CANDIDATES)).fetchall()
+    scored = []
+    for row in rows:
+        score = len(grams & _trigrams(row["name"])) / len(grams)
+        if score >= FUZZY_MIN_SIMILARITY:
+            scored.append((score, row["rowid"]))
+    scored.sort(key=lambda item: -item[0])
+    return [client_id for _, client_id in scored]
+
+def search_clients(search: str) -> pd.DataFrame:
+    query = _fts_query(search)
+    if query is None:
+        return _read_df(_SQL_LIST_CLIENTS)
+    df = _read_df(_SQL_SEARCH_CLIENTS, (query,))
+    if df.empty:
+        df = _clients_by_ids(_fuzzy_client_ids(search))
+    return df
+
+def _clients_by_ids(ids, columns=None) -> pd.DataFrame:
+    # Rows for the given ids, in the order given.
+    marks = ", ".join("?" * len(ids))
+    df = _read_df(_SQL_CLIENTS_BY_IDS.format(cols=_projection(columns), marks=marks or "NULL"), ids)
+    order = {client_id: i for i, client_id in enumerate(ids)}
+    return df.sort_values("id", key=lambda col: col.map(order)).reset_index(drop=True)
 
 def list_clients(search=None) -> pd.DataFrame:
-    conn = get_conn()
-    query = "SELECT * FROM clients ORDER BY created_at DESC"
-    params = []
+    # Any client write can change a listing, so listings share the "clients" tag.
     if search:
-        query = ("SELECT * FROM clients WHERE name LIKE ? OR occupation LIKE ? OR notes LIKE ? "
-                 "ORDER BY created_at DESC")
-        like = f"%{search}%"
-        params = [like, like, like]
-    df = pd.read_sql_query(query, conn, params=params)
-    conn.close()
-    return df
+        return _cached("search_clients", search, [("clients",)], lambda: search_clients(search))
+    return _cached("list_clients", None, [("clients",)], lambda: _read_df(_SQL_LIST_CLIENTS))
 
-def get_client_by_id(client_id: int):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM clients WHERE id = ?", (client_id,))
-    row = cur.fetchone()
-    conn.close()
-    return row
+CLIENT_COLUMNS = names(Client)
 
-def add_measurement(**kwargs):
-    conn = get_conn()
-    cur = conn.cursor()
-    fields = [
-        "client_id","date","weight_kg","body_fat_pct","muscle_pct","visceral_fat",
-        "waist_cm","hip_cm","chest_cm","thigh_cm","arm_cm","notes"
-    ]
-    values = [kwargs.get(f) for f in fields]
-    cur.execute(
-        f"INSERT INTO measurements ({', '.join(fields)}) VALUES ({', '.join(['?']*len(fields))})",
-        values,
+def client_directory(before_id: int = None, limit: int = -1) -> list:
+    # Just (id, name) pairs, newest first, for selectors. Pass the last id of
+    # a page as before_id to get the next one.
+    before = before_id if before_id is not None else 2**63 - 1
+
+    def load():
+        with pooled_conn() as conn:
+            rows = conn.execute(_SQL_CLIENT_DIRECTORY, (before, limit)).fetchall()
+        return [(row["id"], row["name"]) for row in rows]
+
+    return _cached("client_directory", (before, limit), [("clients",)], load)
+
+def count_clients() -> int:
+    return _cached("count_clients", None, [("clients",)],
+                   lambda: _fetchone(_SQL_COUNT_CLIENTS)[0])
+
+def _projection(columns, prefix: str = "") -> str:
+    columns = list(columns or CLIENT_COLUMNS)
+    unknown = set(columns) - set(CLIENT_COLUMNS)
+    if unknown:
+        raise ValueError(f"Columnas desconocidas: {sorted(unknown)}")
+    if "id" not in columns:
+        columns.insert(0, "id")
+    return ", ".join(prefix + c for c in columns)
+
+def list_clients_page(columns=None, cursor=None, limit: int = 50, search=None):
+    # One page of the client table with only the requested columns.
+    # Returns (DataFrame, next_cursor); next_cursor is None on the last page.
+    # Plain listings page by (created_at, id); ranked search results have no
+    # stable key, so their cursor is an offset.
+    key = (tuple(columns or ()), cursor, limit, search)
+    return _cached("list_clients_page", key, [("clients",)],
+                   lambda: _load_clients_page(columns, cursor, limit, search))
+
+def _load_clients_page(columns, cursor, limit: int, search):
+    if search:
+        return _search_clients_page(search, columns, cursor or 0, limit)
+    cols = _projection(columns)
+    if cursor is None:
+        df = _read_df(_SQL_CLIENTS_FIRST_PAGE.format(cols=cols), (limit,))
+    else:
+        df = _read_df(_SQL_CLIENTS_NEXT_PAGE.format(cols=cols), (cursor[0], cursor[1], limit))
+    next_cursor = None
+    if len(df) == limit:
+        next_cursor = (df["_k1"].iloc[-1], int(df["id"].iloc[-1]))
+    return df.drop(columns="_k1"), next_cursor
+
+def _search_clients_page(search: str, columns, offset: int, limit: int):
+    query = _fts_query(search)
+    if query is None:
+        return _load_clients_page(columns, None, limit, None)
+    if _has_fts_match(query):
+        df = _read_df(_SQL_SEARCH_CLIENTS_PAGE.format(cols=_projection(columns, prefix="c.")),
+                      (query, limit, offset))
+    else:
+        # Typo-tolerant fallback, paged over the ranked candidate ids.
+        df = _clients_by_ids(_fuzzy_client_ids(search)[offset:offset + limit], columns)
+    next_cursor = offset + limit if len(df) == limit else None
+    return df, next_cursor
+
+def _has_fts_match(query: str) -> bool:
+    with pooled_conn() as conn:
+        return conn.execute(_SQL_HAS_FTS_MATCH, (query,)).fetchone() is not None
+
+def get_client_by_id(client_id: int) -> Client | None:
+    return _cached("get_client_by_id", client_id, [("client", client_id)],
+                   lambda: _fetch_record(Client, _SQL_GET_CLIENT, (client_id,)))
+
+MEASUREMENT_FIELDS = [
+    "client_id","date","weight_kg","body_fat_pct","muscle_pct","visceral_fat",
+    "waist_cm","hip_cm","chest_cm","thigh_cm","arm_cm","notes"
+]
+
+def add_measurement(**kwargs) -> Future:
+    return submit_write(
+        lambda conn: _insert(conn, "measurements", MEASUREMENT_FIELDS, kwargs),
+        invalidates=[("measurements", kwargs.get("client_id"))],
     )
-    conn.commit()
-    conn.close()
+
+_SQL_SAME_DAY_MEASUREMENTS = (
+    f"SELECT id, {', '.join(MEASUREMENT_FIELDS)} FROM measurements WHERE client_id = ? AND date = ?"
+)
+
+def same_day_measurements(conn: Connection, client_id: int, day: str) -> list:
+    # A client's measurements on day, id first and then MEASUREMENT_FIELDS;
+    # used inside writer jobs (sync.py's duplicate and conflict check).
+    return conn.execute(_SQL_SAME_DAY_MEASUREMENTS, (client_id, day)).fetchall()
 
 def get_measurements(client_id: int) -> pd.DataFrame:
-    conn = get_conn()
-    df = pd.read_sql_query(
-        "SELECT * FROM measurements WHERE client_id = ? ORDER BY date DESC",
-        conn,
-        params=(client_id,),
-    )
-    conn.close()
-    return df
+    return _cached("get_measurements", client_id, [("measurements", client_id)],
+                   lambda: _read_df(_SQL_GET_MEASUREMENTS, (client_id,)))
 
-def add_meal_plan(**kwargs):
-    conn = get_conn()
-    cur = conn.cursor()
-    fields = [
-        "client_id","date","calories","protein_g","fats_g","carbs_g","meals_json","notes"
-    ]
-    values = [kwargs.get(f) for f in fields]
-    cur.execute(
-        f"INSERT INTO meal_plans ({', '.join(fields)}) VALUES ({', '.join(['?']*len(fields))})",
-        values,
+def latest_measurement(client_id: int) -> Measurement | None:
+    return _cached("latest_measurement", client_id, [("measurements", client_id)],
+                   lambda: _fetch_record(Measurement, _SQL_LATEST_MEASUREMENT, (client_id,)))
+
+MEAL_PLAN_FIELDS = [
+    "client_id","date","calories","protein_g","fats_g","carbs_g","meals_json","objective","notes"
+]
+
+MEAL_ITEM_FIELDS = [
+    "meal_plan_id","meal_index","meal_name","food","grams","protein_g","fats_g","carbs_g","calories"
+]
+_SQL_INSERT_MEAL_ITEM = (
+    f"INSERT INTO meal_items ({', '.join(MEAL_ITEM_FIELDS)}) VALUES ({', '.join(['?']*len(MEAL_ITEM_FIELDS))})"
+)
+
+def add_meal_plan(items=None, **kwargs) -> Future:
+    # items: optional meal_items dicts (see foods.solve_meal_items), written in
+    # the same transaction as the plan. Resolves to the new plan id.
+    def write(conn):
+        plan_id = _insert(conn, "meal_plans", MEAL_PLAN_FIELDS, kwargs)
+        if items:
+            conn.executemany(_SQL_INSERT_MEAL_ITEM,
+                             [(plan_id,) + tuple(item.get(f) for f in MEAL_ITEM_FIELDS[1:]) for item in items])
+        return plan_id
+    return submit_write(write, invalidates=[("meal_plans", kwargs.get("client_id"))])
+
+def add_meal_plans_bulk(rows) -> Future:
+    # rows: DataFrame or iterable of dicts with MEAL_PLAN_FIELDS. Everything
+    # is inserted with one executemany in a single transaction; the Future
+    # resolves to the number of rows inserted.
+    if not isinstance(rows, pd.DataFrame):
+        rows = pd.DataFrame(list(rows), columns=MEAL_PLAN_FIELDS)
+    # Column-wise tolist() hands sqlite3 native Python values, not numpy ones.
+    columns = [rows[f].tolist() if f in rows else [None] * len(rows) for f in MEAL_PLAN_FIELDS]
+    values = list(zip(*columns))
+    query = (f"INSERT INTO meal_plans ({', '.join(MEAL_PLAN_FIELDS)}) "
+             f"VALUES ({', '.join(['?']*len(MEAL_PLAN_FIELDS))})")
+    return submit_write(
+        lambda conn: conn.executemany(query, values).rowcount,
+        invalidates=[("meal_plans", cid) for cid in set(columns[0])],
     )
-    conn.commit()
-    conn.close()
 
 def list_meal_plans(client_id: int) -> pd.DataFrame:
-    conn = get_conn()
-    df = pd.read_sql_query(
-        "SELECT id, date, calories, protein_g, fats_g, carbs_g, notes FROM meal_plans WHERE client_id = ? ORDER BY date DESC",
-        conn,
-        params=(client_id,),
-    )
-    conn.close()
-    return df
+    return _cached("list_meal_plans", client_id, [("meal_plans", client_id)],
+                   lambda: _read_df(_SQL_LIST_MEAL_PLANS, (client_id,)))
 
-def add_training_plan(**kwargs):
-    conn = get_conn()
-    cur = conn.cursor()
+_SQL_LIST_MEAL_ITEMS = (
+    "SELECT meal_index, meal_name, food, grams, protein_g, fats_g, carbs_g, calories FROM meal_items "
+    "WHERE meal_plan_id = ? ORDER BY meal_index, id"
+)
+
+def list_meal_items(meal_plan_id: int) -> pd.DataFrame:
+    # Items never change once their plan is written, and plan ids are not
+    # reused, so the entry needs no invalidation.
+    return _cached("list_meal_items", meal_plan_id, [],
+                   lambda: _read_df(_SQL_LIST_MEAL_ITEMS, (meal_plan_id,)))
+
+def meal_plan_items(meal_plan_id: int) -> list:
+    # list_meal_items() as MealItem records, for PDFs.
+    def load():
+        with pooled_conn() as conn:
+            cur = conn.cursor()
+            cur.row_factory = None
+            return [MealItem(*row) for row in cur.execute(_SQL_LIST_MEAL_ITEMS, (meal_plan_id,))]
+    return _cached("meal_plan_items", meal_plan_id, [], load)
+
+# Full rows, including meals_json and the free-text columns the list views
+# leave out. Plans are never edited and ids are not reused, so like meal items
+# they are cached without tags.
+_SQL_GET_MEAL_PLAN = f"SELECT {columns(MealPlan)} FROM meal_plans WHERE id = ?"
+_SQL_GET_TRAINING_PLAN = f"SELECT {columns(TrainingPlan)} FROM training_plans WHERE id = ?"
+
+def get_meal_plan(plan_id: int) -> MealPlan | None:
+    return _cached("get_meal_plan", plan_id, [],
+                   lambda: _fetch_record(MealPlan, _SQL_GET_MEAL_PLAN, (plan_id,)))
+
+def get_training_plan(plan_id: int) -> TrainingPlan | None:
+    return _cached("get_training_plan", plan_id, [],
+                   lambda: _fetch_record(TrainingPlan, _SQL_GET_TRAINING_PLAN, (plan_id,)))
+
+# A client's newest plan, full row: one index probe instead of the whole
+# history that list_*_plans() loads for the tables.
+def latest_meal_plan(client_id: int) -> MealPlan | None:
+    return _cached("latest_meal_plan", client_id, [("meal_plans", client_id)],
+                   lambda: _fetch_record(MealPlan, _SQL_LATEST_MEAL_PLAN, (client_id,)))
+
+def latest_training_plan(client_id: int) -> TrainingPlan | None:
+    return _cached("latest_training_plan", client_id, [("training_plans", client_id)],
+                   lambda: _fetch_record(TrainingPlan, _SQL_LATEST_TRAINING_PLAN, (client_id,)))
+
+def add_training_plan(**kwargs) -> Future:
     fields = [
         "client_id","date","goal","split","days_per_week","session_duration_min","cardio_plan","routine_text","notes"
     ]
-    values = [kwargs.get(f) for f in fields]
-    cur.execute(
-        f"INSERT INTO training_plans ({', '.join(fields)}) VALUES ({', '.join(['?']*len(fields))})",
-        values,
+    return submit_write(
+        lambda conn: _insert(conn, "training_plans", fields, kwargs),
+        invalidates=[("training_plans", kwargs.get("client_id"))],
     )
-    conn.commit()
-    conn.close()
 
 def list_training_plans(client_id: int) -> pd.DataFrame:
-    conn = get_conn()
-    df = pd.read_sql_query(
-        "SELECT id, date, goal, split, days_per_week, session_duration_min FROM training_plans WHERE client_id = ? ORDER BY date DESC",
-        conn,
-        params=(client_id,),
-    )
-    conn.close()
-    return df
+    return _cached("list_training_plans", client_id, [("training_plans", client_id)],
+                   lambda: _read_df(_SQL_LIST_TRAINING_PLANS, (client_id,)))
+
+_SQL_CLIENT_IDS = "SELECT id FROM clients ORDER BY id"
+_SQL_CLIENT_IDS_SEARCH = "SELECT rowid FROM clients_fts WHERE clients_fts MATCH ? ORDER BY rank"
+_ROSTER_FRAME_COLUMNS = ["id", "sex", "age", "height_cm", "weight_kg", "meals_per_day"]
+_SQL_ROSTER_FRAME = f"SELECT {', '.join(_ROSTER_FRAME_COLUMNS)} FROM clients ORDER BY id"
+
+def client_ids(search=None) -> list:
+    # Ids for bulk operations: every client, or the ranked matches of a search.
+    if not search:
+        with pooled_conn() as conn:
+            return [row[0] for row in conn.execute(_SQL_CLIENT_IDS)]
+    query = _fts_query(search)
+    if query is None:
+        return client_ids()
+    with pooled_conn() as conn:
+        ids = [row[0] for row in conn.execute(_SQL_CLIENT_IDS_SEARCH, (query,))]
+    return ids or _fuzzy_client_ids(search)
+
+def roster_frame() -> pd.DataFrame:
+    # Inputs for roster-wide plan recomputation. Plain tuples instead of
+    # sqlite3.Row: this reads every client.
+    with pooled_conn() as conn:
+        cur = conn.cursor()
+        cur.row_factory = None
+        rows = cur.execute(_SQL_ROSTER_FRAME).fetchall()
+    return pd.DataFrame.from_records(rows, columns=_ROSTER_FRAME_COLUMNS)
+
+# Client rows plus their latest meal and training plan in a single query;
+# the latest-plan subqueries are answered from the (client_id, date, id)
+# indexes.
+_SQL_CLIENT_SHEETS = (
+    f"SELECT {columns(Client, 'c.')}, {columns(MealPlan, 'm.')}, {columns(TrainingPlan, 't.')} "
+    "FROM clients c "
+    "LEFT JOIN meal_plans m ON m.id = "
+    "(SELECT id FROM meal_plans WHERE client_id = c.id ORDER BY date DESC, id DESC LIMIT 1) "
+    "LEFT JOIN training_plans t ON t.id = "
+    "(SELECT id FROM training_plans WHERE client_id = c.id ORDER BY date DESC, id DESC LIMIT 1) "
+    "WHERE c.id IN ({marks})"
+)
+_SHEET_SPLITS = (len(CLIENT_COLUMNS), len(CLIENT_COLUMNS) + len(names(MealPlan)))
+
+def fetch_client_sheets(ids) -> list:
+    # [{"client": Client, "meal": MealPlan | None, "items": [MealItem],
+    # "train": TrainingPlan | None}, ...] in the order of ids; unknown ids
+    # are skipped.
+    if not ids:
+        return []
+    query = _SQL_CLIENT_SHEETS.format(marks=", ".join("?" * len(ids)))
+    with pooled_conn() as conn:
+        cur = conn.cursor()
+        cur.row_factory = None
+        rows = cur.execute(query, list(ids)).fetchall()
+    a, b = _SHEET_SPLITS
+    sheets = {}
+    for row in rows:
+        client = Client(*row[:a])
+        # LEFT JOIN misses come back as all-NULL columns, id included.
+        meal = MealPlan(*row[a:b]) if row[a] is not None else None
+        train = TrainingPlan(*row[b:]) if row[b] is not None else None
+        sheets[client.id] = {"client": client, "meal": meal, "items": [], "train": train}
+    items = _meal_items_for_plans([s["meal"].id for s in sheets.values() if s["meal"] is not None])
+    for sheet in sheets.values():
+        if sheet["meal"] is not None:
+            sheet["items"] = items.get(sheet["meal"].id, [])
+    return [sheets[i] for i in ids if i in sheets]
+
+_SQL_MEAL_ITEMS_FOR_PLANS = (
+    f"SELECT meal_plan_id, {columns(MealItem)} "
+    "FROM meal_items WHERE meal_plan_id IN ({marks}) ORDER BY meal_plan_id, meal_index, id"
+)
+
+def _meal_items_for_plans(plan_ids) -> dict:
+    # plan id -> [MealItem], one query.
+    by_plan = {}
+    if not plan_ids:
+        return by_plan
+    query = _SQL_MEAL_ITEMS_FOR_PLANS.format(marks=", ".join("?" * len(plan_ids)))
+    with pooled_conn() as conn:
+        cur = conn.cursor()
+        cur.row_factory = None
+        for row in cur.execute(query, list(plan_ids)):
+            by_plan.setdefault(row[0], []).append(MealItem(*row[1:]))
+    return by_plan
+
+# ---- Roster dashboard (reads only client_summary) ----
+ACTIVE_DAYS = 30
+PROGRESS_MIN_DAYS = 14  # shorter histories give noisy per-month rates
+_DAYS_PER_MONTH = 30.44
+
+_SQL_ROSTER_OVERVIEW = (
+    "SELECT COUNT(*) AS clients, "
+    "COALESCE(SUM(last_date >= ?), 0) AS active, "
+    "COALESCE(SUM(last_date < ?), 0) AS stale, "
+    "COALESCE(SUM(last_date IS NULL), 0) AS never_measured "
+    "FROM client_summary"
+)
+_SQL_OBJECTIVE_PROGRESS = (
+    "SELECT COALESCE(plan_objective, 'sin plan') AS objective, COUNT(*) AS clients, "
+    f"AVG((first_body_fat_pct - last_body_fat_pct) / ((julianday(last_date) - julianday(first_date)) / {_DAYS_PER_MONTH})) "
+    "AS fat_loss_pct_month, "
+    f"AVG((last_weight_kg - first_weight_kg) / ((julianday(last_date) - julianday(first_date)) / {_DAYS_PER_MONTH})) "
+    "AS weight_change_kg_month "
+    "FROM client_summary WHERE julianday(last_date) - julianday(first_date) >= ? "
+    "GROUP BY 1 ORDER BY clients DESC"
+)
+_SQL_STALE_CLIENTS = (
+    "SELECT client_id, name, last_date, last_weight_kg, plan_objective FROM client_summary "
+    "WHERE last_date < ? ORDER BY last_date LIMIT ?"
+)
+
+def _days_ago(days: int) -> str:
+    return (datetime.now().date() - timedelta(days=days)).isoformat()
+
+def rebuild_client_summary() -> int:
+    return submit_write(_rebuild_client_summary).result()
+
+def roster_overview(active_days: int = ACTIVE_DAYS) -> dict:
+    # clients, active (measured in the last active_days), stale (measured
+    # before that) and never_measured.
+    since = _days_ago(active_days)
+    return dict(_fetchone(_SQL_ROSTER_OVERVIEW, (since, since)))
+
+def objective_progress(min_days: int = PROGRESS_MIN_DAYS) -> pd.DataFrame:
+    # Average body-fat loss (points/month) and weight change (kg/month) between
+    # first and latest measurement, grouped by the objective of the latest plan.
+    return _read_df(_SQL_OBJECTIVE_PROGRESS, (min_days,))
+
+def stale_clients(days: int = ACTIVE_DAYS, limit: int = 100) -> pd.DataFrame:
+    # Clients whose latest measurement is older than days, longest first.
+    return _read_df(_SQL_STALE_CLIENTS, (_days_ago(days), limit))
+
+# ---- Delta sync ----
+SYNC_PAGE_ROWS = 500
+
+_SQL_CHANGES_SINCE = "SELECT seq, tbl, row_id, deleted FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?"
+_SQL_CURRENT_SEQ = "SELECT MAX(seq) FROM change_log"
+_SQL_ROWS_BY_ID = "SELECT * FROM {table} WHERE id IN ({marks}) ORDER BY id"
+
+def current_seq() -> int:
+    row = _fetchone(_SQL_CURRENT_SEQ)
+    return row[0] or 0
+
+def changes_since(cursor: int = 0, limit: int = SYNC_PAGE_ROWS) -> dict:
+    # Rows of SYNC_TABLES changed after cursor, at most limit of them:
+    # {"cursor": seq to send next time, "more": bool,
+    #  "rows": {table: [row dicts]}, "deleted": {table: [ids]}}.
+    # The size depends on the changes since cursor, not on the database.
+    with pooled_conn() as conn:
+        conn.execute("BEGIN")  # log and rows from the same snapshot
+        try:
+            log = conn.execute(_SQL_CHANGES_SINCE, (cursor, limit + 1)).fetchall()
+            more = len(log) > limit
+            log = log[:limit]
+            changed, deleted = {}, {}
+            for entry in log:
+                (deleted if entry["deleted"] else changed).setdefault(entry["tbl"], []).append(entry["row_id"])
+            rows = {}
+            for table, ids in changed.items():
+                query = _SQL_ROWS_BY_ID.format(table=table, marks=", ".join("?" * len(ids)))
+                rows[table] = [dict(r) for r in conn.execute(query, ids)]
+        finally:
+            conn.rollback()
+    return {"cursor": log[-1]["seq"] if log else cursor, "more": more, "rows": rows, "deleted": deleted}
+
+# Read queries covered by check_query_plans(): name -> (sql, sample params,
+# scan). Every read in this module is registered here, and the modules in
+# PLAN_CHECK_MODULES add theirs with register_read_query(), so a new query
+# that scans fails the check. scan is one of:
+#   SEARCH       must SEARCH an index.
+#   SEARCH_SORT  SEARCHes like SEARCH, then sorts the rows it found (window
+#                functions over one client's history).
+#   WHOLE_TABLE  returns every row by design: walking the table or an index
+#                in ORDER BY order is fine, sorting into a temp B-tree is not.
+#   AGGREGATE    folds a whole table into a few rows (client_summary
+#                dashboards, COUNT(*)): any scan, and sorting the groups.
+SEARCH, SEARCH_SORT, WHOLE_TABLE, AGGREGATE = "search", "search_sort", "whole_table", "aggregate"
+PLAN_CHECK_MODULES = ("analytics", "importer", "similarity", "sync")
+_READ_QUERIES = {
+    "list_clients": (_SQL_LIST_CLIENTS, (), WHOLE_TABLE),
+    "list_clients(search)": (_SQL_SEARCH_CLIENTS, ('"ana"*',), SEARCH),
+    "list_clients(search, trigram)": (_SQL_SEARCH_NAMES_TRGM, ('"ana"', FUZZY_CANDIDATES), SEARCH),
+    "get_client_by_id": (_SQL_GET_CLIENT, (1,), SEARCH),
+    "client_directory": (_SQL_CLIENT_DIRECTORY, (2**63 - 1, 50), SEARCH),
+    "fetch_client_sheets": (_SQL_CLIENT_SHEETS.format(marks="?, ?"), (1, 2), SEARCH),
+    "list_clients_page": (_SQL_CLIENTS_FIRST_PAGE.format(cols="id, name"), (50,), WHOLE_TABLE),
+    "list_clients_page(cursor)": (_SQL_CLIENTS_NEXT_PAGE.format(cols="id, name"), ("2024-01-01", 1, 50), SEARCH),
+    "get_measurements": (_SQL_GET_MEASUREMENTS, (1,), SEARCH),
+    "list_meal_plans": (_SQL_LIST_MEAL_PLANS, (1,), SEARCH),
+    "list_training_plans": (_SQL_LIST_TRAINING_PLANS, (1,), SEARCH),
+    "latest_measurement": (_SQL_LATEST_MEASUREMENT, (1,), SEARCH),
+    "latest_meal_plan": (_SQL_LATEST_MEAL_PLAN, (1,), SEARCH),
+    "latest_training_plan": (_SQL_LATEST_TRAINING_PLAN, (1,), SEARCH),
+    "list_meal_items": (_SQL_LIST_MEAL_ITEMS, (1,), SEARCH),
+    "fetch_client_sheets(items)": (_SQL_MEAL_ITEMS_FOR_PLANS.format(marks="?, ?"), (1, 2), SEARCH),
+    "stale_clients": (_SQL_STALE_CLIENTS, ("2024-01-01", 100), SEARCH),
+    "changes_since": (_SQL_CHANGES_SINCE, (0, SYNC_PAGE_ROWS + 1), SEARCH),
+    "list_clients_page(search)": (_SQL_SEARCH_CLIENTS_PAGE.format(cols="c.id, c.name"), ('"ana"*', 50, 0), SEARCH),
+    "list_clients_page(fuzzy)": (_SQL_CLIENTS_BY_IDS.format(cols="id, name", marks="?, ?"), (1, 2), SEARCH),
+    "list_clients_page(has_match)": (_SQL_HAS_FTS_MATCH, ('"ana"*',), SEARCH),
+    "count_clients": (_SQL_COUNT_CLIENTS, (), AGGREGATE),
+    "client_ids": (_SQL_CLIENT_IDS, (), WHOLE_TABLE),
+    "client_ids(search)": (_SQL_CLIENT_IDS_SEARCH, ('"ana"*',), SEARCH),
+    "roster_frame": (_SQL_ROSTER_FRAME, (), WHOLE_TABLE),
+    "get_meal_plan": (_SQL_GET_MEAL_PLAN, (1,), SEARCH),
+    "get_training_plan": (_SQL_GET_TRAINING_PLAN, (1,), SEARCH),
+    "same_day_measurements": (_SQL_SAME_DAY_MEASUREMENTS, (1, "2024-01-01"), SEARCH),
+    "roster_overview": (_SQL_ROSTER_OVERVIEW, ("2024-01-01", "2024-01-01"), AGGREGATE),
+    "objective_progress": (_SQL_OBJECTIVE_PROGRESS, (PROGRESS_MIN_DAYS,), AGGREGATE),
+    "current_seq": (_SQL_CURRENT_SEQ, (), AGGREGATE),
+    **{f"changes_since({table})": (_SQL_ROWS_BY_ID.format(table=table, marks="?, ?"), (1, 2), SEARCH)
+       for table in SYNC_TABLES},
+}
+
+def register_read_query(name: str, query: str, params=(), scan: str = SEARCH):
+    # For modules with their own SQL; call at import time.
+    _READ_QUERIES[name] = (query, params, scan)
+
+def explain_query_plans() -> dict:
+    for module in PLAN_CHECK_MODULES:  # their import registers their queries
+        importlib.import_module(module)
+    plans = {}
+    with pooled_conn() as conn:
+        for name, (query, params, _) in _READ_QUERIES.items():
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+            plans[name] = [row["detail"] for row in rows]
+    return plans
+
+def _plan_problems(details, scan: str):
+    problems = []
+    for detail in details:
+        if "TEMP B-TREE" in detail:  # ORDER BY / GROUP BY / DISTINCT / UNION sorts
+            if scan not in (AGGREGATE, SEARCH_SORT):
+                problems.append(detail)
+        elif detail.startswith("SCAN (subquery-"):
+            continue  # a subquery's result; its own steps are checked separately
+        elif detail.startswith("SCAN ") and "VIRTUAL TABLE" not in detail:
+            if scan in (SEARCH, SEARCH_SORT):
+                problems.append(detail)
+    return problems
+
+def check_query_plans():
+    failures = {}
+    for name, details in explain_query_plans().items():
+        problems = _plan_problems(details, _READ_QUERIES[name][2])
+        if problems:
+            failures[name] = problems
+    if failures:
+        lines = [f"{name}: {'; '.join(p)}" for name, p in failures.items()]
+        raise RuntimeError("Consultas sin índice:\n" + "\n".join(lines))
+
+# Maintenance across tenant shards. Each shard is its own file with its own
+# writer, so they are processed in parallel; within a shard ANALYZE goes
+# through the writer queue and VACUUM (which can't run inside a transaction)
+# uses a dedicated connection and waits on busy_timeout for the writer.
+MAINTENANCE_TASKS = ("migrate", "analyze", "vacuum")
+MAINTENANCE_WORKERS = 4
+
+def maintain(path: str = None, tasks=MAINTENANCE_TASKS) -> dict:
+    path = path or current_path()
+    start = time.perf_counter()
+    result = {"size_before": os.path.getsize(path) if os.path.exists(path) else 0}
+    if "migrate" in tasks:
+        result["version"] = init_db(path)
+    if "analyze" in tasks:
+        get_writer(path).submit(lambda conn: conn.execute("ANALYZE")).result()
+    if "vacuum" in tasks:
+        conn = get_conn(path)
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+    result["size_after"] = os.path.getsize(path)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def maintain_all(tasks=MAINTENANCE_TASKS, tenants=None, workers: int = MAINTENANCE_WORKERS) -> dict:
+    # tenant -> maintain() result, or the error message for failed shards.
+    tenants = list_tenants() if tenants is None else tenants
+    results = {}
+    if not tenants:
+        return results
+    with ThreadPoolExecutor(max_workers=min(workers, len(tenants))) as pool:
+        futures = {t: pool.submit(maintain, tenant_path(t), tasks) for t in tenants}
+        for tenant, future in futures.items():
+            try:
+                results[tenant] = future.result()
+            except Exception as e:
+                results[tenant] = f"{type(e).__name__}: {e}"
+    return results
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    # Modules imported from here (PLAN_CHECK_MODULES) must see this module,
+    # not a second copy of db.py, or their registered queries go unchecked.
+    sys.modules.setdefault("db", sys.modules[__name__])
+
+    parser = argparse.ArgumentParser(description="Mantenimiento de la base de datos GS")
+    parser.add_argument("command", choices=["migrate", "check-plans", "rebuild-summary", "tenants", "maintain"])
+    parser.add_argument("--tenant", default=DEFAULT_TENANT,
+                        help="gimnasio sobre el que actuar (por defecto GS_TENANT o la base principal)")
+    parser.add_argument("--all", action="store_true", help="maintain: todos los gimnasios en paralelo")
+    parser.add_argument("--tasks", default=",".join(MAINTENANCE_TASKS),
+                        help="maintain: tareas separadas por comas (migrate, analyze, vacuum)")
+    parser.add_argument("--workers", type=int, default=MAINTENANCE_WORKERS)
+    args = parser.parse_args()
+    set_tenant(args.tenant)
+
+    if args.command == "migrate":
+        print(f"Esquema en versión {init_db()}")
+    elif args.command == "check-plans":
+        init_db()
+        for name, details in explain_query_plans().items():
+            print(f"{name}: {' | '.join(details)}")
+        check_query_plans()
+        print("OK: todas las consultas usan índices.")
+    elif args.command == "rebuild-summary":
+        init_db()
+        print(f"Resumen reconstruido: {rebuild_client_summary()} clientes.")
+    elif args.command == "tenants":
+        for tenant in list_tenants():
+            path = tenant_path(tenant)
+            print(f"{tenant}\t{os.path.getsize(path) / 1e6:.1f} MB\t{path}")
+    elif args.command == "maintain":
+        tasks = [t.strip() for t in args.tasks.split(",") if t.strip()]
+        unknown = set(tasks) - set(MAINTENANCE_TASKS)
+        if unknown:
+            parser.error(f"tareas desconocidas: {', '.join(sorted(unknown))}")
+        if args.all:
+            results = maintain_all(tasks, workers=args.workers)
+        else:
+            results = {args.tenant or current_path(): maintain(tasks=tasks)}
+        failed = 0
+        for name, res in results.items():
+            if isinstance(res, str):
+                failed += 1
+                print(f"{name}: ERROR {res}")
+            else:
+                print(f"{name}: {res['size_before'] / 1e6:.1f} -> {res['size_after'] / 1e6:.1f} MB "
+                      f"en {res['seconds']:.2f} s")
+        if failed:
+            raise SystemExit(1)
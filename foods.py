@@ -0,0 +1,191 @@
+import itertools
+import unicodedata
+import numpy as np
+from gs_preset import gs_meals
+
+# Food catalog and gram-quantity solver for the GS preset.
+#
+# Every meal of a GS day has three slots (protein, carb, fat food) plus fixed
+# portions (vegetables, one fruit at breakfast). For every combination of
+# slot foods the 3x3 nutrient matrix and its pseudo-inverse are computed once
+# at import, so solving a plan is one batched matrix product per meal: grams
+# for every combination at once, then the closest in-range one wins.
+
+# name, group, protein, fat, carbs (g per 100 g), cost tier (1 Bajo,
+# 2 Medio, 3 Alto), allergen tags, max grams per meal
+FOODS = [
+    ("Huevo entero", "proteína", 13.0, 10.0, 1.1, 1, {"huevo"}, 250),
+    ("Claras de huevo", "proteína", 11.0, 0.2, 0.7, 1, {"huevo"}, 400),
+    ("Yogur griego natural", "proteína", 10.0, 0.4, 3.6, 2, {"lácteos"}, 300),
+    ("Queso panela", "proteína", 18.0, 17.0, 3.0, 2, {"lácteos"}, 150),
+    ("Pechuga de pavo", "proteína", 22.0, 2.0, 2.0, 2, set(), 200),
+    ("Pechuga de pollo", "proteína", 31.0, 3.6, 0.0, 1, set(), 300),
+    ("Res magra", "proteína", 26.0, 8.0, 0.0, 3, set(), 300),
+    ("Tilapia", "proteína", 26.0, 2.7, 0.0, 2, {"pescado"}, 300),
+    ("Atún en agua", "proteína", 25.0, 1.0, 0.0, 1, {"pescado"}, 250),
+    ("Salmón", "proteína", 20.0, 13.0, 0.0, 3, {"pescado"}, 250),
+    ("Avena", "carbohidrato", 13.0, 7.0, 67.0, 1, {"gluten"}, 150),
+    ("Tortilla de maíz", "carbohidrato", 6.0, 3.0, 45.0, 1, set(), 300),
+    ("Pan integral", "carbohidrato", 13.0, 4.0, 41.0, 2, {"gluten"}, 150),
+    ("Arroz cocido", "carbohidrato", 2.7, 0.3, 28.0, 1, set(), 400),
+    ("Pasta cocida", "carbohidrato", 5.8, 0.9, 31.0, 1, {"gluten"}, 350),
+    ("Papa cocida", "carbohidrato", 2.0, 0.1, 20.0, 1, set(), 500),
+    ("Camote cocido", "carbohidrato", 1.6, 0.1, 20.0, 2, set(), 500),
+    ("Frijoles cocidos", "carbohidrato", 9.0, 0.5, 23.0, 1, set(), 300),
+    ("Tostadas horneadas", "carbohidrato", 9.0, 6.0, 72.0, 1, set(), 100),
+    ("Aguacate", "grasa", 2.0, 15.0, 9.0, 2, set(), 200),
+    ("Aceite de oliva", "grasa", 0.0, 100.0, 0.0, 3, set(), 30),
+    ("Almendras", "grasa", 21.0, 50.0, 22.0, 3, {"frutos secos"}, 60),
+    ("Crema de cacahuate", "grasa", 25.0, 50.0, 20.0, 2, {"cacahuate"}, 40),
+    ("Verduras mixtas", "verdura", 2.0, 0.3, 5.0, 1, set(), 300),
+    ("Ensalada verde", "verdura", 1.5, 0.2, 3.0, 1, set(), 300),
+    ("Plátano", "fruta", 1.1, 0.3, 23.0, 1, set(), 200),
+    ("Manzana", "fruta", 0.3, 0.2, 14.0, 1, set(), 250),
+]
+FOOD_NAMES = [f[0] for f in FOODS]
+FOOD_INDEX = {name: i for i, name in enumerate(FOOD_NAMES)}
+
+# Macros per gram, one row per food, plus a zero row used when every food of
+# a slot is excluded (the slot then gets 0 g).
+NONE_FOOD = len(FOODS)
+NUTRIENTS = np.vstack([np.array([f[2:5] for f in FOODS], dtype="float64") / 100, np.zeros((1, 3))])
+COST_TIERS = np.array([f[5] for f in FOODS] + [0])
+MAX_GRAMS = np.array([f[7] for f in FOODS] + [0], dtype="float64")
+
+ECONOMIC_LEVEL_TIERS = {"Bajo": 1, "Medio": 2, "Alto": 3}
+DEFAULT_COST_TIER = 2
+
+# Free-text "Alergias" keywords (accent-folded, lowercase) per allergen tag.
+ALLERGEN_KEYWORDS = {
+    "huevo": ["huevo"],
+    "lácteos": ["lacteo", "leche", "lactosa", "queso", "yogur"],
+    "pescado": ["pescado", "atun", "tilapia", "salmon"],
+    "gluten": ["gluten", "trigo", "celiac", "avena"],
+    "frutos secos": ["frutos secos", "nuez", "nueces", "almendra"],
+    "cacahuate": ["cacahuate", "mani"],
+}
+
+# Slot candidates and fixed portions per GS meal (see gs_preset.GS_BASE_MEALS).
+MEAL_TEMPLATES = {
+    "Desayuno": {
+        "slots": [
+            ["Huevo entero", "Claras de huevo", "Yogur griego natural", "Queso panela", "Pechuga de pavo"],
+            ["Avena", "Tortilla de maíz", "Pan integral"],
+            ["Aguacate", "Almendras", "Crema de cacahuate"],
+        ],
+        "fixed": [("Verduras mixtas", 100), ("Plátano", 120)],
+    },
+    "Comida": {
+        "slots": [
+            ["Pechuga de pollo", "Res magra", "Tilapia", "Salmón"],
+            ["Arroz cocido", "Pasta cocida", "Papa cocida", "Camote cocido", "Tortilla de maíz", "Frijoles cocidos"],
+            ["Aguacate", "Aceite de oliva"],
+        ],
+        "fixed": [("Verduras mixtas", 150)],
+    },
+    "Cena": {
+        "slots": [
+            ["Tilapia", "Atún en agua", "Pechuga de pollo"],
+            ["Tostadas horneadas", "Tortilla de maíz", "Camote cocido"],
+            ["Aguacate", "Aceite de oliva"],
+        ],
+        "fixed": [("Ensalada verde", 150)],
+    },
+}
+
+GRAMS_STEP = 5
+COST_WEIGHT = 0.002  # per tier point; only breaks near-ties in macro error
+
+def _precompute(template):
+    slots = [[FOOD_INDEX[n] for n in names] + [NONE_FOOD] for names in template["slots"]]
+    combos = np.array(list(itertools.product(*slots)))   # (K, 3) food indices
+    matrices = NUTRIENTS[combos].transpose(0, 2, 1)      # (K, macro, food)
+    return {
+        "combos": combos,
+        "matrices": matrices,
+        "pinv": np.linalg.pinv(matrices),
+        "max_grams": MAX_GRAMS[combos],
+        "cost": COST_TIERS[combos].sum(axis=1),
+        "fixed": [(FOOD_INDEX[n], g) for n, g in template["fixed"]],
+    }
+
+_TEMPLATES = {name: _precompute(t) for name, t in MEAL_TEMPLATES.items()}
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+
+def excluded_tags(allergies: str) -> set:
+    text = _fold(allergies)
+    return {tag for tag, words in ALLERGEN_KEYWORDS.items() if any(w in text for w in words)}
+
+def allowed_foods(economic_level: str = None, allergies: str = None):
+    # Boolean masks over FOODS plus the NONE_FOOD row: (within budget and
+    # safe, safe). Allergies are a hard limit; the budget is relaxed for a
+    # slot that has no affordable food.
+    max_tier = ECONOMIC_LEVEL_TIERS.get(economic_level, DEFAULT_COST_TIER)
+    tags = excluded_tags(allergies)
+    safe = np.array([not (f[6] & tags) for f in FOODS] + [False])
+    ok = safe & (COST_TIERS <= max_tier)
+    return ok, safe
+
+def _combo_mask(t, allowed) -> np.ndarray:
+    # Per slot: the allowed foods of the first mask that has any, else NONE_FOOD.
+    mask = np.ones(len(t["combos"]), dtype=bool)
+    for s in range(t["combos"].shape[1]):
+        foods = t["combos"][:, s]
+        for ok in allowed:
+            if ok[foods].any():
+                mask &= ok[foods]
+                break
+        else:
+            mask &= foods == NONE_FOOD
+    return mask
+
+def _solve_meal(t, target: np.ndarray, allowed, rank: int = 0):
+    # Returns (food indices, grams) for the rank-th best combination.
+    fixed = np.zeros(3)
+    fixed_items = [(f, g) for f, g in t["fixed"] if allowed[-1][f]]
+    for f, g in fixed_items:
+        fixed += NUTRIENTS[f] * g
+    rest = np.clip(target - fixed, 0, None)
+    grams = t["pinv"] @ rest                                  # (K, 3)
+    grams = np.clip(grams, 0, t["max_grams"])
+    grams = np.round(grams / GRAMS_STEP) * GRAMS_STEP
+    achieved = np.einsum("kmf,kf->km", t["matrices"], grams)
+    # Squared error in kcal terms, so a gram of fat counts 9/4 of one of carbs.
+    error = (((achieved - rest) * np.array([4.0, 9.0, 4.0])) ** 2).sum(axis=1) / max(target @ [4, 9, 4], 1) ** 2
+    score = np.where(_combo_mask(t, allowed), error + COST_WEIGHT * t["cost"], np.inf)
+    order = np.argsort(score, kind="stable")
+    best = order[min(rank, int(np.isfinite(score).sum()) - 1)]
+    foods = list(t["combos"][best]) + [f for f, _ in fixed_items]
+    amounts = list(grams[best]) + [float(g) for _, g in fixed_items]
+    return foods, amounts
+
+def solve_meal_items(protein_g: float, fats_g: float, carbs_g: float, meals_per_day: int = 3,
+                     economic_level: str = None, allergies: str = None) -> list:
+    # Splits the daily targets evenly across the GS meals and returns one dict
+    # per food: meal_index, meal_name, food, grams, protein_g, fats_g,
+    # carbs_g, calories. A meal repeated in the day gets its next-best option.
+    meals_per_day = max(int(meals_per_day or 3), 1)
+    names = [m.split(":")[0] for m in gs_meals(meals_per_day)]
+    target = np.array([protein_g, fats_g, carbs_g], dtype="float64") / meals_per_day
+    allowed = allowed_foods(economic_level, allergies)
+    items = []
+    for i, name in enumerate(names):
+        foods, grams = _solve_meal(_TEMPLATES[name], target, allowed, rank=names[:i].count(name))
+        for f, g in zip(foods, grams):
+            if f == NONE_FOOD or g <= 0:
+                continue
+            p, fat, c = NUTRIENTS[f] * g
+            items.append({
+                "meal_index": i,
+                "meal_name": name,
+                "food": FOOD_NAMES[f],
+                "grams": float(g),
+                "protein_g": round(float(p), 1),
+                "fats_g": round(float(fat), 1),
+                "carbs_g": round(float(c), 1),
+                "calories": round(float(4 * p + 9 * fat + 4 * c)),
+            })
+    return items
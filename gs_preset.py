@@ -1,5 +1,34 @@
-
 from typing import Tuple, Dict
+import numpy as np
+import pandas as pd
+
+# Activity multipliers
+ACTIVITY_MULTIPLIERS = {
+    "sedentario": 1.2,
+    "ligero": 1.375,
+    "moderado": 1.55,
+    "alto": 1.725,
+    "atleta": 1.9
+}
+DEFAULT_ACTIVITY_MULTIPLIER = 1.55
+
+# Objective deltas (kcal sobre el TDEE); anything else is "recomposición"
+OBJECTIVE_DELTAS = {
+    "pérdida de grasa": -300,
+    "ganancia de masa": 200,
+    "mantenimiento": 0,
+}
+DEFAULT_OBJECTIVE_DELTA = -100
+
+# Macro splits por estilo GS (carbos moderados, fruta 1x en desayuno)
+# Tomamos 30% protein, 25% fat, 45% carbs como base, ajustable
+GS_MACRO_SPLIT = (0.30, 0.25, 0.45)
+
+GS_BASE_MEALS = [
+    "Desayuno: proteína (huevo/claras) + carbos (avena/tortillas) + verdura + 1 fruta + aguacate",
+    "Comida: proteína (pollo/res magra/pescado) + carbos (arroz/pasta/papas/tortillas) + verdura + aguacate",
+    "Cena: proteína (tilapia/atún/pollo) + carbos bajos (tostadas/verduras) + ensalada con aguacate"
+]
 
 def mifflin_st_jeor(weight_kg: float, height_cm: float, age: int, sex: str, activity: str):
     # BMR
@@ -7,55 +36,61 @@ def mifflin_st_jeor(weight_kg: float, height_cm: float, age: int, sex: str, acti
         bmr = 10*weight_kg + 6.25*height_cm - 5*age + 5
     else:
         bmr = 10*weight_kg + 6.25*height_cm - 5*age - 161
-    # Activity multipliers
-    mult = {
-        "sedentario": 1.2,
-        "ligero": 1.375,
-        "moderado": 1.55,
-        "alto": 1.725,
-        "atleta": 1.9
-    }.get(activity, 1.55)
+    mult = ACTIVITY_MULTIPLIERS.get(activity, DEFAULT_ACTIVITY_MULTIPLIER)
     tdee = bmr * mult
     return bmr, tdee
 
-def build_gs_meal_plan(tdee: float, objective: str, meals_per_day: int = 3) -> Dict:
-    # Objective deltas
-    if objective == "pérdida de grasa":
-        calories = tdee - 300
-        protein_g = 2.0  # g/kg (aprox, se ajusta al registrar)
-    elif objective == "ganancia de masa":
-        calories = tdee + 200
-        protein_g = 1.8
-    elif objective == "mantenimiento":
-        calories = tdee
-        protein_g = 1.6
-    else:  # recomposición
-        calories = tdee - 100
-        protein_g = 2.0
-
-    # Macro splits por estilo GS (carbos moderados, fruta 1x en desayuno)
-    # Tomamos 30% protein, 25% fat, 45% carbs como base, ajustable
-    p = 0.30
-    f = 0.25
-    c = 0.45
-    protein_g_total = round((calories*p)/4)
-    fats_g_total = round((calories*f)/9)
-    carbs_g_total = round((calories*c)/4)
-
+def gs_meals(meals_per_day: int = 3):
     # Construcción de comidas (simplificada)
     meals = []
-    base_meals = [
-        "Desayuno: proteína (huevo/claras) + carbos (avena/tortillas) + verdura + 1 fruta + aguacate",
-        "Comida: proteína (pollo/res magra/pescado) + carbos (arroz/pasta/papas/tortillas) + verdura + aguacate",
-        "Cena: proteína (tilapia/atún/pollo) + carbos bajos (tostadas/verduras) + ensalada con aguacate"
-    ]
     for i in range(meals_per_day):
-        meals.append(base_meals[i % len(base_meals)])
+        meals.append(GS_BASE_MEALS[i % len(GS_BASE_MEALS)])
+    return meals
+
+def build_gs_meal_plan(tdee: float, objective: str, meals_per_day: int = 3,
+                       split: Tuple[float, float, float] = GS_MACRO_SPLIT) -> Dict:
+    calories = tdee + OBJECTIVE_DELTAS.get(objective, DEFAULT_OBJECTIVE_DELTA)
+
+    p, f, c = split
+    protein_g_total = round((calories*p)/4)
+    fats_g_total = round((calories*f)/9)
+    carbs_g_total = round((calories*c)/4)
 
     return {
         "calories": round(calories),
         "protein_g": protein_g_total,
         "fats_g": fats_g_total,
         "carbs_g": carbs_g_total,
-        "meals": meals
+        "meals": gs_meals(meals_per_day)
     }
+
+# ---- Batch (roster-wide) versions ----
+# Same arithmetic as the scalar functions, in the same order, on float64
+# arrays, so results match them exactly (np.rint rounds half to even like
+# round()). Scalars are broadcast against the array arguments.
+
+def mifflin_st_jeor_batch(weight_kg, height_cm, age, sex, activity):
+    weight_kg, height_cm, age = (np.asarray(a, dtype="float64") for a in (weight_kg, height_cm, age))
+    n = np.broadcast(weight_kg, height_cm, age).shape
+    male = pd.Series(np.broadcast_to(np.asarray(sex, dtype=object), n).ravel()).astype(str).str.upper() == "M"
+    offset = np.where(male.to_numpy().reshape(n), 5.0, -161.0)
+    bmr = 10*weight_kg + 6.25*height_cm - 5*age + offset
+    activity = pd.Series(np.broadcast_to(np.asarray(activity, dtype=object), n).ravel())
+    mult = activity.map(ACTIVITY_MULTIPLIERS).fillna(DEFAULT_ACTIVITY_MULTIPLIER).to_numpy("float64").reshape(n)
+    tdee = bmr * mult
+    return bmr, tdee
+
+def build_gs_meal_plan_batch(tdee, objective, split: Tuple[float, float, float] = GS_MACRO_SPLIT) -> pd.DataFrame:
+    # Macros only; meals depend on meals_per_day and are looked up per row by
+    # the caller (see gs_meals).
+    tdee = np.asarray(tdee, dtype="float64")
+    objective = pd.Series(np.broadcast_to(np.asarray(objective, dtype=object), tdee.shape).ravel())
+    delta = objective.map(OBJECTIVE_DELTAS).fillna(DEFAULT_OBJECTIVE_DELTA).to_numpy("float64")
+    calories = tdee.ravel() + delta
+    p, f, c = split
+    return pd.DataFrame({
+        "calories": np.rint(calories).astype("int64"),
+        "protein_g": np.rint((calories*p)/4).astype("int64"),
+        "fats_g": np.rint((calories*f)/9).astype("int64"),
+        "carbs_g": np.rint((calories*c)/4).astype("int64"),
+    })
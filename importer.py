@@ -0,0 +1,300 @@
+from datetime import datetime
+import pandas as pd
+import db
+
+# Bulk import of clients and historical measurements from CSV/XLSX.
+# Files are read in chunks; each chunk is validated with vectorized checks
+# and written by the db writer as one transaction (executemany where ids are
+# not needed back). Invalid rows are reported, never abort the import.
+
+CHUNK_ROWS = 5000
+MAX_REPORTED_REJECTS = 10000
+
+# Same limits the forms in app.py enforce.
+CLIENT_RANGES = {
+    "age": (1, 120),
+    "height_cm": (80, 230),
+    "weight_kg": (10, 400),
+    "body_fat_pct": (0, 80),
+    "muscle_pct": (0, 80),
+    "visceral_fat": (0, 30),
+    "meals_per_day": (1, 8),
+}
+CLIENT_CHOICES = {
+    "sex": ["F", "M", "Otro"],
+    "economic_level": ["Bajo", "Medio", "Alto"],
+}
+MEASUREMENT_RANGES = {
+    "weight_kg": (10, 400),
+    "body_fat_pct": (0, 80),
+    "muscle_pct": (0, 80),
+    "visceral_fat": (0, 30),
+    "waist_cm": (20, 200),
+    "hip_cm": (20, 200),
+    "chest_cm": (20, 200),
+    "thigh_cm": (20, 200),
+    "arm_cm": (10, 80),
+}
+INTEGER_COLUMNS = {"age", "visceral_fat", "meals_per_day"}
+
+_SQL_EXISTING_EXTERNAL_IDS = "SELECT external_id FROM client_external_ids WHERE external_id IN ({marks})"
+_SQL_RESOLVE_EXTERNAL_IDS = "SELECT external_id, client_id FROM client_external_ids WHERE external_id IN ({marks})"
+_SQL_RESOLVE_CLIENT_IDS = "SELECT CAST(id AS TEXT), id FROM clients WHERE id IN ({marks})"
+db.register_read_query("import.existing_external_ids", _SQL_EXISTING_EXTERNAL_IDS.format(marks="?, ?"), ("a", "b"))
+db.register_read_query("import.resolve_external_ids", _SQL_RESOLVE_EXTERNAL_IDS.format(marks="?, ?"), ("a", "b"))
+db.register_read_query("import.resolve_client_ids", _SQL_RESOLVE_CLIENT_IDS.format(marks="?, ?"), (1, 2))
+
+def read_chunks(source, filename: str = None, chunk_rows: int = CHUNK_ROWS):
+    # Yields DataFrames of strings. source: path or binary file object.
+    name = (filename or getattr(source, "name", None) or str(source)).lower()
+    if name.endswith((".xlsx", ".xlsm")):
+        yield from _xlsx_chunks(source, chunk_rows)
+    else:
+        yield from pd.read_csv(source, chunksize=chunk_rows, dtype=str,
+                               keep_default_na=False, encoding="utf-8-sig")
+
+def _xlsx_chunks(source, chunk_rows: int):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RuntimeError("Para importar archivos .xlsx instala openpyxl (pip install openpyxl).")
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = ["" if h is None else str(h) for h in next(rows, ())]
+        width = len(header)
+        batch = []
+        for row in rows:
+            values = ["" if v is None else str(v) for v in row[:width]]
+            batch.append(values + [""] * (width - len(values)))
+            if len(batch) == chunk_rows:
+                yield pd.DataFrame(batch, columns=header)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        wb.close()
+
+class _Rejects:
+    # Collects (row number, reason) without growing past MAX_REPORTED_REJECTS.
+
+    def __init__(self):
+        self.count = 0
+        self.rows = []
+
+    def add(self, row_numbers, reasons):
+        for row, reason in zip(row_numbers, reasons):
+            self.count += 1
+            if len(self.rows) < MAX_REPORTED_REJECTS:
+                self.rows.append((int(row), reason))
+
+def _validate(chunk: pd.DataFrame, required, ranges, choices=None):
+    # Returns (clean DataFrame of valid rows, reasons Series for rejected rows).
+    # Numbers accept a decimal comma; empty cells become NULL.
+    reasons = pd.Series("", index=chunk.index)
+
+    def reject(mask, message):
+        reasons[mask & (reasons == "")] = message
+
+    clean = pd.DataFrame(index=chunk.index)
+    for col in chunk.columns:
+        clean[col] = chunk[col].str.strip()
+    for col in required:
+        if col not in clean:
+            reject(pd.Series(True, index=chunk.index), f"falta la columna {col}")
+        else:
+            reject(clean[col] == "", f"{col} vacío")
+    for col, (lo, hi) in ranges.items():
+        if col not in clean:
+            continue
+        raw = clean[col]
+        present = raw != ""
+        num = pd.to_numeric(raw.str.replace(",", ".", regex=False), errors="coerce")
+        reject(present & num.isna(), f"{col} no es numérico")
+        reject(present & ((num < lo) | (num > hi)), f"{col} fuera de rango [{lo}, {hi}]")
+        if col in INTEGER_COLUMNS:
+            reject(present & num.notna() & (num % 1 != 0), f"{col} debe ser entero")
+        clean[col] = num
+    for col, allowed in (choices or {}).items():
+        if col in clean:
+            reject((clean[col] != "") & ~clean[col].isin(allowed), f"{col} debe ser uno de {allowed}")
+    rejected = reasons != ""
+    return clean[~rejected], reasons[rejected]
+
+def _column_values(df: pd.DataFrame, fields):
+    # Native Python values (None for NULL) in field order, ready for executemany.
+    columns = []
+    for f in fields:
+        if f not in df:
+            columns.append([None] * len(df))
+            continue
+        col = df[f]
+        if col.dtype == object:
+            col = col.where(col != "", None)
+        elif f in INTEGER_COLUMNS:
+            col = col.astype("Int64")
+        columns.append([None if pd.isna(v) else v for v in col.tolist()])
+    return list(zip(*columns))
+
+def _normalize_columns(chunk: pd.DataFrame) -> pd.DataFrame:
+    chunk.columns = [str(c).strip().lower() for c in chunk.columns]
+    return chunk
+
+def _row_numbers(index, offset: int):
+    # Spreadsheet-style numbers: the header is row 1.
+    return [offset + i + 2 for i in range(len(index))]
+
+def _report(rows: int, inserted: int, rejects: _Rejects) -> dict:
+    return {"rows": rows, "inserted": inserted, "rejected": rejects.count, "rejects": sorted(rejects.rows)}
+
+def import_clients(source, filename: str = None, progress=None) -> dict:
+    # Optional external_id column maps the source system's ids to clients.id
+    # (used by import_measurements). Rows whose external_id was already
+    # imported are rejected, so re-running an import is harmless.
+    rejects = _Rejects()
+    rows = inserted = 0
+    seen_external = set()
+    now = datetime.now().isoformat()
+    for chunk in read_chunks(source, filename):
+        chunk = _normalize_columns(chunk).reset_index(drop=True)
+        numbers = _row_numbers(chunk.index, rows)
+        rows += len(chunk)
+        clean, reasons = _validate(chunk, ["name"], CLIENT_RANGES, CLIENT_CHOICES)
+        rejects.add([numbers[i] for i in reasons.index], reasons.tolist())
+        if clean.empty:
+            if progress:
+                progress(rows)
+            continue
+        if "created_at" in clean:
+            created = pd.to_datetime(clean["created_at"], errors="coerce")
+            clean["created_at"] = [d.isoformat() if not pd.isna(d) else now for d in created]
+        else:
+            clean["created_at"] = now
+
+        external = clean["external_id"].tolist() if "external_id" in clean else [""] * len(clean)
+        keep, dup_rows = [], []
+        for pos, ext in zip(clean.index, external):
+            if ext and ext in seen_external:
+                dup_rows.append(pos)
+            else:
+                keep.append(pos)
+                if ext:
+                    seen_external.add(ext)
+        rejects.add([numbers[i] for i in dup_rows], ["external_id repetido en el archivo"] * len(dup_rows))
+        clean = clean.loc[keep]
+        values = _column_values(clean, db.CLIENT_FIELDS)
+        external = [e or None for e in (clean["external_id"].tolist() if "external_id" in clean else [None] * len(clean))]
+        positions = clean.index.tolist()
+
+        def write(conn, values=values, external=external):
+            ext_ids = [e for e in external if e]
+            existing = set()
+            for i in range(0, len(ext_ids), 500):
+                part = ext_ids[i:i + 500]
+                existing.update(r[0] for r in conn.execute(
+                    _SQL_EXISTING_EXTERNAL_IDS.format(marks=", ".join("?" * len(part))), part
+                ))
+            insert = (f"INSERT INTO clients ({', '.join(db.CLIENT_FIELDS)}) "
+                      f"VALUES ({', '.join('?' * len(db.CLIENT_FIELDS))})")
+            mapping, skipped = [], []
+            for i, (row, ext) in enumerate(zip(values, external)):
+                if ext in existing:
+                    skipped.append(i)
+                    continue
+                client_id = conn.execute(insert, row).lastrowid
+                if ext:
+                    mapping.append((ext, client_id))
+            conn.executemany("INSERT INTO client_external_ids (external_id, client_id) VALUES (?, ?)", mapping)
+            return len(values) - len(skipped), skipped
+
+        n, skipped = db.submit_write(write, invalidates=[("clients",)]).result()
+        inserted += n
+        rejects.add([numbers[positions[i]] for i in skipped], ["external_id ya importado"] * len(skipped))
+        if progress:
+            progress(rows)
+    return _report(rows, inserted, rejects)
+
+def import_measurements(source, filename: str = None, progress=None) -> dict:
+    # Each row names its client with client_external_id (from a clients
+    # import) or client_id. Dates must be parseable (YYYY-MM-DD preferred).
+    rejects = _Rejects()
+    rows = inserted = 0
+    fields = db.MEASUREMENT_FIELDS
+    for chunk in read_chunks(source, filename):
+        chunk = _normalize_columns(chunk).reset_index(drop=True)
+        numbers = _row_numbers(chunk.index, rows)
+        rows += len(chunk)
+        ref = "client_external_id" if "client_external_id" in chunk else "client_id"
+        clean, reasons = _validate(chunk, [ref, "date"], MEASUREMENT_RANGES)
+        rejects.add([numbers[i] for i in reasons.index], reasons.tolist())
+        if clean.empty:
+            if progress:
+                progress(rows)
+            continue
+        dates = pd.to_datetime(clean["date"], errors="coerce", format="mixed")
+        bad_date = dates.isna()
+        rejects.add([numbers[i] for i in clean.index[bad_date]], ["date no es una fecha válida"] * int(bad_date.sum()))
+        clean = clean[~bad_date]
+        clean["date"] = dates[~bad_date].dt.date.map(lambda d: d.isoformat())
+        refs = clean[ref].tolist()
+        values = _column_values(clean.assign(client_id=None), fields)
+        positions = clean.index.tolist()
+
+        def write(conn, refs=refs, values=values):
+            resolved = {}
+            unique = sorted(set(refs))
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                marks = ", ".join("?" * len(part))
+                if ref == "client_external_id":
+                    query = _SQL_RESOLVE_EXTERNAL_IDS.format(marks=marks)
+                else:
+                    query = _SQL_RESOLVE_CLIENT_IDS.format(marks=marks)
+                resolved.update((k, v) for k, v in conn.execute(query, part))
+            rows_out, missing = [], []
+            for i, (key, row) in enumerate(zip(refs, values)):
+                client_id = resolved.get(key)
+                if client_id is None:
+                    missing.append(i)
+                else:
+                    rows_out.append((client_id,) + row[1:])
+            conn.executemany(
+                f"INSERT INTO measurements ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))})",
+                rows_out,
+            )
+            return len(rows_out), missing, {r[0] for r in rows_out}
+
+        n, missing, touched = db.submit_write(write).result()
+        db.invalidate_cache(*[("measurements", cid) for cid in touched])
+        inserted += n
+        rejects.add([numbers[positions[i]] for i in missing], ["cliente no encontrado"] * len(missing))
+        if progress:
+            progress(rows)
+    return _report(rows, inserted, rejects)
+
+def write_rejects(report: dict, path: str):
+    pd.DataFrame(report["rejects"], columns=["fila", "motivo"]).to_csv(path, index=False)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Importa clientes o mediciones desde CSV/XLSX")
+    parser.add_argument("kind", choices=["clients", "measurements"])
+    parser.add_argument("file")
+    parser.add_argument("--rejects", help="CSV donde guardar las filas rechazadas")
+    parser.add_argument("--tenant", default=db.DEFAULT_TENANT, help="gimnasio (por defecto GS_TENANT)")
+    args = parser.parse_args()
+    db.set_tenant(args.tenant)
+
+    db.init_db()
+    run = import_clients if args.kind == "clients" else import_measurements
+    t0 = datetime.now()
+    report = run(args.file, progress=lambda n: print(f"\r{n} filas leídas", end="", flush=True))
+    elapsed = (datetime.now() - t0).total_seconds()
+    print(f"\n{report['inserted']} insertadas, {report['rejected']} rechazadas en {elapsed:.1f} s")
+    if args.rejects and report["rejects"]:
+        write_rejects(report, args.rejects)
+        print(f"Rechazos en {args.rejects}")
+    else:
+        for row, reason in report["rejects"][:20]:
+            print(f"  fila {row}: {reason}")
@@ -0,0 +1,186 @@
+import contextvars
+import importlib
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Background jobs for slow work started from the UI (PDF and ZIP exports,
+# imports, roster recomputation). Jobs run on a small process-wide thread
+# pool, so they outlive the Streamlit rerun that started them and at most
+# JOB_WORKERS of them compete with interactive reruns at any time. The UI
+# keeps job ids in session_state and polls get_job()/list_jobs().
+
+JOB_WORKERS = 2
+MAX_QUEUED = 32      # submit() refuses new jobs beyond this backlog
+MAX_FINISHED = 100   # older finished jobs (and their files) are dropped
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+class Download:
+    # A job's file result: bytes in memory, or a temporary file on disk that
+    # is deleted when the job is dropped from the table.
+
+    def __init__(self, file_name: str, mime: str, data: bytes = None, path: str = None):
+        self.file_name = file_name
+        self.mime = mime
+        self.data = data
+        self.path = path
+
+    def read(self) -> bytes:
+        if self.data is not None:
+            return self.data
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def discard(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+class Job:
+    def __init__(self, job_id: int, label: str):
+        self.id = job_id
+        self.label = label
+        self.status = QUEUED
+        self.done = 0
+        self.total = None
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def report(self, done, total=None, message: str = None):
+        # Called by the job function from its worker thread.
+        self.done = done
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+
+    @property
+    def fraction(self):
+        if not self.total:
+            return None
+        return min(self.done / self.total, 1.0)
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return None
+        return (self.finished or time.time()) - self.started
+
+class JobManager:
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = MAX_QUEUED,
+                 max_finished: int = MAX_FINISHED):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self._jobs = OrderedDict()  # id -> Job, oldest first
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def submit(self, label: str, fn, *args, preload=(), **kwargs) -> int:
+        # Runs fn(job, *args, **kwargs) in the background; its return value
+        # becomes job.result. Returns the job id.
+        # preload: modules fn imports lazily. They are imported here, in the
+        # caller's thread: Streamlit edits sys.path around every script run,
+        # and an import racing with that from a worker thread can miss the
+        # app directory and fail with ModuleNotFoundError.
+        for name in preload:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                pass  # fn hits the same error and the job reports it
+        with self._lock:
+            queued = sum(1 for j in self._jobs.values() if j.status == QUEUED)
+            if queued >= self.max_queued:
+                raise RuntimeError("Hay demasiadas tareas en cola; espera a que terminen.")
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="gs-job")
+            job = Job(next(self._ids), label)
+            self._jobs[job.id] = job
+            # The job runs in the submitting context, so it hits the same
+            # tenant database (db.set_tenant) as the rerun that started it.
+            ctx = contextvars.copy_context()
+            self._pool.submit(ctx.run, self._run, job, fn, args, kwargs)
+        return job.id
+
+    def get(self, job_id: int):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self, ids=None) -> list:
+        # Newest first; ids restricts the list (unknown or dropped ids are skipped).
+        with self._lock:
+            jobs = list(self._jobs.values())
+        if ids is not None:
+            wanted = set(ids)
+            jobs = [j for j in jobs if j.id in wanted]
+        return jobs[::-1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return {"workers": self.workers, **counts}
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+    def _run(self, job: Job, fn, args, kwargs):
+        job.status = RUNNING
+        job.started = time.time()
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = DONE
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = FAILED
+        finally:
+            job.finished = time.time()
+            self._trim()
+
+    def _trim(self):
+        with self._lock:
+            finished = [j for j in self._jobs.values() if not j.active]
+            dropped = finished[:max(len(finished) - self.max_finished, 0)]
+            for job in dropped:
+                del self._jobs[job.id]
+        for job in dropped:
+            if isinstance(job.result, Download):
+                job.result.discard()
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_manager() -> JobManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
+
+def submit(label: str, fn, *args, preload=(), **kwargs) -> int:
+    return get_manager().submit(label, fn, *args, preload=preload, **kwargs)
+
+def get_job(job_id: int):
+    return get_manager().get(job_id)
+
+def list_jobs(ids=None) -> list:
+    return get_manager().list_jobs(ids)
+
+def job_stats() -> dict:
+    return get_manager().stats()
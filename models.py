@@ -0,0 +1,95 @@
+from dataclasses import asdict, dataclass, fields
+
+# Typed rows for single-record reads (db.get_client_by_id, db.latest_*,
+# fetch_client_sheets). Built straight from sqlite3 rows, no pandas; tables
+# that are shown on screen stay DataFrames. Frozen because db's query cache
+# hands the same instance to every session. Field order is the SELECT order
+# produced by columns().
+
+@dataclass(slots=True, frozen=True)
+class Client:
+    id: int
+    name: str
+    sex: str | None
+    age: int | None
+    height_cm: float | None
+    weight_kg: float | None
+    skinfolds: str | None
+    body_fat_pct: float | None
+    muscle_pct: float | None
+    visceral_fat: int | None
+    preferred_foods: str | None
+    meals_per_day: int | None
+    allergies: str | None
+    economic_level: str | None
+    occupation: str | None
+    notes: str | None
+    created_at: str
+
+@dataclass(slots=True, frozen=True)
+class Measurement:
+    id: int
+    client_id: int
+    date: str
+    weight_kg: float | None
+    body_fat_pct: float | None
+    muscle_pct: float | None
+    visceral_fat: int | None
+    waist_cm: float | None
+    hip_cm: float | None
+    chest_cm: float | None
+    thigh_cm: float | None
+    arm_cm: float | None
+    notes: str | None
+
+@dataclass(slots=True, frozen=True)
+class MealPlan:
+    id: int
+    client_id: int
+    date: str
+    calories: int | None
+    protein_g: float | None
+    fats_g: float | None
+    carbs_g: float | None
+    meals_json: str | None
+    objective: str | None
+    notes: str | None
+
+@dataclass(slots=True, frozen=True)
+class MealItem:
+    meal_index: int
+    meal_name: str
+    food: str
+    grams: float
+    protein_g: float
+    fats_g: float
+    carbs_g: float
+    calories: int
+
+@dataclass(slots=True, frozen=True)
+class TrainingPlan:
+    id: int
+    client_id: int
+    date: str
+    goal: str | None
+    split: str | None
+    days_per_week: int | None
+    session_duration_min: int | None
+    cardio_plan: str | None
+    routine_text: str | None
+    notes: str | None
+
+def names(model) -> list:
+    return [f.name for f in fields(model)]
+
+def columns(model, prefix: str = "") -> str:
+    # SELECT list matching model's field order, e.g. columns(Client, "c.").
+    return ", ".join(prefix + name for name in names(model))
+
+def record(model, row):
+    # model instance from a row selected with columns(model); None stays None.
+    return None if row is None else model(*row)
+
+def to_dict(value):
+    # json.dumps(default=...) hook: records as dicts, anything else as text.
+    return asdict(value) if hasattr(value, "__dataclass_fields__") else str(value)
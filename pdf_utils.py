@@ -1,97 +1,425 @@
 
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.graphics.shapes import Drawing, String
+from reportlab.graphics.charts.lineplots import LinePlot
 from reportlab.lib.units import cm
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
-from datetime import datetime
-from db import get_client_by_id, list_meal_plans, list_training_plans
+from reportlab.lib.enums import TA_CENTER
+from datetime import datetime, date
+from db import get_client_by_id, get_measurements, list_meal_plans, list_training_plans, \
+               latest_meal_plan, latest_training_plan, meal_plan_items
+from models import to_dict
+from analytics import TREND_METRICS, measurement_trends, chart_frame
+from collections import OrderedDict
+from functools import lru_cache
+from xml.sax.saxutils import escape
+from io import BytesIO
+import hashlib
+import json
 import os
+import threading
+import perf
 
-def build_client_pdf(client_id: int, include_meal=True, include_train=True) -> str:
-    client = get_client_by_id(client_id)
-    name = client["name"]
+# Rendered sheets, keyed by a hash of everything that ends up on the page.
+PDF_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+class PdfCache:
+    # LRU over PDF bytes, bounded by total size rather than entry count.
+
+    def __init__(self, max_bytes: int = PDF_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            pdf = self._entries.get(key)
+            if pdf is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return pdf
+
+    def put(self, key, pdf: bytes):
+        if len(pdf) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = pdf
+            self._size += len(pdf)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size,
+                    "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+_pdf_cache = PdfCache()
+
+def pdf_cache_stats() -> dict:
+    return _pdf_cache.stats()
+
+def _content_key(*parts) -> str:
+    payload = json.dumps(list(parts), sort_keys=True, default=to_dict)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _cached_pdf(key: str, render) -> bytes:
+    pdf = _pdf_cache.get(key)
+    if pdf is None:
+        pdf = render()
+        _pdf_cache.put(key, pdf)
+    return pdf
+
+def render_client_pdf(client_id: int, include_meal=True, include_train=True) -> bytes:
+    with perf.section("pdf.fetch"):
+        client = get_client_by_id(client_id)
+        meal = latest_meal_plan(client_id) if include_meal else None
+        items = meal_plan_items(meal.id) if meal is not None else []
+        train = latest_training_plan(client_id) if include_train else None
+    # The header prints today's date, so it is part of the content too.
     today = datetime.now().strftime("%Y-%m-%d")
+    key = _content_key("ficha", client, meal, items, train, include_meal, include_train, today)
+
+    def render():
+        with perf.section("pdf.layout"):
+            return render_client_sheet(client, meal, items, train, today)
+    return _cached_pdf(key, render)
 
+def build_client_pdf(client_id: int, include_meal=True, include_train=True) -> str:
     filename = f"FichaCliente_{client_id}.pdf"
-    doc = SimpleDocTemplate(filename, pagesize=A4, leftMargin=2*cm, rightMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
+    pdf = render_client_pdf(client_id, include_meal=include_meal, include_train=include_train)
+    with perf.section("pdf.write"), open(filename, "wb") as f:
+        f.write(pdf)
+    return os.path.abspath(filename)
 
-    styles = getSampleStyleSheet()
-    title_style = styles["Title"]
-    title_style.alignment = TA_CENTER
-    normal = styles["Normal"]
+# ---- Styles ----
+# Built once per process and shared by every document. Shared styles must not
+# be mutated; derive a new ParagraphStyle instead (as "title" does).
 
-    elements = []
-    # Header
-    elements.append(Paragraph(f"Ficha de cliente — {name}", title_style))
-    elements.append(Paragraph(f"Fecha: {today}", normal))
-    elements.append(Spacer(1, 12))
+@lru_cache(maxsize=None)
+def _styles() -> dict:
+    base = getSampleStyleSheet()
+    return {
+        "title": ParagraphStyle("GSTitle", parent=base["Title"], alignment=TA_CENTER),
+        "normal": base["Normal"],
+        "h2": base["Heading2"],
+        "h3": base["Heading3"],
+        "body": ParagraphStyle("GSBody", parent=base["Normal"], fontSize=9, leading=12),
+        "small": ParagraphStyle("GSSmall", parent=base["Normal"], fontSize=8, leading=10, textColor=colors.grey),
+    }
+
+_BOX = [
+    ("BACKGROUND", (0,0), (-1,-1), colors.whitesmoke),
+    ("BOX", (0,0), (-1,-1), 1, colors.grey),
+    ("INNERGRID", (0,0), (-1,-1), 0.5, colors.lightgrey),
+]
+BOX_TABLE_STYLE = TableStyle(_BOX + [("FONTSIZE", (0,0), (-1,-1), 9)])
+CLIENT_TABLE_STYLE = TableStyle(_BOX + [
+    ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
+    ("FONTNAME", (0,0), (-1,-1), "Helvetica"),
+    ("FONTSIZE", (0,0), (-1,-1), 9),
+    ("ROWBACKGROUNDS", (0,0), (-1,-1), [colors.whitesmoke, colors.lightgrey])
+])
+# Header row, numbers right-aligned from the second column on.
+GRID_TABLE_STYLE = TableStyle([
+    ("BACKGROUND", (0,0), (-1,0), colors.lightgrey),
+    ("BACKGROUND", (0,1), (-1,-1), colors.whitesmoke),
+    ("BOX", (0,0), (-1,-1), 1, colors.grey),
+    ("INNERGRID", (0,0), (-1,-1), 0.5, colors.lightgrey),
+    ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
+    ("ALIGN", (1,0), (-1,-1), "RIGHT"),
+    ("FONTSIZE", (0,0), (-1,-1), 9),
+])
+# Same plus a bold total row.
+ITEMS_TABLE_STYLE = TableStyle([("FONTNAME", (0,-1), (-1,-1), "Helvetica-Bold")], parent=GRID_TABLE_STYLE)
+
+def _text(value) -> str:
+    # Free text for a Paragraph: markup-escaped, line breaks kept.
+    return escape(str(value)).replace("\n", "<br/>")
 
+# ---- Shared sections ----
+
+def _client_table(client):
     # Client data box (Carlos Estrada style: cuadros grises)
     data = [
-        ["Sexo", client["sex"] or "-", "Edad", client["age"] or "-"],
-        ["Estatura (cm)", client["height_cm"] or "-", "Peso (kg)", client["weight_kg"] or "-"],
-        ["% Grasa", client["body_fat_pct"] or "-", "% Músculo", client["muscle_pct"] or "-"],
-        ["Grasa visceral", client["visceral_fat"] or "-", "Ingestas/día", client["meals_per_day"] or "-"],
-        ["Alergias", client["allergies"] or "-", "Ocupación", client["occupation"] or "-"],
+        ["Sexo", client.sex or "-", "Edad", client.age or "-"],
+        ["Estatura (cm)", client.height_cm or "-", "Peso (kg)", client.weight_kg or "-"],
+        ["% Grasa", client.body_fat_pct or "-", "% Músculo", client.muscle_pct or "-"],
+        ["Grasa visceral", client.visceral_fat or "-", "Ingestas/día", client.meals_per_day or "-"],
+        ["Alergias", client.allergies or "-", "Ocupación", client.occupation or "-"],
     ]
     tbl = Table(data, colWidths=[4*cm, 5*cm, 4*cm, 5*cm])
-    tbl.setStyle(TableStyle([
-        ("BACKGROUND", (0,0), (-1,-1), colors.whitesmoke),
-        ("BOX", (0,0), (-1,-1), 1, colors.grey),
-        ("INNERGRID", (0,0), (-1,-1), 0.5, colors.lightgrey),
-        ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
-        ("FONTNAME", (0,0), (-1,-1), "Helvetica"),
-        ("FONTSIZE", (0,0), (-1,-1), 9),
-        ("ROWBACKGROUNDS", (0,0), (-1,-1), [colors.whitesmoke, colors.lightgrey])
-    ]))
-    elements.append(tbl)
+    tbl.setStyle(CLIENT_TABLE_STYLE)
+    return tbl
+
+def _meal_item_tables(items):
+    # One small table per meal: foods with grams and macros, plus a total row.
+    tables = []
+    meals = OrderedDict()
+    for item in items:
+        meals.setdefault((item.meal_index, item.meal_name), []).append(item)
+    for (index, name), rows in meals.items():
+        data = [[f"{index + 1}. {name}", "g", "Prot. (g)", "Grasas (g)", "Carbs (g)", "kcal"]]
+        for it in rows:
+            data.append([it.food, f"{it.grams:.0f}", f"{it.protein_g:.1f}",
+                         f"{it.fats_g:.1f}", f"{it.carbs_g:.1f}", it.calories])
+        data.append(["Total", "",
+                     f"{sum(it.protein_g for it in rows):.1f}", f"{sum(it.fats_g for it in rows):.1f}",
+                     f"{sum(it.carbs_g for it in rows):.1f}", sum(it.calories for it in rows)])
+        tbl = Table(data, colWidths=[6*cm, 1.8*cm, 2.4*cm, 2.4*cm, 2.4*cm, 2*cm])
+        tbl.setStyle(ITEMS_TABLE_STYLE)
+        tables += [tbl, Spacer(1, 6)]
+    return tables
+
+def _meal_section(meal, items, full: bool = False):
+    # full: also the GS menu text and the plan notes (progress report).
+    styles = _styles()
+    elements = [Paragraph("Plan de alimentación (último)", styles["h2"])]
+    macros = [
+        ["Calorías", meal.calories, "Proteína (g)", meal.protein_g],
+        ["Grasas (g)", meal.fats_g, "Carbohidratos (g)", meal.carbs_g],
+    ]
+    tmac = Table(macros, colWidths=[4*cm, 5*cm, 4*cm, 5*cm])
+    tmac.setStyle(BOX_TABLE_STYLE)
+    elements += [tmac, Spacer(1, 6), Paragraph("Comidas sugeridas (Preset GS):", styles["h3"])]
+    if items:
+        elements.extend(_meal_item_tables(items))
+    elif not full:
+        # Plans saved before meal items existed only have the generic menu.
+        elements.append(Paragraph("• Desayuno / Comida / Cena — ver panel para detalle por ingredientes.", styles["normal"]))
+    if full:
+        for line in json.loads(meal.meals_json or "[]"):
+            elements.append(Paragraph(f"• {_text(line)}", styles["body"]))
+        if meal.notes:
+            elements += [Spacer(1, 4), Paragraph(f"<b>Notas:</b> {_text(meal.notes)}", styles["body"])]
     elements.append(Spacer(1, 12))
+    return elements
+
+def _training_section(train, full: bool = False):
+    # full: also cardio, the routine text and notes (progress report).
+    styles = _styles()
+    elements = [Paragraph("Plan de entrenamiento (último)", styles["h2"])]
+    ttbl = Table([
+        ["Objetivo", train.goal],
+        ["Split", train.split],
+        ["Días/semana", train.days_per_week],
+        ["Duración sesión (min)", train.session_duration_min],
+    ], colWidths=[6*cm, 10*cm])
+    ttbl.setStyle(BOX_TABLE_STYLE)
+    elements.append(ttbl)
+    if full:
+        for label, col in [("Cardio", "cardio_plan"), ("Rutina", "routine_text"), ("Notas", "notes")]:
+            text = getattr(train, col)
+            if text:
+                elements += [Spacer(1, 6), Paragraph(label, styles["h3"]), Paragraph(_text(text), styles["body"])]
+    return elements
 
-    # Meal plan (last)
-    if include_meal:
-        mdf = list_meal_plans(client_id)
-        if not mdf.empty:
-            last = mdf.iloc[0]
-            elements.append(Paragraph("Plan de alimentación (último)", styles["Heading2"]))
-            macros = [
-                ["Calorías", last["calories"], "Proteína (g)", last["protein_g"]],
-                ["Grasas (g)", last["fats_g"], "Carbohidratos (g)", last["carbs_g"]],
-            ]
-            tmac = Table(macros, colWidths=[4*cm, 5*cm, 4*cm, 5*cm])
-            tmac.setStyle(TableStyle([
-                ("BACKGROUND", (0,0), (-1,-1), colors.whitesmoke),
-                ("BOX", (0,0), (-1,-1), 1, colors.grey),
-                ("INNERGRID", (0,0), (-1,-1), 0.5, colors.lightgrey),
-                ("FONTSIZE", (0,0), (-1,-1), 9),
-            ]))
-            elements.append(tmac)
-            elements.append(Spacer(1, 6))
-            elements.append(Paragraph("Comidas sugeridas (Preset GS):", styles["Heading3"]))
-            # Meals_json is not included here for simplicity; we show note
-            elements.append(Paragraph("• Desayuno / Comida / Cena — ver panel para detalle por ingredientes.", normal))
-            elements.append(Spacer(1, 12))
-
-    # Training plan (last)
-    if include_train:
-        tdf = list_training_plans(client_id)
-        if not tdf.empty:
-            lastt = tdf.iloc[0]
-            elements.append(Paragraph("Plan de entrenamiento (último)", styles["Heading2"]))
-            ttbl = Table([
-                ["Objetivo", lastt["goal"]],
-                ["Split", lastt["split"]],
-                ["Días/semana", lastt["days_per_week"]],
-                ["Duración sesión (min)", lastt["session_duration_min"]],
-            ], colWidths=[6*cm, 10*cm])
-            ttbl.setStyle(TableStyle([
-                ("BACKGROUND", (0,0), (-1,-1), colors.whitesmoke),
-                ("BOX", (0,0), (-1,-1), 1, colors.grey),
-                ("INNERGRID", (0,0), (-1,-1), 0.5, colors.lightgrey),
-                ("FONTSIZE", (0,0), (-1,-1), 9),
-            ]))
-            elements.append(ttbl)
+def render_client_sheet(client, meal, items, train, today: str) -> bytes:
+    # The ficha from records already fetched (Client, MealPlan or None, its
+    # [MealItem], TrainingPlan or None), uncached: bulk_export renders from
+    # db.fetch_client_sheets() in worker processes.
+    styles = _styles()
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=2*cm, rightMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
+
+    elements = []
+    # Header
+    elements.append(Paragraph(f"Ficha de cliente — {_text(client.name)}", styles["title"]))
+    elements.append(Paragraph(f"Fecha: {today}", styles["normal"]))
+    elements.append(Spacer(1, 12))
+    elements.append(_client_table(client))
+    elements.append(Spacer(1, 12))
+
+    if meal is not None:
+        elements.extend(_meal_section(meal, items))
+    if train is not None:
+        elements.extend(_training_section(train))
 
     doc.build(elements)
-    return os.path.abspath(filename)
+    return buffer.getvalue()
+
+# ---- Progress report ----
+# Multi-page report: summary, charts, measurement history and the full
+# latest plans. Histories are bounded: the table lists the most recent
+# REPORT_MAX_TABLE_ROWS measurements in page-sized tables, and charts are
+# LTTB-downsampled to REPORT_CHART_POINTS, so a client with years of weekly
+# measurements builds as fast as one with a few months.
+
+REPORT_MAX_TABLE_ROWS = 120
+REPORT_ROWS_PER_TABLE = 40
+REPORT_CHART_POINTS = 150
+REPORT_PLAN_HISTORY = 12
+REPORT_CHART_METRICS = ["weight_kg", "body_fat_pct", "muscle_pct"]
+_HISTORY_COLUMNS = [
+    ("date", "Fecha", "{}"), ("weight_kg", "Peso", "{:.1f}"), ("body_fat_pct", "% Grasa", "{:.1f}"),
+    ("muscle_pct", "% Músculo", "{:.1f}"), ("visceral_fat", "Visceral", "{:.0f}"),
+    ("waist_cm", "Cintura", "{:.1f}"), ("hip_cm", "Cadera", "{:.1f}"),
+]
+
+def render_progress_report(client_id: int) -> bytes:
+    client = get_client_by_id(client_id)
+    measurements = get_measurements(client_id)  # newest first
+    # The plan histories are printed as tables; the latest plans in full.
+    meal_plans = list_meal_plans(client_id)
+    train_plans = list_training_plans(client_id)
+    meal = latest_meal_plan(client_id)
+    items = meal_plan_items(meal.id) if meal is not None else []
+    train = latest_training_plan(client_id)
+    today = datetime.now().strftime("%Y-%m-%d")
+    key = _content_key("progreso", client, measurements.to_json(orient="values"),
+                       meal, items, train, meal_plans.head(REPORT_PLAN_HISTORY).to_json(orient="values"),
+                       train_plans.head(REPORT_PLAN_HISTORY).to_json(orient="values"), today)
+    return _cached_pdf(key, lambda: _render_progress_report(
+        client, measurements, measurement_trends(client_id), meal, items, train,
+        meal_plans.head(REPORT_PLAN_HISTORY), train_plans.head(REPORT_PLAN_HISTORY), today))
+
+def _page_footer(canvas, doc):
+    canvas.saveState()
+    canvas.setFont("Helvetica", 8)
+    canvas.setFillColor(colors.grey)
+    canvas.drawString(2*cm, 1.2*cm, doc.title)
+    canvas.drawRightString(A4[0] - 2*cm, 1.2*cm, f"Página {doc.page}")
+    canvas.restoreState()
+
+def _fmt(pattern: str, value) -> str:
+    if value is None or (isinstance(value, float) and value != value):
+        return "-"
+    return pattern.format(value)
+
+def _summary_table(trends):
+    # First vs latest value per metric, with the weekly rate since the first visit.
+    rows = [["Métrica", "Primera", "Última", "Cambio", "Cambio/semana"]]
+    for metric, label in TREND_METRICS.items():
+        series = trends.dropna(subset=[metric])
+        if series.empty:
+            continue
+        first, last = series.iloc[0], series.iloc[-1]
+        rows.append([
+            label,
+            f"{first[metric]:.1f} ({first['date']:%d/%m/%y})",
+            f"{last[metric]:.1f} ({last['date']:%d/%m/%y})",
+            _fmt("{:+.1f}", last[f"{metric}_since_first"]),
+            _fmt("{:+.2f}", last[f"{metric}_rate_per_week"]),
+        ])
+    if len(rows) == 1:
+        return None
+    tbl = Table(rows, colWidths=[3.5*cm, 3.8*cm, 3.8*cm, 3*cm, 3*cm])
+    tbl.setStyle(GRID_TABLE_STYLE)
+    return tbl
+
+def _trend_chart(frame) -> Drawing:
+    # frame: chart_frame() output, value and 4-week average indexed by date.
+    x = [d.toordinal() for d in frame.index]
+    lines = []
+    for col in frame.columns:
+        points = [(xi, float(v)) for xi, v in zip(x, frame[col]) if v == v]
+        if points:
+            lines.append(points)
+    drawing = Drawing(17*cm, 5.2*cm)
+    plot = LinePlot()
+    plot.x, plot.y, plot.width, plot.height = 1.2*cm, 0.9*cm, 15.5*cm, 3.8*cm
+    plot.data = lines
+    plot.lines[0].strokeColor = colors.HexColor("#1f5fa8")
+    plot.lines[0].strokeWidth = 1.2
+    plot.lines[1].strokeColor = colors.grey
+    plot.lines[1].strokeDashArray = [3, 2]
+    lo, hi = min(x), max(x)
+    plot.xValueAxis.valueMin, plot.xValueAxis.valueMax = lo, hi
+    plot.xValueAxis.valueSteps = [lo + (hi - lo) * i / 5 for i in range(6)]
+    plot.xValueAxis.labelTextFormat = lambda v: date.fromordinal(int(v)).strftime("%d/%m/%y")
+    plot.xValueAxis.labels.fontSize = 7
+    plot.yValueAxis.labels.fontSize = 7
+    drawing.add(plot)
+    drawing.add(String(1.2*cm, 5*cm, f"— {frame.columns[0]}   - - {frame.columns[1]}",
+                       fontSize=7, fillColor=colors.grey))
+    return drawing
+
+def _history_tables(measurements):
+    # Most recent measurements first, split into page-sized tables: one huge
+    # table makes reportlab's split-across-pages work grow with its length.
+    rows = []
+    for rec in measurements.head(REPORT_MAX_TABLE_ROWS).itertuples(index=False):
+        rows.append([_fmt(fmt, getattr(rec, col)) for col, _, fmt in _HISTORY_COLUMNS])
+    header = [label for _, label, _ in _HISTORY_COLUMNS]
+    tables = []
+    for i in range(0, len(rows), REPORT_ROWS_PER_TABLE):
+        tbl = Table([header] + rows[i:i + REPORT_ROWS_PER_TABLE], repeatRows=1,
+                    colWidths=[2.6*cm] + [2.4*cm] * (len(header) - 1))
+        tbl.setStyle(GRID_TABLE_STYLE)
+        tables.append(tbl)
+    return tables
+
+def _plan_history_tables(meal_plans, train_plans):
+    styles = _styles()
+    elements = []
+    if not meal_plans.empty:
+        rows = [["Fecha", "kcal", "Prot. (g)", "Grasas (g)", "Carbs (g)", "Objetivo"]]
+        for p in meal_plans.itertuples(index=False):
+            rows.append([p.date, p.calories, p.protein_g, p.fats_g, p.carbs_g, p.objective or "-"])
+        tbl = Table(rows, colWidths=[2.6*cm, 2*cm, 2.2*cm, 2.2*cm, 2.2*cm, 5.8*cm])
+        tbl.setStyle(GRID_TABLE_STYLE)
+        elements += [Paragraph("Planes de alimentación", styles["h3"]), tbl, Spacer(1, 8)]
+    if not train_plans.empty:
+        rows = [["Fecha", "Objetivo", "Split", "Días/sem", "Min/sesión"]]
+        for t in train_plans.itertuples(index=False):
+            rows.append([t.date, Paragraph(_text(t.goal or "-"), styles["body"]),
+                         Paragraph(_text(t.split or "-"), styles["body"]), t.days_per_week, t.session_duration_min])
+        tbl = Table(rows, colWidths=[2.6*cm, 5*cm, 5*cm, 2*cm, 2.4*cm])
+        tbl.setStyle(GRID_TABLE_STYLE)
+        elements += [Paragraph("Planes de entrenamiento", styles["h3"]), tbl]
+    return elements
+
+def _render_progress_report(client, measurements, trends, meal, items, train, meal_plans, train_plans,
+                            today: str) -> bytes:
+    styles = _styles()
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=2*cm, rightMargin=2*cm, topMargin=2*cm,
+                            bottomMargin=2*cm, title=f"Reporte de progreso — {client.name}")
+
+    elements = [
+        Paragraph(f"Reporte de progreso — {_text(client.name)}", styles["title"]),
+        Paragraph(f"Fecha: {today}", styles["normal"]),
+        Spacer(1, 12),
+        _client_table(client),
+        Spacer(1, 12),
+        Paragraph("Resumen", styles["h2"]),
+    ]
+    summary = _summary_table(trends)
+    elements.append(summary if summary is not None else Paragraph("Sin mediciones todavía.", styles["normal"]))
+
+    charts = []
+    for metric in REPORT_CHART_METRICS:
+        frame = chart_frame(trends, metric, REPORT_CHART_POINTS) if not trends.empty else None
+        if frame is not None and len(frame) >= 2:
+            charts += [Paragraph(TREND_METRICS[metric], styles["h3"]), _trend_chart(frame)]
+    if charts:
+        elements += [Spacer(1, 12), Paragraph("Evolución", styles["h2"])] + charts
+
+    if not measurements.empty:
+        elements += [Spacer(1, 12), Paragraph("Histórico de mediciones", styles["h2"])]
+        if len(measurements) > REPORT_MAX_TABLE_ROWS:
+            elements.append(Paragraph(
+                f"Se muestran las {REPORT_MAX_TABLE_ROWS} mediciones más recientes de {len(measurements)}.",
+                styles["small"]))
+        for tbl in _history_tables(measurements):
+            elements += [tbl, Spacer(1, 6)]
+
+    if meal is not None:
+        elements += [Spacer(1, 12)] + _meal_section(meal, items, full=True)
+    if train is not None:
+        elements += _training_section(train, full=True) + [Spacer(1, 12)]
+    if not meal_plans.empty or not train_plans.empty:
+        elements += [Paragraph("Historial de planes", styles["h2"])] + _plan_history_tables(meal_plans, train_plans)
+
+    doc.build(elements, onFirstPage=_page_footer, onLaterPages=_page_footer)
+    return buffer.getvalue()
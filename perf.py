@@ -0,0 +1,384 @@
+import hmac
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+# Startup / rerun timing for app.py. This module is imported once per process
+# and survives Streamlit reruns, so it can keep numbers across them.
+#
+# With GS_PERF=1 it also instruments the hot paths: every SQL statement run
+# through db.get_conn() connections (text, parameter count, rows, duration),
+# named sections (PDF phases, app.py page parts), a slow-query log and
+# Prometheus counters/histograms, written to GS_METRICS_FILE and/or served on
+# GS_METRICS_PORT. Disabled, connections are plain sqlite3 ones and
+# section()/mark() return immediately.
+
+MAX_RUNS = 500
+
+ENABLED = os.environ.get("GS_PERF", "") not in ("", "0")
+SLOW_QUERY_MS = float(os.environ.get("GS_SLOW_QUERY_MS", "100"))
+SLOW_LOG = os.environ.get("GS_SLOW_LOG", "slow_queries.log")
+METRICS_FILE = os.environ.get("GS_METRICS_FILE")
+METRICS_PORT = int(os.environ.get("GS_METRICS_PORT") or 0)
+# app.py shows the profiling panel (SQL text and timings) when opened with
+# ?perf=<PANEL_TOKEN>. There is no default: without GS_PERF_TOKEN the panel is off.
+PANEL_TOKEN = os.environ.get("GS_PERF_TOKEN") or None
+METRICS_INTERVAL_S = 10
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+MAX_QUERY_LABELS = 200   # distinct statements tracked; the rest count as "other"
+MAX_RERUN_QUERIES = 500  # statements kept per rerun for the admin panel
+RECENT_RERUNS = 50
+RECENT_SLOW = 100
+RECENT_WRITE_WAITS = 10000
+
+_lock = threading.Lock()
+_runs = deque(maxlen=MAX_RUNS)
+_cold_start_s = None
+
+def rerun_started() -> float:
+    if ENABLED:
+        _local.rerun = {"marks": [], "sections": [], "queries": [], "last": time.perf_counter()}
+        _start_metrics_server()
+    return time.perf_counter()
+
+def rerun_finished(started: float, page: str):
+    global _cold_start_s
+    elapsed = time.perf_counter() - started
+    with _lock:
+        if _cold_start_s is None:
+            # First script run of the process: includes importing db/pandas etc.
+            _cold_start_s = elapsed
+        else:
+            _runs.append((page, elapsed))
+    if ENABLED:
+        rerun = getattr(_local, "rerun", None)
+        if rerun is not None:
+            _local.rerun = None
+            with _lock:
+                _histogram("gs_rerun_duration_seconds", {"page": page}, elapsed)
+                _recent_reruns.append(dict(rerun, page=page, seconds=elapsed, finished=time.time()))
+        _maybe_write_metrics()
+
+def panel_allowed(token) -> bool:
+    # token: the ?perf= query parameter.
+    return bool(PANEL_TOKEN) and isinstance(token, str) and hmac.compare_digest(token.encode(), PANEL_TOKEN.encode())
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+def report() -> dict:
+    with _lock:
+        runs = list(_runs)
+        cold = _cold_start_s
+    out = {
+        "cold_start_ms": round(cold * 1000, 1) if cold is not None else None,
+        "reruns": len(runs),
+        "reportlab_loaded": "reportlab" in sys.modules,
+    }
+    if runs:
+        times = [t for _, t in runs]
+        out["rerun_last_ms"] = round(times[-1] * 1000, 1)
+        out["rerun_p50_ms"] = round(percentile(times, 50) * 1000, 1)
+        out["rerun_p95_ms"] = round(percentile(times, 95) * 1000, 1)
+        by_page = {}
+        for page, t in runs:
+            by_page.setdefault(page, []).append(t)
+        out["rerun_p50_ms_by_page"] = {
+            page: round(percentile(ts, 50) * 1000, 1) for page, ts in by_page.items()
+        }
+    return out
+
+# ---- Instrumentation (GS_PERF=1) ----
+
+_local = threading.local()          # .rerun: marks and queries of this thread's script run
+_recent_reruns = deque(maxlen=RECENT_RERUNS)
+_slow = deque(maxlen=RECENT_SLOW)
+_write_waits = deque(maxlen=RECENT_WRITE_WAITS)
+_histograms = {}                    # (name, labels) -> [bucket counts..., +Inf, sum]
+_counters = {}                      # (name, labels) -> value
+_query_labels = set()
+_metrics_written = 0.0
+_server_started = False
+_NULL = nullcontext()
+
+def _histogram(name: str, labels: dict, seconds: float):
+    key = (name, tuple(sorted(labels.items())))
+    h = _histograms.get(key)
+    if h is None:
+        h = _histograms[key] = [0] * (len(BUCKETS) + 2)
+    for i, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+            h[i] += 1
+    h[-2] += 1
+    h[-1] += seconds
+
+def _count(name: str, labels: dict, value=1):
+    key = (name, tuple(sorted(labels.items())))
+    _counters[key] = _counters.get(key, 0) + value
+
+def mark(name: str):
+    # Closes a part of the current rerun: time since the previous mark (or
+    # the start of the script) is booked under name.
+    if not ENABLED:
+        return
+    rerun = getattr(_local, "rerun", None)
+    if rerun is None:
+        return
+    now = time.perf_counter()
+    rerun["marks"].append((name, now - rerun["last"]))
+    rerun["last"] = now
+
+class _Section:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        with _lock:
+            _histogram("gs_section_duration_seconds", {"section": self.name}, elapsed)
+        rerun = getattr(_local, "rerun", None)
+        if rerun is not None:
+            rerun["sections"].append((self.name, elapsed))
+        return False
+
+def section(name: str):
+    # with perf.section("pdf.layout"): ... -- a no-op unless enabled.
+    return _Section(name) if ENABLED else _NULL
+
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+def _label(sql: str) -> str:
+    # Stable metric label: whitespace collapsed, IN (?, ?, ...) lists folded.
+    text = _IN_LIST.sub("(?, ...)", _SPACES.sub(" ", sql).strip())[:160]
+    if text in _query_labels:
+        return text
+    if len(_query_labels) < MAX_QUERY_LABELS:
+        _query_labels.add(text)
+        return text
+    return "other"
+
+def record_query(sql: str, n_params: int, rows: int, seconds: float):
+    with _lock:
+        label = _label(sql)
+        _histogram("gs_query_duration_seconds", {"query": label}, seconds)
+        _count("gs_query_rows_total", {"query": label}, max(rows, 0))
+        slow = seconds * 1000 >= SLOW_QUERY_MS
+        if slow:
+            _count("gs_slow_queries_total", {})
+    entry = {"sql": label, "params": n_params, "rows": rows, "ms": round(seconds * 1000, 3)}
+    rerun = getattr(_local, "rerun", None)
+    if rerun is not None and len(rerun["queries"]) < MAX_RERUN_QUERIES:
+        rerun["queries"].append(entry)
+    if slow:
+        entry = dict(entry, ts=time.strftime("%Y-%m-%dT%H:%M:%S"), thread=threading.current_thread().name)
+        with _lock:
+            _slow.append(entry)
+        if SLOW_LOG:
+            with open(SLOW_LOG, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+def record_write_waits(queued, lock_seconds: float):
+    # From db's writer, per batch: how long each job sat in the queue and how
+    # long BEGIN IMMEDIATE waited for SQLite's write lock.
+    with _lock:
+        for seconds in queued:
+            _histogram("gs_write_queue_wait_seconds", {}, seconds)
+            _write_waits.append(("queue", seconds))
+        _histogram("gs_write_lock_wait_seconds", {}, lock_seconds)
+        _write_waits.append(("lock", lock_seconds))
+
+def write_waits() -> list:
+    # [("queue" | "lock", seconds)], oldest first.
+    with _lock:
+        return list(_write_waits)
+
+class TimedCursor(sqlite3.Cursor):
+    # Times execute plus every fetch until the result is consumed (or the
+    # cursor is reused, closed or collected), then records one query.
+    _pending = None
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            try:
+                rows = pending[3] if pending[3] or self.description else self.rowcount
+            except sqlite3.ProgrammingError:  # closed cursor or connection
+                rows = pending[3]
+            record_query(pending[0], pending[1], rows, pending[2])
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            if self._pending is not None:
+                self._pending[2] += time.perf_counter() - start
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._pending = [sql, len(parameters), time.perf_counter() - start, 0]
+            if self.description is None:  # no result rows to fetch
+                self._finish()
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        seq = list(seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq)
+        finally:
+            self._pending = [sql, len(seq[0]) if seq else 0, time.perf_counter() - start, 0]
+            self._finish()
+
+    def fetchone(self):
+        row = self._timed(sqlite3.Cursor.fetchone)
+        if self._pending is not None:
+            self._pending[3] += row is not None
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(sqlite3.Cursor.fetchmany, self.arraysize if size is None else size)
+        if self._pending is not None:
+            self._pending[3] += len(rows)
+            if not rows:
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(sqlite3.Cursor.fetchall)
+        if self._pending is not None:
+            self._pending[3] += len(rows)
+            self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._timed(sqlite3.Cursor.__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        if self._pending is not None:
+            self._pending[3] += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+class TimedConnection(sqlite3.Connection):
+    # Connection.execute() goes through cursor(), so it is covered too.
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+def connection_factory():
+    # For sqlite3.connect(factory=...): the plain Connection when disabled.
+    return TimedConnection if ENABLED else sqlite3.Connection
+
+def reruns() -> list:
+    # Recent reruns, newest first: page, seconds, marks and sections
+    # [(name, s)], queries [{sql, params, rows, ms}].
+    with _lock:
+        return list(_recent_reruns)[::-1]
+
+def slow_queries() -> list:
+    with _lock:
+        return list(_slow)[::-1]
+
+def prometheus_text() -> str:
+    def fmt(labels):
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+    lines = []
+    with _lock:
+        histograms = {k: list(v) for k, v in _histograms.items()}
+        counters = dict(_counters)
+    for name in sorted({k[0] for k in histograms}):
+        lines.append(f"# TYPE {name} histogram")
+        for (n, labels), h in sorted(histograms.items()):
+            if n != name:
+                continue
+            for bound, count in zip(BUCKETS, h):
+                lines.append(f"{name}_bucket{fmt(labels + (('le', str(bound)),))} {count}")
+            lines.append(f"{name}_bucket{fmt(labels + (('le', '+Inf'),))} {h[-2]}")
+            lines.append(f"{name}_count{fmt(labels)} {h[-2]}")
+            lines.append(f"{name}_sum{fmt(labels)} {h[-1]:.6f}")
+    for name in sorted({k[0] for k in counters}):
+        lines.append(f"# TYPE {name} counter")
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f"{name}{fmt(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+def write_metrics(path: str = None) -> str:
+    path = path or METRICS_FILE
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+    return path
+
+def _maybe_write_metrics():
+    global _metrics_written
+    if not METRICS_FILE:
+        return
+    now = time.monotonic()
+    if now - _metrics_written >= METRICS_INTERVAL_S:
+        _metrics_written = now
+        write_metrics()
+
+def _start_metrics_server():
+    # GET /metrics on GS_METRICS_PORT, from a daemon thread of this process.
+    global _server_started
+    if not METRICS_PORT or _server_started:
+        return
+    with _lock:
+        if _server_started:
+            return
+        _server_started = True
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = prometheus_text().encode() if self.path.rstrip("/") == "/metrics" else b""
+            self.send_response(200 if body else 404)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", METRICS_PORT), Handler)
+    threading.Thread(target=server.serve_forever, name="gs-metrics", daemon=True).start()
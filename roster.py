@@ -0,0 +1,37 @@
+from datetime import datetime
+import pandas as pd
+from db import add_meal_plans_bulk, roster_frame
+from gs_preset import GS_MACRO_SPLIT, build_gs_meal_plan_batch, gs_meals, mifflin_st_jeor_batch
+
+# Roster-wide plan recomputation: one vectorized pass over every client and
+# one transaction for the resulting meal_plans rows.
+
+def compute_roster_meal_plans(clients: pd.DataFrame, activity="moderado", objective="recomposición",
+                              split=GS_MACRO_SPLIT, date: str = None) -> pd.DataFrame:
+    # clients: id, sex, age, height_cm, weight_kg, meals_per_day. activity and
+    # objective may be scalars or per-client columns. Clients without
+    # weight, height or age are skipped.
+    complete = clients[["weight_kg", "height_cm", "age"]].notna().all(axis=1).to_numpy()
+    clients = clients[complete]
+    activity = pd.Series(activity, index=complete.nonzero()[0]) if pd.api.types.is_scalar(activity) \
+        else pd.Series(activity)[complete]
+    objective = pd.Series(objective, index=activity.index) if pd.api.types.is_scalar(objective) \
+        else pd.Series(objective)[complete]
+
+    _, tdee = mifflin_st_jeor_batch(clients["weight_kg"], clients["height_cm"], clients["age"],
+                                    clients["sex"].fillna(""), activity.to_numpy())
+    plans = build_gs_meal_plan_batch(tdee, objective.to_numpy(), split=split)
+    meals_per_day = clients["meals_per_day"].fillna(3).astype("int64").replace(0, 3)
+    meals_json = {n: pd.Series(gs_meals(int(n))).to_json(orient="values") for n in meals_per_day.unique()}
+    plans.insert(0, "client_id", clients["id"].to_numpy())
+    plans.insert(1, "date", date or datetime.now().date().isoformat())
+    plans["meals_json"] = meals_per_day.map(meals_json).to_numpy()
+    plans["objective"] = objective.to_numpy()
+    plans["notes"] = [f"Objetivo: {o}. Preset GS (recálculo de roster)." for o in objective]
+    return plans
+
+def recompute_roster_meal_plans(activity="moderado", objective="recomposición", split=GS_MACRO_SPLIT) -> int:
+    plans = compute_roster_meal_plans(roster_frame(), activity, objective, split)
+    if plans.empty:
+        return 0
+    return add_meal_plans_bulk(plans).result()
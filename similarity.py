@@ -0,0 +1,244 @@
+import threading
+import warnings
+import numpy as np
+import pandas as pd
+import db
+
+# "Similar clients" for the Planes page: past clients that looked like this
+# one when they started, with the plan they were on and what it did for them.
+#
+# Each client is a row of a float32 matrix of z-scored, weighted features
+# (sex, age, height, weight, body fat, muscle, visceral fat and a one-hot of
+# the plan objective). Candidates are described as they started (first
+# measurement); the client being planned as they are now (last one). With a
+# dozen dimensions a BLAS matrix-vector product over the whole roster takes
+# about a millisecond at 100k clients, so no tree is needed.
+#
+# One index per database file, built on first use. Every query first reads
+# change_log past the index's cursor and re-fetches only the clients whose
+# rows, measurements or meal plans changed since, so it keeps up with writes
+# from the app, imports and tablet sync without rebuilding. The
+# normalization stats are refreshed by a full rebuild once REBUILD_FRACTION
+# of the rows have changed.
+
+SIMILAR_K = 5
+REBUILD_FRACTION = 0.2
+NUMERIC_FEATURES = ["sex", "age", "height_cm", "weight_kg", "body_fat_pct", "muscle_pct", "visceral_fat"]
+OBJECTIVES = ["pérdida de grasa", "ganancia de masa", "mantenimiento", "recomposición"]
+# Relative importance in the distance; objective dominates so neighbors
+# followed the same kind of plan.
+FEATURE_WEIGHTS = {"sex": 1.5, "age": 0.7, "height_cm": 0.7, "weight_kg": 1.0, "body_fat_pct": 1.2,
+                   "muscle_pct": 0.8, "visceral_fat": 0.6, "objective": 2.0}
+_SEX = {"M": 1.0, "F": 0.0}
+
+def _features_sql(state: str) -> str:
+    # state: "first" (candidates, as they started) or "last" (now). The
+    # last column says whether the client can be a neighbor: a meal plan and
+    # PROGRESS_MIN_DAYS of measurements to judge it by.
+    return (
+        "SELECT c.id, c.sex, c.age, c.height_cm, "
+        f"COALESCE(s.{state}_weight_kg, c.weight_kg), COALESCE(s.{state}_body_fat_pct, c.body_fat_pct), "
+        "c.muscle_pct, c.visceral_fat, s.plan_objective, "
+        "s.plan_calories IS NOT NULL AND julianday(s.last_date) - julianday(s.first_date) >= ? "
+        "FROM clients c LEFT JOIN client_summary s ON s.client_id = c.id"
+    )
+
+_SQL_FEATURES = _features_sql("first")
+_SQL_CURRENT_FEATURES = _features_sql("last") + " WHERE c.id = ?"
+# Walks only the log entries past the cursor (a rowid range) and resolves each
+# to its client by primary key, so a refresh costs the number of changes, not
+# the size of the history. NULL: a training plan, or a row deleted since.
+_SQL_CHANGED_CLIENTS = (
+    "SELECT CASE l.tbl WHEN 'clients' THEN l.row_id "
+    "WHEN 'measurements' THEN (SELECT client_id FROM measurements WHERE id = l.row_id) "
+    "WHEN 'meal_plans' THEN (SELECT client_id FROM meal_plans WHERE id = l.row_id) END "
+    "FROM change_log l WHERE l.seq > ?"
+)
+_SQL_NEIGHBOR_DETAILS = (
+    "SELECT c.id, c.name, c.sex, c.age, s.first_weight_kg AS weight_kg, "
+    "s.first_body_fat_pct AS body_fat_pct, s.plan_objective AS objective, "
+    "m.calories, m.protein_g, m.fats_g, m.carbs_g, "
+    "(julianday(s.last_date) - julianday(s.first_date)) / 7 AS weeks, "
+    "(s.first_body_fat_pct - s.last_body_fat_pct) / "
+    f"((julianday(s.last_date) - julianday(s.first_date)) / {db._DAYS_PER_MONTH}) AS fat_loss_pct_month, "
+    "(s.last_weight_kg - s.first_weight_kg) / "
+    f"((julianday(s.last_date) - julianday(s.first_date)) / {db._DAYS_PER_MONTH}) AS weight_change_kg_month "
+    "FROM clients c JOIN client_summary s ON s.client_id = c.id "
+    "LEFT JOIN meal_plans m ON m.id = "
+    "(SELECT id FROM meal_plans WHERE client_id = c.id ORDER BY date DESC, id DESC LIMIT 1) "
+    "WHERE c.id IN ({marks})"
+)
+
+_SQL_LAST_SEQ = "SELECT COALESCE(MAX(seq), 0) FROM change_log"
+
+db.register_read_query("similarity.features", _SQL_FEATURES, (db.PROGRESS_MIN_DAYS,), db.WHOLE_TABLE)
+db.register_read_query("similarity.features(ids)", f"{_SQL_FEATURES} WHERE c.id IN (?, ?)",
+                       (db.PROGRESS_MIN_DAYS, 1, 2))
+db.register_read_query("similarity.current_features", _SQL_CURRENT_FEATURES, (db.PROGRESS_MIN_DAYS, 1))
+db.register_read_query("similarity.changed_clients", _SQL_CHANGED_CLIENTS, (0,))
+db.register_read_query("similarity.last_seq", _SQL_LAST_SEQ)
+db.register_read_query("similarity.neighbor_details", _SQL_NEIGHBOR_DETAILS.format(marks="?, ?"), (1, 2))
+
+def _encode(rows) -> tuple:
+    # Feature rows from _features_sql -> (ids, raw matrix with NaN for
+    # missing values, candidate mask).
+    n = len(rows)
+    ids = np.fromiter((r[0] for r in rows), dtype="int64", count=n)
+    raw = np.full((n, len(NUMERIC_FEATURES) + len(OBJECTIVES)), np.nan, dtype="float32")
+    candidate = np.zeros(n, dtype=bool)
+    for i, r in enumerate(rows):
+        raw[i, 0] = _SEX.get(r[1], 0.5)
+        raw[i, 1:len(NUMERIC_FEATURES)] = [np.nan if v is None else v for v in r[2:8]]
+        raw[i, len(NUMERIC_FEATURES):] = [float(r[8] == o) for o in OBJECTIVES]
+        candidate[i] = bool(r[9])
+    return ids, raw, candidate
+
+class SimilarityIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._built = False
+
+    def _read(self, query: str, params=()) -> list:
+        with db.use_database(self.path), db.pooled_conn() as conn:
+            cur = conn.cursor()
+            cur.row_factory = None
+            return cur.execute(query, params).fetchall()
+
+    def _build(self):
+        # Cursor first: changes committed while reading are picked up by the
+        # next refresh (re-fetching a row twice is harmless).
+        self._cursor = self._read(_SQL_LAST_SEQ)[0][0]
+        ids, raw, candidate = _encode(self._read(_SQL_FEATURES, (db.PROGRESS_MIN_DAYS,)))
+        numeric = raw[:, :len(NUMERIC_FEATURES)]
+        with warnings.catch_warnings():  # all-NaN columns on an empty roster
+            warnings.simplefilter("ignore", RuntimeWarning)
+            self._mean = np.nan_to_num(np.nanmean(numeric, axis=0)) if len(ids) else np.zeros(numeric.shape[1])
+            std = np.nanstd(numeric, axis=0) if len(ids) else np.ones(numeric.shape[1])
+        self._std = np.where(np.nan_to_num(std) > 1e-6, std, 1.0).astype("float32")
+        self._weights = np.array([FEATURE_WEIGHTS[f] for f in NUMERIC_FEATURES]
+                                 + [FEATURE_WEIGHTS["objective"]] * len(OBJECTIVES), dtype="float32")
+        self._size = len(ids)
+        capacity = max(64, 2 * len(ids))
+        self._ids = np.full(capacity, -1, dtype="int64")
+        self._matrix = np.zeros((capacity, raw.shape[1]), dtype="float32")
+        self._norms = np.zeros(capacity, dtype="float32")
+        self._candidate = np.zeros(capacity, dtype=bool)
+        self._row = {}
+        self._store(np.arange(len(ids)), ids, raw, candidate)
+        self._changed = 0
+        self._built = True
+
+    def _normalize(self, raw):
+        z = raw.copy()
+        n = len(NUMERIC_FEATURES)
+        z[:, :n] = np.nan_to_num((raw[:, :n] - self._mean) / self._std)  # missing -> the mean
+        return z * self._weights
+
+    def _store(self, rows, ids, raw, candidate):
+        vectors = self._normalize(raw)
+        self._ids[rows] = ids
+        self._matrix[rows] = vectors
+        self._norms[rows] = np.einsum("ij,ij->i", vectors, vectors)
+        self._candidate[rows] = candidate
+        self._row.update(zip(ids.tolist(), rows.tolist()))
+
+    def _refresh(self):
+        top = self._read(_SQL_LAST_SEQ)[0][0]
+        if top == self._cursor:
+            return
+        changed = list({r[0] for r in self._read(_SQL_CHANGED_CLIENTS, (self._cursor,)) if r[0] is not None})
+        self._changed += len(changed)
+        if self._changed > REBUILD_FRACTION * max(self._size, 1):
+            self._build()
+            return
+        self._cursor = top
+        rows = []
+        for start in range(0, len(changed), 500):
+            chunk = changed[start:start + 500]
+            marks = ", ".join("?" * len(chunk))
+            rows += self._read(f"{_SQL_FEATURES} WHERE c.id IN ({marks})", (db.PROGRESS_MIN_DAYS, *chunk))
+        for gone in set(changed) - {r[0] for r in rows}:  # deleted clients
+            row = self._row.pop(gone, None)
+            if row is not None:
+                self._candidate[row] = False
+        if not rows:
+            return
+        ids, raw, candidate = _encode(rows)
+        slots = []
+        for client_id in ids.tolist():
+            row = self._row.get(client_id)
+            if row is None:
+                if self._size == len(self._ids):
+                    self._grow()
+                row = self._size
+                self._size += 1
+            slots.append(row)
+        self._store(np.array(slots), ids, raw, candidate)
+
+    def _grow(self):
+        capacity = 2 * len(self._ids)
+        self._ids = np.concatenate([self._ids, np.full(capacity - len(self._ids), -1, dtype="int64")])
+        self._matrix = np.concatenate([self._matrix, np.zeros_like(self._matrix)])
+        self._norms = np.concatenate([self._norms, np.zeros_like(self._norms)])
+        self._candidate = np.concatenate([self._candidate, np.zeros_like(self._candidate)])
+
+    def query(self, client_id: int, k: int = SIMILAR_K) -> list:
+        # [(client id, distance)], nearest first, never client_id itself.
+        with self._lock:
+            if not self._built:
+                self._build()
+            else:
+                self._refresh()
+            rows = self._read(_SQL_CURRENT_FEATURES, (db.PROGRESS_MIN_DAYS, client_id))
+            if not rows:
+                return []
+            q = self._normalize(_encode(rows)[1])[0]
+            n = self._size
+            # |x - q|^2 = |x|^2 - 2 x.q + |q|^2, one matrix-vector product.
+            d2 = self._norms[:n] - 2 * (self._matrix[:n] @ q) + q @ q
+            d2[~self._candidate[:n]] = np.inf
+            self_row = self._row.get(client_id)
+            if self_row is not None:
+                d2[self_row] = np.inf
+            k = min(k, int(np.isfinite(d2).sum()))
+            if k <= 0:
+                return []
+            top = np.argpartition(d2, k - 1)[:k]
+            top = top[np.argsort(d2[top])]
+            return [(int(self._ids[i]), float(np.sqrt(max(d2[i], 0.0)))) for i in top]
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_index(path: str = None) -> SimilarityIndex:
+    path = path or db.current_path()
+    index = _indexes.get(path)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.setdefault(path, SimilarityIndex(path))
+    return index
+
+def similar_clients(client_id: int, k: int = SIMILAR_K) -> pd.DataFrame:
+    # The k nearest proven clients, nearest first: how they started, their
+    # latest meal plan (kcal, macros and kcal per kg) and its outcome per month.
+    neighbors = get_index().query(client_id, k)
+    if not neighbors:
+        return pd.DataFrame()
+    ids = [i for i, _ in neighbors]
+    with db.pooled_conn() as conn:
+        df = pd.read_sql_query(_SQL_NEIGHBOR_DETAILS.format(marks=", ".join("?" * len(ids))), conn,
+                               params=ids)
+    # Nearest first; a neighbor deleted since query() has no row and is dropped.
+    df = df.set_index("id").reindex(ids)
+    df.insert(0, "distance", [d for _, d in neighbors])
+    df = df.dropna(subset=["name"]).reset_index()
+    df["kcal_per_kg"] = df["calories"] / df["weight_kg"]
+    return df
+
+def suggested_calories(similar: pd.DataFrame, weight_kg: float):
+    # Median kcal per kg of the neighbors' plans, scaled to this client.
+    if similar.empty or not weight_kg:
+        return None
+    per_kg = similar["kcal_per_kg"].dropna()
+    return None if per_kg.empty else float(per_kg.median() * weight_kg)
@@ -0,0 +1,352 @@
+import json
+import os
+import sqlite3
+import uuid
+from contextlib import nullcontext
+from datetime import date, datetime
+import db
+from importer import MEASUREMENT_RANGES
+
+# Delta sync for tablets that capture measurements offline.
+#
+# Pull: the tablet sends the cursor of its last sync and gets back only the
+# rows changed since then (db.changes_since, driven by the change_log
+# triggers), one page at a time.
+# Push: the tablet sends measurements captured offline, each with an
+# idempotency key. The first result of a key is stored in sync_receipts and
+# replayed if the same key arrives again (e.g. the response was lost on bad
+# Wi-Fi), so a retry never creates a second row.
+#
+# handle() is the transport-independent entry point; `python sync.py serve`
+# exposes it over HTTP and TabletClient simulates a tablet against it.
+
+MAX_PUSH_ITEMS = 500
+MAX_PULL_ROWS = 2000
+
+# Push statuses. A conflict is a different measurement already stored for
+# the same client and date; it is not stored unless pushed again with a new
+# key and "force": true (the coach confirmed both are real).
+CREATED, DUPLICATE, CONFLICT, REJECTED = "created", "duplicate", "conflict", "rejected"
+
+_SQL_RECEIPT = "SELECT status, measurement_id, detail FROM sync_receipts WHERE key = ?"
+_SQL_CLIENT_EXISTS = "SELECT 1 FROM clients WHERE id = ?"
+_SQL_INSERT_RECEIPT = (
+    "INSERT INTO sync_receipts (key, device_id, status, measurement_id, detail, received_at) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+db.register_read_query("sync.receipt", _SQL_RECEIPT, ("key",))
+db.register_read_query("sync.client_exists", _SQL_CLIENT_EXISTS, (1,))
+
+def _check(item: dict):
+    # Returns (values in MEASUREMENT_FIELDS order, None) or (None, reason).
+    try:
+        client_id = int(item.get("client_id"))
+    except (TypeError, ValueError):
+        return None, "client_id no es válido"
+    try:
+        day = date.fromisoformat(str(item.get("date"))).isoformat()
+    except ValueError:
+        return None, "date no es una fecha válida"
+    values = {"client_id": client_id, "date": day, "notes": item.get("notes") or None}
+    for col, (lo, hi) in MEASUREMENT_RANGES.items():
+        v = item.get(col)
+        if v is None or v == "":
+            values[col] = None
+            continue
+        try:
+            v = float(v)
+        except (TypeError, ValueError):
+            return None, f"{col} no es numérico"
+        if not lo <= v <= hi:
+            return None, f"{col} fuera de rango [{lo}, {hi}]"
+        values[col] = int(v) if col == "visceral_fat" else v
+    return [values.get(f) for f in db.MEASUREMENT_FIELDS], None
+
+def _apply(conn, item: dict):
+    # (status, measurement_id, detail) for one pushed item, inside the job.
+    values, reason = _check(item)
+    if reason:
+        return REJECTED, None, reason
+    client_id, day = values[0], values[1]
+    if conn.execute(_SQL_CLIENT_EXISTS, (client_id,)).fetchone() is None:
+        return REJECTED, None, "cliente no encontrado"
+    same_day = db.same_day_measurements(conn, client_id, day)
+    for row in same_day:
+        if list(row)[1:] == values:
+            return DUPLICATE, row["id"], None
+    if same_day and not item.get("force"):
+        return CONFLICT, same_day[0]["id"], "ya hay otra medición de ese día"
+    cur = conn.execute(
+        f"INSERT INTO measurements ({', '.join(db.MEASUREMENT_FIELDS)}) "
+        f"VALUES ({', '.join('?' * len(db.MEASUREMENT_FIELDS))})",
+        values,
+    )
+    return CREATED, cur.lastrowid, None
+
+def push_measurements(device_id: str, items) -> list:
+    # One result per item, in order: {"key", "status", "id", "detail"}, plus
+    # "replayed": true when the key was already processed.
+    items = list(items)
+    if len(items) > MAX_PUSH_ITEMS:
+        raise ValueError(f"Máximo {MAX_PUSH_ITEMS} mediciones por envío.")
+    received_at = datetime.now().isoformat(timespec="seconds")
+
+    def write(conn):
+        results, touched = [], set()
+        for item in items:
+            if not isinstance(item, dict):
+                results.append({"key": None, "status": REJECTED, "id": None, "detail": "no es un objeto"})
+                continue
+            key = str(item.get("key") or "")
+            if not key:
+                results.append({"key": None, "status": REJECTED, "id": None, "detail": "falta key"})
+                continue
+            prior = conn.execute(_SQL_RECEIPT, (key,)).fetchone()
+            if prior is not None:
+                results.append({"key": key, "status": prior["status"], "id": prior["measurement_id"],
+                                "detail": prior["detail"], "replayed": True})
+                continue
+            status, measurement_id, detail = _apply(conn, item)
+            conn.execute(_SQL_INSERT_RECEIPT, (key, device_id, status, measurement_id, detail, received_at))
+            if status == CREATED:
+                touched.add(item["client_id"])
+            results.append({"key": key, "status": status, "id": measurement_id, "detail": detail})
+        return results, touched
+
+    results, touched = db.submit_write(write).result()
+    db.invalidate_cache(*[("measurements", int(cid)) for cid in touched])
+    return results
+
+def _int_param(payload: dict, key: str, default: int) -> int:
+    value = payload.get(key)
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"{key} debe ser un entero.")
+    return value
+
+def handle(endpoint: str, payload: dict) -> dict:
+    # payload: {"tenant"?: str, "cursor"/"limit" (pull), "device_id"/"items" (push)}.
+    if not isinstance(payload, dict):
+        raise ValueError("El cuerpo debe ser un objeto JSON.")
+    with db.use_tenant(payload["tenant"]) if payload.get("tenant") else nullcontext():
+        if endpoint == "pull":
+            # Clamped on both sides: SQLite reads LIMIT <= 0 as "no limit".
+            limit = max(1, min(_int_param(payload, "limit", db.SYNC_PAGE_ROWS), MAX_PULL_ROWS))
+            return db.changes_since(max(0, _int_param(payload, "cursor", 0)), limit)
+        if endpoint == "push":
+            return {"results": push_measurements(str(payload.get("device_id") or ""), payload.get("items") or [])}
+    raise ValueError(f"Operación desconocida: {endpoint}")
+
+# ---- Tablet simulator ----
+
+class SyncOffline(ConnectionError):
+    pass
+
+class LocalTransport:
+    # Calls handle() in-process through a JSON round trip, like the wire would.
+    # offline: every call fails; lose_responses: the server processes the
+    # call but the answer never arrives (the tablet must retry).
+    def __init__(self, tenant: str = None):
+        self.tenant = tenant
+        self.offline = False
+        self.lose_responses = False
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def __call__(self, endpoint: str, payload: dict) -> dict:
+        if self.offline:
+            raise SyncOffline("sin conexión")
+        body = json.dumps(dict(payload, tenant=self.tenant))
+        self.bytes_sent += len(body)
+        answer = json.dumps(handle(endpoint, json.loads(body)))
+        if self.lose_responses:
+            raise SyncOffline("respuesta perdida")
+        self.bytes_received += len(answer)
+        return json.loads(answer)
+
+class HttpTransport:
+    def __init__(self, url: str, token: str = None, tenant: str = None, timeout: float = 30):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.tenant = tenant
+        self.timeout = timeout
+
+    def __call__(self, endpoint: str, payload: dict) -> dict:
+        from urllib.error import HTTPError, URLError
+        from urllib.request import Request, urlopen
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        body = json.dumps(dict(payload, tenant=self.tenant)).encode()
+        try:
+            with urlopen(Request(f"{self.url}/sync/{endpoint}", body, headers), timeout=self.timeout) as r:
+                return json.loads(r.read())
+        except HTTPError as e:
+            # The server answered: retrying won't help.
+            raise RuntimeError(f"Sincronización rechazada ({e.code}): {e.read().decode(errors='replace')}") from e
+        except (URLError, OSError) as e:
+            raise SyncOffline(str(e)) from e
+
+class TabletClient:
+    # Local stand-in for the tablet app: a replica of the synced tables, the
+    # pull cursor and an outbox of measurements captured offline, all in its
+    # own SQLite file so they survive restarts.
+    def __init__(self, transport, path: str = ":memory:", device_id: str = None, push_batch: int = 100):
+        self.transport = transport
+        self.push_batch = push_batch
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS replica (
+                tbl TEXT NOT NULL, row_id INTEGER NOT NULL, data TEXT NOT NULL,
+                PRIMARY KEY (tbl, row_id)
+            );
+            CREATE TABLE IF NOT EXISTS outbox (key TEXT PRIMARY KEY, item TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, status TEXT, id INTEGER, detail TEXT);
+        """)
+        self.device_id = device_id or self._meta("device_id") or uuid.uuid4().hex
+        self._set_meta("device_id", self.device_id)
+        self.conn.commit()
+
+    def _meta(self, key: str):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    @property
+    def cursor(self) -> int:
+        return int(self._meta("cursor") or 0)
+
+    def capture_measurement(self, client_id: int, date: str, force: bool = False, **values) -> str:
+        # Stores the measurement locally; returns its idempotency key.
+        key = uuid.uuid4().hex
+        item = dict(values, key=key, client_id=client_id, date=date, force=force)
+        with self.conn:
+            self.conn.execute("INSERT INTO outbox (key, item) VALUES (?, ?)", (key, json.dumps(item)))
+        return key
+
+    def pending(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def rows(self, table: str) -> list:
+        return [json.loads(d) for (d,) in self.conn.execute(
+            "SELECT data FROM replica WHERE tbl = ? ORDER BY row_id", (table,))]
+
+    def result(self, key: str):
+        row = self.conn.execute("SELECT status, id, detail FROM results WHERE key = ?", (key,)).fetchone()
+        return dict(zip(("status", "id", "detail"), row)) if row else None
+
+    def sync(self) -> dict:
+        # Push the outbox, then pull everything changed since the cursor.
+        # Raises SyncOffline if the connection drops; whatever was
+        # acknowledged so far is kept and the rest is retried next time.
+        stats = {"pushed": 0, "pulled": 0, "deleted": 0, "pages": 0}
+        while True:
+            batch = self.conn.execute("SELECT key, item FROM outbox ORDER BY rowid LIMIT ?",
+                                      (self.push_batch,)).fetchall()
+            if not batch:
+                break
+            answer = self.transport("push", {"device_id": self.device_id,
+                                             "items": [json.loads(item) for _, item in batch]})
+            with self.conn:
+                for res in answer["results"]:
+                    self.conn.execute("INSERT OR REPLACE INTO results (key, status, id, detail) VALUES (?, ?, ?, ?)",
+                                      (res["key"], res["status"], res["id"], res["detail"]))
+                self.conn.executemany("DELETE FROM outbox WHERE key = ?", [(k,) for k, _ in batch])
+            stats["pushed"] += len(batch)
+        more = True
+        while more:
+            page = self.transport("pull", {"cursor": self.cursor})
+            with self.conn:
+                for table, rows in page["rows"].items():
+                    self.conn.executemany("INSERT OR REPLACE INTO replica (tbl, row_id, data) VALUES (?, ?, ?)",
+                                          [(table, r["id"], json.dumps(r)) for r in rows])
+                    stats["pulled"] += len(rows)
+                for table, ids in page["deleted"].items():
+                    self.conn.executemany("DELETE FROM replica WHERE tbl = ? AND row_id = ?",
+                                          [(table, i) for i in ids])
+                    stats["deleted"] += len(ids)
+                self._set_meta("cursor", page["cursor"])
+            stats["pages"] += 1
+            more = page["more"]
+        return stats
+
+# ---- HTTP ----
+
+def serve(host: str = "127.0.0.1", port: int = 8765, token: str = None):
+    # POST /sync/pull and /sync/push with a JSON body. Each request runs in
+    # its own thread (and context), so tenants never mix.
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if token and self.headers.get("Authorization") != f"Bearer {token}":
+                return self._send(401, {"error": "no autorizado"})
+            endpoint = self.path.rstrip("/").rsplit("/", 1)[-1]
+            if not self.path.startswith("/sync/") or endpoint not in ("pull", "push"):
+                return self._send(404, {"error": "no encontrado"})
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                self._send(200, handle(endpoint, payload))
+            except (ValueError, KeyError, TypeError) as e:
+                self._send(400, {"error": str(e)})
+            except Exception as e:
+                # Database or writer failure: answer instead of dropping the
+                # connection, so the tablet sees an error and retries later.
+                self.log_error("/sync/%s: %s: %s", endpoint, type(e).__name__, e)
+                self._send(500, {"error": "error interno del servidor"})
+
+        def _send(self, code: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"Sincronización en http://{host}:{port}/sync/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sincronización de tabletas (mediciones sin conexión)")
+    parser.add_argument("command", choices=["serve", "simulate"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--token", default=os.environ.get("GS_SYNC_TOKEN"),
+                        help="token compartido (Authorization: Bearer); por defecto GS_SYNC_TOKEN")
+    parser.add_argument("--tenant", default=db.DEFAULT_TENANT, help="gimnasio (por defecto GS_TENANT)")
+    parser.add_argument("--url", help="simulate: servidor HTTP (si no, en proceso)")
+    parser.add_argument("--state", default=":memory:", help="simulate: archivo local de la tableta")
+    parser.add_argument("--measurements", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.host, args.port, args.token)
+    else:
+        db.set_tenant(args.tenant)
+        transport = (HttpTransport(args.url, args.token, args.tenant) if args.url
+                     else LocalTransport(args.tenant))
+        tablet = TabletClient(transport, args.state)
+        print("Sincronización inicial:", tablet.sync())
+        clients = tablet.rows("clients")
+        if not clients:
+            raise SystemExit("No hay clientes para simular mediciones.")
+        today = date.today().isoformat()
+        for i in range(args.measurements):
+            c = clients[i % len(clients)]
+            tablet.capture_measurement(c["id"], today, weight_kg=round((c["weight_kg"] or 70) - 0.1 * i, 1))
+        print(f"Capturadas sin conexión: {tablet.pending()}")
+        print("Sincronización:", tablet.sync())
+        print("Resultados:", dict(tablet.conn.execute("SELECT status, COUNT(*) FROM results GROUP BY status")))
+        print(f"Cursor {tablet.cursor}; {len(tablet.rows('measurements'))} mediciones en la tableta")